@@ -0,0 +1,54 @@
+"""
+Workload and throughput reports for /api/analytics/*
+
+Reports read the order_rollups table only: one row per (metric, day,
+language pair, customer) that triggers on orders keep current, so a report
+is a range scan over the requested days whatever the size of the history.
+"""
+from datetime import date
+
+from sqlalchemy import BigInteger, Date, cast, func, select
+
+from models import OrderRollup
+
+PERIODS = ("day", "week", "month")
+# group_by names and the rollup columns they split rows by
+GROUPINGS = {
+    "lang_pair": (OrderRollup.source_lang, OrderRollup.target_lang),
+    "customer": (OrderRollup.customer_name,),
+}
+GROUP_BY_PATTERN = "^((lang_pair|customer)(,(lang_pair|customer))?)?$"
+
+
+def parse_group_by(group_by: str) -> list[str]:
+    return list(dict.fromkeys(name for name in group_by.split(",") if name))
+
+
+def rollup_report(
+    session,
+    metric: str,
+    start: date,
+    end: date,
+    period: str = "day",
+    group_by: list[str] = (),
+    customer: str | None = None,
+) -> list[dict]:
+    """Orders and words for `metric` on days in [start, end), summed per
+    period (weeks start on Monday) and per group_by column"""
+    bucket = OrderRollup.day if period == "day" else cast(func.date_trunc(period, OrderRollup.day), Date)
+    keys = [bucket.label("period")]
+    for name in group_by:
+        keys.extend(GROUPINGS[name])
+    query = (
+        select(
+            *keys,
+            cast(func.sum(OrderRollup.order_count), BigInteger).label("orders"),
+            cast(func.sum(OrderRollup.word_count), BigInteger).label("words"),
+        )
+        .where(OrderRollup.metric == metric, OrderRollup.day >= start, OrderRollup.day < end)
+        .group_by(*keys)
+        .order_by(*keys)
+    )
+    if customer:
+        query = query.where(OrderRollup.customer_name == customer)
+    return [row._asdict() for row in session.execute(query)]
@@ -0,0 +1,177 @@
+"""
+Inbound Telegram updates for the bot's webhook mode
+
+Telegram POSTs each update to /bot/webhook with the secret token given to
+setWebhook in X-Telegram-Bot-Api-Secret-Token. The API checks it, stores the
+update in bot_updates and answers right away, so Telegram never waits on bot
+logic. The table is the bounded queue between the two: beyond
+BOT_UPDATE_QUEUE_SIZE waiting updates the webhook answers 503 and Telegram
+retries later, and a redelivered update_id is stored once. Triggers keep the
+number waiting in bot_update_count, whose row the webhook holds locked from
+the check to the commit, so concurrent deliveries cannot overshoot the bound.
+
+Bot workers lease updates with POST /api/bot/updates/claim and delete them
+with /ack, like reminders. Only the oldest update of a chat can be leased, so
+a chat's updates are handled one at a time and in order, while other chats go
+to other workers. An update whose lease ran out, or that a worker gave back,
+is claimable again; after BOT_UPDATE_MAX_ATTEMPTS it is dropped.
+
+A claim with nothing to hand out waits up to wait_seconds for the next update
+instead of returning empty: the webhook NOTIFYs `bot_updates` through
+pg_listener, which wakes the waiting claims on every API worker.
+"""
+import asyncio
+import hmac
+import logging
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, literal_column, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from models import BotUpdate, BotUpdateCount
+
+WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET") or None
+BOT_UPDATE_QUEUE_SIZE = int(os.getenv("BOT_UPDATE_QUEUE_SIZE", "1000"))
+BOT_UPDATE_MAX_ATTEMPTS = int(os.getenv("BOT_UPDATE_MAX_ATTEMPTS", "5"))
+BOT_UPDATES_CHANNEL = "bot_updates"
+# waiting claims re-check this often in case a notification was missed
+CLAIM_POLL_SECONDS = 5.0
+
+# where the chat id of each update type we handle lives; updates without a
+# chat (inline queries) are ordered per sender instead
+CHAT_PATHS = {
+    "message": ("chat", "id"),
+    "edited_message": ("chat", "id"),
+    "callback_query": ("message", "chat", "id"),
+    "inline_query": ("from", "id"),
+    "chosen_inline_result": ("from", "id"),
+}
+SENDER_PATH = ("from", "id")
+
+
+def webhook_authorized(token: str | None) -> bool:
+    return WEBHOOK_SECRET is not None and token is not None and hmac.compare_digest(token.encode(), WEBHOOK_SECRET.encode())
+
+
+def update_chat_id(update: dict) -> int:
+    """The chat an update belongs to, for per-chat ordering; 0 when it has none"""
+    for kind, path in CHAT_PATHS.items():
+        body = update.get(kind)
+        if not isinstance(body, dict):
+            continue
+        for candidate in (path, SENDER_PATH):
+            value = body
+            for key in candidate:
+                value = value.get(key) if isinstance(value, dict) else None
+            if isinstance(value, int):
+                return value
+    return 0
+
+
+class UpdateArrivals:
+    """Wakes the claims waiting in this process when an update arrives"""
+
+    def __init__(self):
+        self._event = asyncio.Event()
+
+    def notify(self, payload: str | None = None):
+        # a fresh Event per arrival: every claim waiting now wakes up, later
+        # ones wait for the next arrival
+        event, self._event = self._event, asyncio.Event()
+        event.set()
+
+    async def wait(self, timeout: float):
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+update_arrivals = UpdateArrivals()
+
+
+def enqueue_update(session, update: dict) -> bool | None:
+    """Store one update; False if it was already stored, None if the queue is full"""
+    waiting = session.scalar(select(BotUpdateCount.waiting).with_for_update())
+    if waiting >= BOT_UPDATE_QUEUE_SIZE:
+        session.rollback()
+        return None
+    stored = session.scalar(
+        pg_insert(BotUpdate)
+        .values(update_id=update["update_id"], chat_id=update_chat_id(update), payload=update,
+                received_at=datetime.utcnow())
+        .on_conflict_do_nothing(index_elements=[BotUpdate.update_id])
+        .returning(BotUpdate.update_id)
+    )
+    if stored is not None:
+        # delivered on commit, to the claims waiting on every API worker
+        session.execute(select(func.pg_notify(BOT_UPDATES_CHANNEL, literal_column("''"))))
+    session.commit()
+    return stored is not None
+
+
+def claim_updates(session, worker_id: str, limit: int, lease_seconds: int) -> list:
+    """Lease the oldest update of up to `limit` chats that have none leased"""
+    now = datetime.utcnow()
+    expired = or_(BotUpdate.claim_expires_at.is_(None), BotUpdate.claim_expires_at < now)
+    dropped = session.scalars(
+        delete(BotUpdate)
+        .where(BotUpdate.attempts >= BOT_UPDATE_MAX_ATTEMPTS, expired)
+        .returning(BotUpdate.update_id)
+    ).all()
+    if dropped:
+        logging.warning(f"bot updates: dropped {dropped} after {BOT_UPDATE_MAX_ATTEMPTS} attempts")
+    heads = (
+        select(BotUpdate.update_id, BotUpdate.claim_expires_at)
+        .distinct(BotUpdate.chat_id)
+        .order_by(BotUpdate.chat_id, BotUpdate.update_id)
+        .subquery("heads")
+    )
+    ready = (
+        select(heads.c.update_id)
+        .where(or_(heads.c.claim_expires_at.is_(None), heads.c.claim_expires_at < now))
+        .order_by(heads.c.update_id)
+        .limit(limit)
+    )
+    # a head another claim is leasing right now is skipped, not waited for
+    leasable = (
+        select(BotUpdate.update_id)
+        .where(BotUpdate.update_id.in_(ready), expired)
+        .with_for_update(skip_locked=True)
+        .cte("leasable")
+    )
+    rows = session.execute(
+        update(BotUpdate)
+        .where(BotUpdate.update_id == leasable.c.update_id)
+        .values(claimed_by=worker_id, claim_expires_at=now + timedelta(seconds=lease_seconds),
+                attempts=BotUpdate.attempts + 1)
+        .returning(BotUpdate.update_id, BotUpdate.payload, BotUpdate.attempts, BotUpdate.claim_expires_at),
+        execution_options={"synchronize_session": False},
+    ).all()
+    session.commit()
+    return sorted(rows, key=lambda row: row.update_id)
+
+
+def settle_updates(session, worker_id: str, processed: list[int], failed: list[int]) -> tuple[list[int], list[int]]:
+    """Delete processed updates and release failed ones; only leases `worker_id` holds"""
+    held_by_worker = BotUpdate.claimed_by == worker_id
+    done = []
+    if processed:
+        done = session.scalars(
+            delete(BotUpdate).where(BotUpdate.update_id.in_(processed), held_by_worker).returning(BotUpdate.update_id)
+        ).all()
+    released = []
+    if failed:
+        released = session.scalars(
+            update(BotUpdate)
+            .where(BotUpdate.update_id.in_(failed), held_by_worker)
+            .values(claimed_by=None, claim_expires_at=None)
+            .returning(BotUpdate.update_id),
+            execution_options={"synchronize_session": False},
+        ).all()
+    if done or released:
+        # the chats' next updates are claimable now
+        session.execute(select(func.pg_notify(BOT_UPDATES_CHANNEL, literal_column("''"))))
+    session.commit()
+    return sorted(done), sorted(released)
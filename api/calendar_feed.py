@@ -0,0 +1,188 @@
+"""
+Incrementally maintained iCalendar feed for /calendar/ics
+
+Each undelivered order is rendered to its VEVENT bytes once and kept in
+memory. A poll only asks the database what changed since the last poll
+(orders past the (change_xid, id) mark, tombstones past the (change_xid,
+order_id) mark, both commit-safe, see order_sync) and re-renders just those
+events, so the cost of a poll follows the number of writes, not the size of
+the orders table. Filtered
+sub-feeds are assembled from the cached events and kept with their ETag
+and Last-Modified until the next change.
+
+Last-Modified comes from the data, not from when a process rendered it: the
+newest updated_at or deleted_at among the writes the feed has taken in, so
+every API worker that has caught up answers with the same date. It moves on
+any change to the feed, also outside a filtered sub-feed. HTTP dates are
+whole seconds and updated_at is when the writing transaction started, so
+If-Modified-Since can miss a write that committed late; the ETag is exact.
+"""
+import asyncio
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date, datetime
+
+from icalendar import Calendar, Event
+from sqlalchemy import func, literal_column, select
+
+from models import Order, OrderTombstone
+from order_sync import SETTLED_XID, settled_since
+
+# number of distinct filter combinations whose rendered body is kept
+FEED_CACHE_SIZE = 64
+# Last-Modified while there was never an order
+NEVER_MODIFIED = datetime(1970, 1, 1)
+
+
+@dataclass
+class CachedEvent:
+    customer_name: str
+    lang_pair: str
+    deadline: date
+    ical: bytes
+
+
+@dataclass
+class RenderedFeed:
+    version: int
+    body: bytes
+    etag: str
+    last_modified: datetime
+
+
+def render_event(order: Order) -> bytes:
+    event = Event()
+    event.add('summary', f"#{order.id} {order.customer_name} {order.source_lang}→{order.target_lang}")
+    event.add('dtstart', order.deadline_at.date())
+    event.add('dtend', order.deadline_at.date())
+    event.add('description', f"Topic: {order.topic or 'N/A'}\\nWords: {order.word_count or 'N/A'}")
+    event.add('uid', f"tmorder-{order.id}@localhost")
+    return event.to_ical()
+
+
+def _calendar_frame() -> tuple[bytes, bytes]:
+    cal = Calendar()
+    cal.add('prodid', '-//TM-Order Calendar//EN')
+    cal.add('version', '2.0')
+    cal.add('x-wr-calname', 'Translation Deadlines')
+    footer = b"END:VCALENDAR\r\n"
+    return cal.to_ical()[:-len(footer)], footer
+
+
+class CalendarFeed:
+    def __init__(self, cache_size: int = FEED_CACHE_SIZE):
+        self.header, self.footer = _calendar_frame()
+        self.cache_size = cache_size
+        self._events: dict[int, CachedEvent] = {}
+        self._update_mark: tuple[int, int] | None = None
+        self._delete_mark: tuple[int, int] | None = None
+        self._loaded = False
+        # newest updated_at / deleted_at taken in, for Last-Modified
+        self._last_change: datetime | None = None
+        # bumped whenever an event is added, changed or dropped
+        self._version = 0
+        self._feeds: OrderedDict[tuple, RenderedFeed] = OrderedDict()
+        self._lock = asyncio.Lock()
+
+    def _changed(self, when: datetime | None):
+        if when is not None and (self._last_change is None or when > self._last_change):
+            self._last_change = when
+            self._version += 1
+
+    def _store(self, order: Order):
+        self._changed(order.updated_at)
+        if order.status == "delivered":
+            self._drop(order.id)
+            return
+        self._events[order.id] = CachedEvent(
+            customer_name=order.customer_name,
+            lang_pair=f"{order.source_lang}-{order.target_lang}",
+            deadline=order.deadline_at.date(),
+            ical=render_event(order),
+        )
+        self._version += 1
+
+    def _drop(self, order_id: int):
+        if self._events.pop(order_id, None) is not None:
+            self._version += 1
+
+    def _load(self, session):
+        """First poll: render every undelivered order and take both marks
+
+        Writes of transactions below `settled` are all in the load; the marks
+        start just before it, so the next poll re-reads anything newer that
+        the load may or may not have seen.
+        """
+        settled = session.scalar(select(SETTLED_XID))
+        self._events.clear()
+        for order in session.query(Order).filter(Order.status != literal_column("'delivered'")).all():
+            self._store(order)
+        # delivered and deleted orders changed the feed too
+        self._last_change = None
+        self._changed(session.scalar(select(func.greatest(
+            select(func.max(Order.updated_at)).where(Order.change_xid < settled).scalar_subquery(),
+            select(func.max(OrderTombstone.deleted_at)).where(OrderTombstone.change_xid < settled).scalar_subquery(),
+        ))))
+        self._update_mark = self._delete_mark = (settled, 0)
+        self._loaded = True
+        self._version += 1
+
+    def _apply_changes(self, session):
+        """Later polls: re-render only orders written or deleted since the marks"""
+        changed = (
+            session.query(Order)
+            .filter(settled_since(Order.change_xid, Order.id, self._update_mark))
+            .order_by(Order.change_xid, Order.id)
+        )
+        for order in changed.all():
+            self._store(order)
+            self._update_mark = (order.change_xid, order.id)
+
+        tombstones = (
+            session.query(OrderTombstone)
+            .filter(settled_since(OrderTombstone.change_xid, OrderTombstone.order_id, self._delete_mark))
+            .order_by(OrderTombstone.change_xid, OrderTombstone.order_id)
+        )
+        for tombstone in tombstones.all():
+            self._changed(tombstone.deleted_at)
+            self._drop(tombstone.order_id)
+            self._delete_mark = (tombstone.change_xid, tombstone.order_id)
+
+    def refresh(self, session):
+        if self._loaded:
+            self._apply_changes(session)
+        else:
+            self._load(session)
+
+    async def sync(self, db):
+        """Bring the event cache up to date; concurrent polls share one refresh"""
+        async with self._lock:
+            await db.run(self.refresh)
+
+    def render(self, customer: str | None = None, lang_pair: str | None = None, until: date | None = None) -> RenderedFeed:
+        """Return the (possibly cached) feed body for one filter combination"""
+        key = (customer, lang_pair, until)
+        feed = self._feeds.get(key)
+        if feed and feed.version == self._version:
+            self._feeds.move_to_end(key)
+            return feed
+
+        events = [
+            event.ical for _, event in sorted(self._events.items())
+            if (customer is None or event.customer_name == customer)
+            and (lang_pair is None or event.lang_pair == lang_pair)
+            and (until is None or event.deadline <= until)
+        ]
+        body = b"".join([self.header, *events, self.footer])
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        last_modified = (self._last_change or NEVER_MODIFIED).replace(microsecond=0)
+        feed = RenderedFeed(version=self._version, body=body, etag=etag, last_modified=last_modified)
+        self._feeds[key] = feed
+        self._feeds.move_to_end(key)
+        while len(self._feeds) > self.cache_size:
+            self._feeds.popitem(last=False)
+        return feed
+
+
+calendar_feed = CalendarFeed()
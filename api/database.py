@@ -0,0 +1,212 @@
+"""
+Database engine and request-scoped sessions
+
+DB_MODE picks the driver for the request path:
+  async - SQLAlchemy asyncio on asyncpg (default). asyncpg prepares every
+          statement server-side and keeps DB_STATEMENT_CACHE_SIZE of them per
+          connection, so the hot list/reminder queries skip re-planning.
+  sync  - psycopg2 with blocking sessions run in the threadpool (the old
+          behaviour, kept for comparison under the same load).
+Handlers never touch the session directly; they hand a function to
+`await db.run(fn, ...)`, which calls fn(session, ...) the right way for the
+configured mode.
+
+Pools are per process. With API_WORKERS processes each opens up to
+DB_POOL_SIZE + DB_MAX_OVERFLOW connections per database; DB_MAX_CONNECTIONS,
+if set, caps what all workers together open to one database and shrinks each
+worker's pool to fit.
+
+DATABASE_REPLICA_URL optionally points read-only endpoints (get_read_db) at
+a streaming replica. Writes always use the primary, and so does every read
+from a client that wrote within the last REPLICA_PIN_SECONDS: write responses
+set a short-lived cookie (PrimaryPinMiddleware) that pins its reads.
+"""
+import os
+import time
+from contextlib import asynccontextmanager
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+
+from metrics import POOL_WAIT, instrument_engine
+from profiling import watch_engine
+
+DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://tmorder:change_me_in_production@db:5432/tmorder")
+DB_MODE = os.getenv("DB_MODE", "async").lower()
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+API_WORKERS = int(os.getenv("API_WORKERS", "1"))
+MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "0"))
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL") or None
+REPLICA_PIN_SECONDS = int(os.getenv("REPLICA_PIN_SECONDS", "5"))
+REPLICA_CONFIGURED = DATABASE_REPLICA_URL is not None
+PIN_COOKIE = "tmorder_primary"
+
+if DB_MODE not in ("sync", "async"):
+    raise ValueError(f"DB_MODE must be 'sync' or 'async', got {DB_MODE!r}")
+ASYNC_MODE = DB_MODE == "async"
+
+if MAX_CONNECTIONS:
+    # one connection per worker is kept for pg_listener
+    per_worker = max(1, MAX_CONNECTIONS // API_WORKERS - 1)
+    POOL_SIZE = min(POOL_SIZE, per_worker)
+    MAX_OVERFLOW = min(MAX_OVERFLOW, per_worker - POOL_SIZE)
+
+POOL_OPTIONS = dict(
+    pool_size=POOL_SIZE,
+    max_overflow=MAX_OVERFLOW,
+    pool_timeout=POOL_TIMEOUT,
+    pool_recycle=POOL_RECYCLE,
+    pool_pre_ping=True,
+)
+
+
+def driver_url(url: str, driver: str):
+    """DATABASE_URL with its driver swapped, e.g. postgresql:// -> postgresql+asyncpg://"""
+    return make_url(url).set(drivername=f"postgresql+{driver}")
+
+
+def make_engine(url: str):
+    if ASYNC_MODE:
+        return create_async_engine(
+            driver_url(url, "asyncpg"),
+            connect_args={"prepared_statement_cache_size": STATEMENT_CACHE_SIZE},
+            **POOL_OPTIONS,
+        )
+    return create_engine(driver_url(url, "psycopg2"), **POOL_OPTIONS)
+
+
+def make_sessionmaker(bind):
+    if ASYNC_MODE:
+        return async_sessionmaker(bind, autoflush=False, expire_on_commit=False)
+    return sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=bind)
+
+
+engine = make_engine(DATABASE_URL)
+SessionLocal = make_sessionmaker(engine)
+replica_engine = make_engine(DATABASE_REPLICA_URL) if REPLICA_CONFIGURED else None
+ReplicaSessionLocal = make_sessionmaker(replica_engine) if REPLICA_CONFIGURED else None
+instrument_engine(engine, "primary", POOL_SIZE + MAX_OVERFLOW)
+watch_engine(engine, "primary")
+if REPLICA_CONFIGURED:
+    instrument_engine(replica_engine, "replica", POOL_SIZE + MAX_OVERFLOW)
+    watch_engine(replica_engine, "replica")
+
+# bytes of WAL the replica has applied; NULL (None) when it is not a standby
+REPLAYED_LSN = text("SELECT pg_last_wal_replay_lsn() - '0/0'")
+
+
+class Database:
+    """Request-scoped session wrapper used by every handler"""
+
+    def __init__(self, session, replica: bool = False):
+        self.session = session
+        self.replica = replica
+
+    async def checkout(self):
+        """Take a pooled connection for the session now, if it holds none, and
+        record the wait in db_pool_checkout_wait_seconds"""
+        if self.session.in_transaction():
+            return
+        start = time.perf_counter()
+        if ASYNC_MODE:
+            await self.session.connection()
+        else:
+            await run_in_threadpool(self.session.connection)
+        POOL_WAIT.labels("replica" if self.replica else "primary").observe(time.perf_counter() - start)
+
+    async def run(self, fn, *args, **kwargs):
+        """Call fn(session, *args, **kwargs) without blocking the event loop"""
+        await self.checkout()
+        if ASYNC_MODE:
+            return await self.session.run_sync(fn, *args, **kwargs)
+        return await run_in_threadpool(fn, self.session, *args, **kwargs)
+
+    async def run_replayed(self, fn, *args, **kwargs) -> tuple[int | None, object]:
+        """run(), also returning how far the replica had replayed before fn's
+        queries (None on the primary), for order_cache.put()"""
+        def replayed(session):
+            lsn = session.execute(REPLAYED_LSN).scalar() if self.replica else None
+            return (int(lsn) if lsn is not None else None), fn(session, *args, **kwargs)
+        return await self.run(replayed)
+
+    async def stream(self, statement, batch_size: int = 1000):
+        """Yield the rows of a Core select in batches from a server-side cursor"""
+        statement = statement.execution_options(yield_per=batch_size)
+        await self.checkout()
+        if ASYNC_MODE:
+            result = await self.session.stream(statement)
+            async for rows in result.partitions():
+                yield rows
+            return
+        result = await run_in_threadpool(self.session.execute, statement)
+        try:
+            while rows := await run_in_threadpool(result.fetchmany, batch_size):
+                yield rows
+        finally:
+            await run_in_threadpool(result.close)
+
+
+@asynccontextmanager
+async def database_session(replica: bool = False):
+    """Database for work outside a request (startup jobs, scripts)"""
+    replica = replica and REPLICA_CONFIGURED
+    factory = ReplicaSessionLocal if replica else SessionLocal
+    if ASYNC_MODE:
+        async with factory() as session:
+            yield Database(session, replica)
+    else:
+        session = factory()
+        try:
+            yield Database(session, replica)
+        finally:
+            await run_in_threadpool(session.close)
+
+
+async def get_db():
+    async with database_session() as db:
+        yield db
+
+
+async def get_read_db(request: Request):
+    """Database for read-only endpoints: the replica, unless this client just wrote"""
+    async with database_session(replica=PIN_COOKIE not in request.cookies) as db:
+        yield db
+
+
+class PrimaryPinMiddleware:
+    """Set the read-your-writes cookie on successful non-GET responses"""
+
+    SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+    def __init__(self, app):
+        self.app = app
+        self.cookie = f"{PIN_COOKIE}=1; Max-Age={REPLICA_PIN_SECONDS}; Path=/; HttpOnly; SameSite=Lax".encode()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in self.SAFE_METHODS:
+            return await self.app(scope, receive, send)
+
+        async def send_with_pin(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                message["headers"] = [*message.get("headers", []), (b"set-cookie", self.cookie)]
+            await send(message)
+
+        await self.app(scope, receive, send_with_pin)
+
+
+async def dispose_engine():
+    for bind in (engine, replica_engine):
+        if bind is None:
+            continue
+        if ASYNC_MODE:
+            await bind.dispose()
+        else:
+            bind.dispose()
@@ -0,0 +1,135 @@
+"""
+In-process order event bus feeding the /api/orders/stream SSE endpoint
+
+Handlers publish inside the transaction that makes the change, and the event
+goes out when it commits; subscribers are asyncio queues drained by the
+streaming response. The last BUFFER_SIZE events are kept so a
+client reconnecting with Last-Event-ID gets what it missed; if that is no
+longer possible it is told to resync instead.
+
+With several API workers, relay_through(pg_listener) sends every published
+event over Postgres NOTIFY, issued in the writing transaction, so each
+worker's subscribers see writes made on any worker once they commit. Event ids are per worker, so a client that reconnects to a
+different worker resyncs.
+"""
+import asyncio
+import json
+import threading
+import uuid
+from collections import deque
+
+from sqlalchemy import event, func, select
+
+from pg_listener import MAX_PAYLOAD
+
+BUFFER_SIZE = 1000
+SUBSCRIBER_QUEUE_SIZE = 256
+HEARTBEAT_SECONDS = 15
+EVENT_CHANNEL = "order_events"
+
+
+class Subscriber:
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+
+    def offer(self, event: tuple[str, str, str]):
+        # runs on the event loop via call_soon_threadsafe
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # slow client: stop queueing and make it resync once it catches up
+            self.overflowed = True
+
+
+class OrderEventBus:
+    def __init__(self, buffer_size: int = BUFFER_SIZE):
+        # event ids are "<boot>-<seq>" so ids from a previous process never resume
+        self.boot_id = uuid.uuid4().hex[:8]
+        self._seq = 0
+        self._buffer: deque[tuple[str, str, str]] = deque(maxlen=buffer_size)
+        self._subscribers: set[Subscriber] = set()
+        self._lock = threading.Lock()
+        self._listener = None
+
+    def relay_through(self, listener):
+        """Publish through Postgres so every worker's subscribers get the event"""
+        self._listener = listener
+        listener.subscribe(EVENT_CHANNEL, self._relayed, on_reset=self._relay_reset)
+
+    def publish(self, session, event_type: str, payload: dict):
+        """Publish an event when `session` commits; call before the commit.
+
+        A relayed event is NOTIFYed in the session's transaction; otherwise it
+        is delivered here from an after_commit hook. A rollback publishes
+        nothing either way.
+        """
+        data = json.dumps(payload, default=str)
+        if self._listener is None:
+            event.listen(session, "after_commit", lambda _session: self.deliver(event_type, data), once=True)
+            return
+        message = json.dumps([event_type, data])
+        if len(message.encode()) > MAX_PAYLOAD:
+            message = json.dumps(["resync", json.dumps({"reason": "oversized event"})])
+        session.execute(select(func.pg_notify(EVENT_CHANNEL, message)))
+
+    def _relayed(self, message: str):
+        event_type, data = json.loads(message)
+        self.deliver(event_type, data)
+
+    def _relay_reset(self):
+        # events from other workers may have been lost
+        self.deliver("resync", json.dumps({"reason": "relay reconnected"}))
+
+    def deliver(self, event_type: str, data: str):
+        """Record an encoded event and fan it out to this process's subscribers"""
+        with self._lock:
+            self._seq += 1
+            event = (f"{self.boot_id}-{self._seq}", event_type, data)
+            self._buffer.append(event)
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            sub.loop.call_soon_threadsafe(sub.offer, event)
+
+    def subscribe(self, last_event_id: str | None = None) -> tuple[Subscriber, list, bool]:
+        """Register a subscriber; returns (subscriber, backlog, needs_resync)"""
+        sub = Subscriber(asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.add(sub)
+            backlog, resync = self._replay(last_event_id)
+        return sub, backlog, resync
+
+    def last_event_id(self) -> str:
+        with self._lock:
+            return f"{self.boot_id}-{self._seq}"
+
+    def unsubscribe(self, sub: Subscriber):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def _replay(self, last_event_id: str | None) -> tuple[list, bool]:
+        if not last_event_id:
+            return [], False
+        boot_id, _, seq = last_event_id.partition("-")
+        if boot_id != self.boot_id or not seq.isdigit():
+            return [], True
+        seq = int(seq)
+        oldest = self._seq - len(self._buffer) + 1
+        if seq + 1 < oldest:
+            return [], True
+        return [e for e in self._buffer if int(e[0].rsplit("-", 1)[1]) > seq], False
+
+
+def format_sse(event_id: str | None, event_type: str, data: str) -> str:
+    lines = []
+    if event_id:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event_type}")
+    lines.append(f"data: {data}")
+    return "\n".join(lines) + "\n\n"
+
+
+event_bus = OrderEventBus()
@@ -0,0 +1,44 @@
+"""
+Gunicorn settings for the API container (see api/Dockerfile)
+
+API_WORKERS uvicorn worker processes share port 8000; each has its own
+connection pool, order cache and calendar feed. Reload gracefully with
+`docker compose kill -s HUP api`: new workers start on the current code and
+settings while the old ones finish in-flight requests (up to
+API_GRACEFUL_TIMEOUT seconds, which also bounds open SSE streams).
+"""
+import logging
+import os
+import shutil
+
+bind = "0.0.0.0:8000"
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = int(os.getenv("API_WORKERS", "1"))
+graceful_timeout = int(os.getenv("API_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+# heartbeat files on tmpfs: a slow container filesystem can make the arbiter
+# think healthy workers hung
+worker_tmp_dir = "/dev/shm"
+accesslog = "-"
+
+
+def on_starting(server):
+    # per-worker metric files; stale ones from the previous run would be summed in
+    metrics_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if metrics_dir:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+        os.makedirs(metrics_dir)
+    pool = int(os.getenv("DB_POOL_SIZE", "5")) + int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    budget = int(os.getenv("DB_MAX_CONNECTIONS", "0"))
+    if budget:
+        pool = min(pool, max(1, budget // workers - 1))
+    # +1 per worker for its LISTEN connection
+    logging.getLogger("gunicorn.error").info(
+        f"api: {workers} workers, up to {workers * (pool + 1)} connections to the primary"
+    )
+
+
+def child_exit(server, worker):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
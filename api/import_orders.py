@@ -0,0 +1,50 @@
+"""
+Bulk-import orders from a CSV or JSONL file
+
+Runs the same streaming COPY pipeline as POST /api/orders/import, straight
+against DATABASE_URL:
+
+    python import_orders.py orders.csv
+    docker compose exec -T api python import_orders.py - --format jsonl < orders.jsonl
+"""
+import argparse
+import asyncio
+import json
+import sys
+
+from database import database_session, dispose_engine
+from order_import import IMPORT_FORMATS, import_orders
+
+CHUNK_SIZE = 64 * 1024
+
+
+async def read_chunks(fh):
+    while chunk := fh.read(CHUNK_SIZE):
+        yield chunk
+
+
+async def run(path: str, fmt: str) -> dict:
+    fh = sys.stdin.buffer if path == "-" else open(path, "rb")
+    try:
+        async with database_session() as db:
+            return await import_orders(db, read_chunks(fh), fmt)
+    finally:
+        if fh is not sys.stdin.buffer:
+            fh.close()
+        await dispose_engine()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("path", help="CSV/JSONL file, or - for stdin")
+    parser.add_argument("--format", choices=IMPORT_FORMATS, help="default: from the file extension, else csv")
+    args = parser.parse_args()
+    fmt = args.format or ("jsonl" if args.path.endswith((".jsonl", ".ndjson")) else "csv")
+    report = asyncio.run(run(args.path, fmt))
+    json.dump(report, sys.stdout, indent=2)
+    print()
+    sys.exit(1 if report["error_count"] else 0)
+
+
+if __name__ == "__main__":
+    main()
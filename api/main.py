@@ -2,78 +2,191 @@
 FastAPI backend for Translation Order Management
 Minimal viable version - CRUD + calendar feed + webhook endpoint
 """
-from fastapi import FastAPI, Depends, HTTPException, Query, Request
-from fastapi.responses import Response
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean, Text
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session
-from datetime import datetime, timedelta
-from icalendar import Calendar, Event
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from sqlalchemy import Double, cast, func, literal, literal_column, or_, select, tuple_, update
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
 import logging
-from pydantic import BaseModel
+import asyncio
+import orjson
+import base64
+import csv
+import hashlib
+import io
+import json
 import os
+import time
 
-# Database setup
-DATABASE_URL = "postgresql://tmorder:change_me_in_production@db:5432/tmorder"
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
-
-# Models
-class Order(Base):
-    __tablename__ = "orders"
-    id = Column(Integer, primary_key=True, index=True)
-    customer_name = Column(String(255), nullable=False)
-    source_lang = Column(String(10), nullable=False)
-    target_lang = Column(String(10), nullable=False)
-    word_count = Column(Integer)
-    topic = Column(Text)
-    deadline_at = Column(DateTime, nullable=False)
-    status = Column(String(50), default="pending")
-    reminder_sent_24h = Column(Boolean, default=False)
-    reminder_sent_6h = Column(Boolean, default=False)
-    reminder_sent_2h = Column(Boolean, default=False)
-    reminder_sent_due = Column(Boolean, default=False)
-    telegram_user_id = Column(Integer)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-
-# Pydantic schemas
-class OrderCreate(BaseModel):
-    customer_name: str
-    source_lang: str
-    target_lang: str
-    word_count: int | None = None
-    topic: str | None = None
-    deadline_at: datetime
-    telegram_user_id: int | None = None
-
-class OrderUpdate(BaseModel):
-    customer_name: str | None = None
-    source_lang: str | None = None
-    target_lang: str | None = None
-    word_count: int | None = None
-    topic: str | None = None
-    deadline_at: datetime | None = None
-    status: str | None = None
-
-class OrderResponse(BaseModel):
-    id: int
-    customer_name: str
-    source_lang: str
-    target_lang: str
-    word_count: int | None
-    topic: str | None
-    deadline_at: datetime
-    status: str
-    created_at: datetime
-    updated_at: datetime
-
-    class Config:
-        from_attributes = True
+from analytics import GROUP_BY_PATTERN, PERIODS, parse_group_by, rollup_report
+from bot_updates import (
+    BOT_UPDATES_CHANNEL, CLAIM_POLL_SECONDS, WEBHOOK_SECRET, claim_updates, enqueue_update, settle_updates, update_arrivals,
+    webhook_authorized,
+)
+from calendar_feed import calendar_feed
+from database import (
+    API_WORKERS, DB_MODE, MAX_OVERFLOW, PIN_COOKIE, POOL_SIZE, REPLICA_CONFIGURED, Database, PrimaryPinMiddleware,
+    database_session, dispose_engine, get_db, get_read_db,
+)
+from events import HEARTBEAT_SECONDS, event_bus, format_sse
+from metrics import REMINDER_SCAN_LATENCY, REMINDERS_CLAIMED, REMINDERS_DUE, MetricsMiddleware, render_metrics
+from models import SEARCH_CONFIG, Order, OrderClient, OrderReminder, OrderTombstone
+from order_cache import ALL_LISTS, cache_backend, client_tag, order_cache, order_tag
+from order_import import import_orders
+from order_sync import orders_version, settled_since
+from pg_listener import pg_listener
+from profiling import ADMIN_TOKEN, ProfilingMiddleware, is_admin, slow_queries
+from reminders import (
+    OPEN_ORDER, REMINDER_LOOKAHEAD, REMINDER_WINDOW, reconcile_reminders, sync_order_reminders,
+)
+from schemas import (
+    AnalyticsReport, BotUpdateAck, BotUpdateClaim, ClientSearch, OrderChanges, OrderCreate, OrderPage, OrderResponse,
+    OrderSearchPage, OrderUpdate, ReminderAck, ReminderClaim, UtcDateTime,
+)
+from settings import get_setting, reminder_offsets
+
+def publish_order_event(session, event_type: str, order: Order):
+    """Push an order snapshot to /api/orders/stream subscribers when session commits"""
+    event_bus.publish(session, event_type, OrderResponse.model_validate(order).model_dump(mode="json"))
+
+# Status predicates are inline literals, not bind parameters, so Postgres can
+# match them against the partial indexes' WHERE clauses in prepared plans.
+UNDELIVERED = Order.status != literal_column("'delivered'")
+DELIVERED = Order.status == literal_column("'delivered'")
+
+# Reminder scheduling lives in reminders.py; these shape what the bot receives
+def render_reminder(template: str, row) -> str:
+    """Fill a deadline_reminders.messages template for one order"""
+    return template.format(
+        reminder_type=row.reminder_type,
+        order_id=row.id,
+        customer_name=row.customer_name,
+        topic=row.topic or "N/A",
+        deadline=row.deadline_at.strftime("%Y-%m-%d %H:%M UTC"),
+    )
+
+def reminder_payload(row) -> dict:
+    template = (
+        get_setting(f"deadline_reminders.messages.reminder_{row.reminder_type}")
+        or get_setting("deadline_reminders.messages.reminder_default")
+    )
+    return {
+        "id": row.id,
+        "customer_name": row.customer_name,
+        "deadline_at": row.deadline_at,
+        "reminder_type": row.reminder_type,
+        "telegram_user_id": row.telegram_user_id,
+        "message": render_reminder(template, row),
+        # this order's line in a digest (see /api/bot/settings)
+        "summary": render_reminder(get_setting("deadline_reminders.messages.digest_line"), row),
+    }
+
+# Keyset pagination
+DEFAULT_PAGE_SIZE = int(get_setting("web_ui.items_per_page"))
+MAX_PAGE_SIZE = max(int(get_setting("system.max_orders_display")), DEFAULT_PAGE_SIZE)
+
+SYNC_BATCH_SIZE = 500
+
+def _encode_token(value) -> str:
+    raw = json.dumps(value).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _decode_token(token: str):
+    padded = token + "=" * (-len(token) % 4)
+    return json.loads(base64.urlsafe_b64decode(padded))
+
+def encode_cursor(sort_value: datetime, order_id: int) -> str:
+    """Opaque cursor pointing just past (sort_value, order_id)"""
+    return _encode_token([sort_value.isoformat(), order_id])
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        sort_value, order_id = _decode_token(cursor)
+        return datetime.fromisoformat(sort_value), int(order_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def encode_sync_token(updated: tuple[int, int] | None, deleted: tuple[int, int] | None) -> str:
+    """Sync token = high-water marks for orders (change_xid, id) and tombstones (change_xid, order_id)"""
+    return _encode_token({
+        "u": list(updated) if updated else None,
+        "d": list(deleted) if deleted else None,
+    })
+
+def decode_sync_token(token: str) -> tuple[tuple[int, int] | None, tuple[int, int] | None]:
+    try:
+        marks = _decode_token(token)
+        return tuple(
+            (int(marks[k][0]), int(marks[k][1])) if marks[k] else None
+            for k in ("u", "d")
+        )
+    except (ValueError, TypeError, KeyError, IndexError):
+        raise HTTPException(status_code=400, detail="Invalid sync token")
+
+# List endpoints select just these columns and encode the rows with orjson
+# directly: no ORM instances, no per-row OrderResponse validation.
+ORDER_COLUMNS = [getattr(Order, name) for name in OrderResponse.model_fields]
+
+def order_rows(rows) -> list[dict]:
+    return [row._asdict() for row in rows]
+
+def json_response(content: dict, response: Response) -> ORJSONResponse:
+    """Encode a response already shaped like its response_model, keeping headers set by dependencies"""
+    return ORJSONResponse(content, headers=dict(response.headers))
+
+@dataclass
+class CachedPage:
+    """An encoded list page as kept in order_cache"""
+    etag: str
+    body: bytes
+    count: int
+
+def list_cache_key(request: Request) -> tuple:
+    return ("list", request.url.path, request.url.query)
+
+async def cached_list(request: Request, response: Response, db: Database, fetch, client: str | None = None) -> CachedPage:
+    """The page list_etag found in order_cache, or fetch()'s page, encoded and stored there"""
+    page = getattr(request.state, "cached_page", None)
+    if page is None:
+        content = await db.run(fetch)
+        page = CachedPage(response.headers["ETag"], orjson.dumps(content), len(content["items"]))
+        tags = (client_tag(client),) if client is not None else (ALL_LISTS,)
+        order_cache.put(list_cache_key(request), page, tags, request.state.cache_epoch, request.state.replayed_lsn)
+    return page
+
+def page_response(page: CachedPage, response: Response) -> Response:
+    return Response(page.body, media_type="application/json", headers=dict(response.headers))
+
+def paginate(query, sort_column, limit: int, cursor: str | None = None, descending: bool = False) -> dict:
+    """Seek to `cursor` on (sort_column, id) and return one page.
+
+    The WHERE on the row tuple lets Postgres start the index scan at the
+    cursor, so page N costs the same as page 1 regardless of table size.
+    """
+    key = tuple_(sort_column, Order.id)
+    if cursor:
+        seek = tuple_(*decode_cursor(cursor))
+        query = query.filter(key < seek if descending else key > seek)
+    if descending:
+        query = query.order_by(sort_column.desc(), Order.id.desc())
+    else:
+        query = query.order_by(sort_column, Order.id)
+    rows = query.limit(limit + 1).all()
+    items = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, sort_column.key), last.id)
+    return {"items": order_rows(items), "next_cursor": next_cursor}
 
 # FastAPI app
 app = FastAPI(title="TM-Order API")
+if REPLICA_CONFIGURED:
+    app.add_middleware(PrimaryPinMiddleware)
+if ADMIN_TOKEN is not None:
+    app.add_middleware(ProfilingMiddleware)
+app.add_middleware(MetricsMiddleware, router_app=app)
 
 
 # Do not wrap `app` here; we'll wrap it after routes are defined so decorators
@@ -83,6 +196,39 @@ app = FastAPI(title="TM-Order API")
 # Ensure logging configuration prints INFO-level logs to stdout
 logging.basicConfig(level=logging.INFO)
 
+@app.on_event("startup")
+async def log_database_mode():
+    logging.info(f"database: mode={DB_MODE}, workers={API_WORKERS}, pool_size={POOL_SIZE}, max_overflow={MAX_OVERFLOW}, replica={REPLICA_CONFIGURED}")
+
+@app.on_event("startup")
+async def sync_reminder_schedule():
+    async with database_session() as db:
+        await db.run(reconcile_reminders)
+
+@app.on_event("startup")
+async def start_notifications():
+    if API_WORKERS > 1 and cache_backend.name == "postgres":
+        event_bus.relay_through(pg_listener)
+    if WEBHOOK_SECRET:
+        pg_listener.subscribe(BOT_UPDATES_CHANNEL, update_arrivals.notify)
+    await cache_backend.start()
+    # no-op when the postgres cache backend already started it
+    await pg_listener.start()
+
+@app.on_event("startup")
+async def start_slow_query_log():
+    if slow_queries.enabled:
+        slow_queries.start()
+
+@app.on_event("shutdown")
+async def stop_cache_invalidation():
+    await cache_backend.stop()
+    await pg_listener.stop()
+
+@app.on_event("shutdown")
+async def close_database():
+    await dispose_engine()
+
 # simple middleware to avoid proxy caching interfering with development
 # @app.middleware("http")
 # async def add_no_cache_header(request: Request, call_next):
@@ -126,196 +272,748 @@ logging.basicConfig(level=logging.INFO)
 #     logging.info(resp_msg)
 #     return response
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+async def list_etag(request: Request, response: Response, db: Database = Depends(get_read_db)):
+    """Strong ETag for list endpoints, answered with 304 before any rows are loaded.
+
+    Every write stamps its transaction id on the orders it touches (or on a
+    tombstone), so order_sync.orders_version versions the whole table with
+    two index lookups; the URL is mixed in so each filter/page has its own
+    tag. A page still in order_cache brings its tag along and needs no query
+    at all.
+    """
+    page = order_cache.get(list_cache_key(request))
+    if page is not None:
+        request.state.cached_page = page
+        etag = page.etag
+    else:
+        request.state.cache_epoch = order_cache.epoch
+        request.state.replayed_lsn, table_version = await db.run_replayed(orders_version)
+        version = f"{table_version}|{request.url.path}?{request.url.query}"
+        etag = '"' + hashlib.sha1(version.encode()).hexdigest() + '"'
+    if_none_match = [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]
+    if etag in if_none_match or "*" in if_none_match:
+        raise HTTPException(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    # let browsers keep the body but revalidate on every poll
+    response.headers["Cache-Control"] = "no-cache"
 
 @app.get("/health")
-def health_check():
+async def health_check():
     """Health check endpoint for Docker"""
     return {"status": "healthy"}
 
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus scrape target (not routed by Caddy, scrape api:8000 directly)"""
+    body, content_type = render_metrics()
+    return Response(body, media_type=content_type)
+
 @app.post("/api/orders", response_model=OrderResponse)
-def create_order(order: OrderCreate, db: Session = Depends(get_db)):
+async def create_order(order: OrderCreate, db: Database = Depends(get_db)):
     """Create new translation order"""
     print(f"Creating order: {order}")
-    db_order = Order(**order.model_dump())
-    db.add(db_order)
-    db.commit()
-    db.refresh(db_order)
+
+    def insert(session):
+        db_order = Order(**order.model_dump())
+        session.add(db_order)
+        session.flush()
+        sync_order_reminders(session, db_order)
+        session.refresh(db_order)
+        publish_order_event(session, "created", db_order)
+        session.commit()
+        return db_order
+
+    db_order = await db.run(insert)
+    order_cache.invalidate([db_order.id], [db_order.customer_name])
     print(f"Order created with ID: {db_order.id}")
     return db_order
 
+@app.post("/api/orders/import")
+async def import_order_file(
+    request: Request,
+    format: str = Query("csv", pattern="^(csv|jsonl)$"),
+    db: Database = Depends(get_db),
+):
+    """Bulk-create orders from a CSV (with header) or JSONL request body.
+
+    The body is streamed and loaded in COPY batches; rows that fail
+    validation are skipped and listed in the returned report.
+    """
+    report = await import_orders(db, request.stream(), format)
+    client_addr = request.client.host if request.client else 'unknown'
+    logging.info(f"import_order_file: format={format}, imported={report['imported']}, errors={report['error_count']}, remote={client_addr}")
+    if report["imported"]:
+        # too many rows for per-order events; subscribers reload instead
+        def publish_resync(session):
+            event_bus.publish(session, "resync", {"reason": "import", "imported": report["imported"]})
+            session.commit()
+
+        await db.run(publish_resync)
+        order_cache.clear()
+    return report
+
 @app.get("/api/orders/check-reminders")
-def check_reminders(db: Session = Depends(get_db)):
-    """Check for orders needing deadline reminders at different intervals"""
+async def check_reminders(db: Database = Depends(get_db)):
+    """Check for orders needing deadline reminders at different intervals.
+
+    A read-only preview: unsent reminders whose fire_at is within 15 minutes
+    either side of now, found by one range scan of the pending-reminders index.
+    """
+    if not get_setting("deadline_reminders.enabled", True):
+        return []
     now = datetime.utcnow()
-    
-    reminders = []
-    
-    # Check for 24h reminders
-    reminder_24h_window_start = now + timedelta(hours=23, minutes=45)  # 24h ±15min
-    reminder_24h_window_end = now + timedelta(hours=24, minutes=15)
-    orders_24h = db.query(Order).filter(
-        Order.deadline_at.between(reminder_24h_window_start, reminder_24h_window_end),
-        Order.reminder_sent_24h == False,
-        Order.status != "delivered",
-        Order.status != "cancelled"
-    ).all()
-    for order in orders_24h:
-        reminders.append({
-            "id": order.id,
-            "customer_name": order.customer_name,
-            "deadline_at": order.deadline_at,
-            "reminder_type": "24h",
-            "message": f"⏰ **24 Hours Reminder**\nOrder #{order.id} for {order.customer_name}\nTopic: {order.topic or 'N/A'}\nDeadline: {order.deadline_at.strftime('%Y-%m-%d %H:%M UTC')}"
-        })
-    
-    # Check for 6h reminders
-    reminder_6h_window_start = now + timedelta(hours=5, minutes=45)  # 6h ±15min
-    reminder_6h_window_end = now + timedelta(hours=6, minutes=15)
-    orders_6h = db.query(Order).filter(
-        Order.deadline_at.between(reminder_6h_window_start, reminder_6h_window_end),
-        Order.reminder_sent_6h == False,
-        Order.status != "delivered",
-        Order.status != "cancelled"
-    ).all()
-    for order in orders_6h:
-        reminders.append({
-            "id": order.id,
-            "customer_name": order.customer_name,
-            "deadline_at": order.deadline_at,
-            "reminder_type": "6h",
-            "message": f"🚨 **6 Hours Reminder**\nOrder #{order.id} for {order.customer_name}\nTopic: {order.topic or 'N/A'}\nDeadline: {order.deadline_at.strftime('%Y-%m-%d %H:%M UTC')}"
-        })
-    
-    # Check for 2h reminders
-    reminder_2h_window_start = now + timedelta(hours=1, minutes=45)  # 2h ±15min
-    reminder_2h_window_end = now + timedelta(hours=2, minutes=15)
-    orders_2h = db.query(Order).filter(
-        Order.deadline_at.between(reminder_2h_window_start, reminder_2h_window_end),
-        Order.reminder_sent_2h == False,
-        Order.status != "delivered",
-        Order.status != "cancelled"
-    ).all()
-    for order in orders_2h:
-        reminders.append({
-            "id": order.id,
-            "customer_name": order.customer_name,
-            "deadline_at": order.deadline_at,
-            "reminder_type": "2h",
-            "message": f"⚠️ **2 Hours Reminder**\nOrder #{order.id} for {order.customer_name}\nTopic: {order.topic or 'N/A'}\nDeadline: {order.deadline_at.strftime('%Y-%m-%d %H:%M UTC')}"
-        })
-    
-    # Check for due reminders (at deadline)
-    reminder_due_window_start = now - timedelta(minutes=15)  # Within 15min of deadline
-    reminder_due_window_end = now + timedelta(minutes=15)
-    orders_due = db.query(Order).filter(
-        Order.deadline_at.between(reminder_due_window_start, reminder_due_window_end),
-        Order.reminder_sent_due == False,
-        Order.status != "delivered",
-        Order.status != "cancelled"
-    ).all()
-    for order in orders_due:
-        reminders.append({
-            "id": order.id,
-            "customer_name": order.customer_name,
-            "deadline_at": order.deadline_at,
-            "reminder_type": "due",
-            "message": f"🚨 **DEADLINE REACHED**\nOrder #{order.id} for {order.customer_name}\nTopic: {order.topic or 'N/A'}\nDeadline: {order.deadline_at.strftime('%Y-%m-%d %H:%M UTC')}"
-        })
-    
+    query = (
+        select(
+            Order.id, Order.customer_name, Order.topic, Order.deadline_at, Order.telegram_user_id,
+            OrderReminder.reminder_type,
+        )
+        .join(Order, Order.id == OrderReminder.order_id)
+        .where(
+            OrderReminder.sent_at.is_(None),
+            OrderReminder.fire_at.between(now - REMINDER_WINDOW, now + REMINDER_WINDOW),
+            OPEN_ORDER,
+        )
+        .order_by(OrderReminder.fire_at, Order.id)
+    )
+    with REMINDER_SCAN_LATENCY.labels("check").time():
+        rows = await db.run(lambda session: session.execute(query).all())
+
+    due = dict.fromkeys(reminder_offsets(), 0)
+    for row in rows:
+        due[row.reminder_type] = due.get(row.reminder_type, 0) + 1
+    for reminder_type, count in due.items():
+        REMINDERS_DUE.labels(reminder_type).set(count)
+    reminders = [reminder_payload(row) for row in rows]
+    logging.info(f"check_reminders: {len(reminders)} due")
     return reminders
 
-@app.get("/api/orders", response_model=list[OrderResponse])
-def list_orders(
-    status: str | None = None,
-    db: Session = Depends(get_db),
+
+PERIOD_PATTERN = f"^({'|'.join(PERIODS)})$"
+
+async def analytics_report(db: Database, metric: str, start: date, end: date, period: str, group_by: str, customer: str | None, request: Request) -> ORJSONResponse:
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    rows = await db.run(rollup_report, metric, start, end, period, parse_group_by(group_by), customer)
+    try:
+        client_addr = request.client.host if request and request.client else 'unknown'
+    except Exception:
+        client_addr = 'unknown'
+    logging.info(f"analytics_report: metric={metric}, {start}..{end} by {period}/{group_by or '-'}, returned {len(rows)} rows; remote={client_addr}")
+    return ORJSONResponse({"metric": metric, "period": period, "start": start, "end": end, "rows": rows})
+
+
+@app.get("/api/analytics/workload", response_model=AnalyticsReport)
+async def get_workload(
+    days: int = Query(14, ge=1, le=366),
+    start: date | None = None,
+    period: str = Query("day", pattern=PERIOD_PATTERN),
+    group_by: str = Query("lang_pair", pattern=GROUP_BY_PATTERN),
+    customer: str | None = None,
+    db: Database = Depends(get_read_db),
     request: Request = None
 ):
-    """List all orders, optionally filtered by status"""
-    query = db.query(Order)
-    if status:
-        query = query.filter(Order.status == status)
-    results = query.all()
+    """Open orders and words due per deadline day over the next `days` days
+    (from `start`, default today UTC)"""
+    start = start or datetime.utcnow().date()
+    return await analytics_report(db, "due", start, start + timedelta(days=days), period, group_by, customer, request)
+
+
+@app.get("/api/analytics/deliveries", response_model=AnalyticsReport)
+async def get_deliveries(
+    start: date | None = None,
+    end: date | None = None,
+    period: str = Query("month", pattern=PERIOD_PATTERN),
+    group_by: str = Query("customer", pattern=GROUP_BY_PATTERN),
+    customer: str | None = None,
+    db: Database = Depends(get_read_db),
+    request: Request = None
+):
+    """Delivered orders and words per delivery period in [start, end)
+    (default: the last 12 calendar months including the current one)"""
+    today = datetime.utcnow().date()
+    end = end or today + timedelta(days=1)
+    if start is None:
+        months = today.year * 12 + today.month - 1 - 11
+        start = date(months // 12, months % 12 + 1, 1)
+    return await analytics_report(db, "delivered", start, end, period, group_by, customer, request)
+
+
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    """Order cache counters for this worker"""
+    return {**order_cache.stats(), "backend": cache_backend.name, "listening": cache_backend.listening}
+
+
+def require_admin(x_admin_token: str | None = Header(None)):
+    """Gate for /api/admin/*: the X-Admin-Token header must match ADMIN_TOKEN"""
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+@app.get("/api/admin/slow-queries", dependencies=[Depends(require_admin)])
+async def get_slow_queries():
+    """Recent statements over SLOW_QUERY_MS with their plans, newest first (this worker)"""
+    return slow_queries.report()
+
+
+@app.get("/api/bot/settings")
+async def get_bot_settings():
+    """Settings the Telegram bot applies on its side"""
+    return {
+        "max_orders_display": int(get_setting("system.max_orders_display")),
+        "reminder_digest_min": int(get_setting("deadline_reminders.digest_min_reminders", 0)),
+        "reminder_digest_header": get_setting("deadline_reminders.messages.digest_header"),
+    }
+
+
+@app.get("/api/reminders/offsets")
+async def get_reminder_offsets():
+    """Configured reminder types and their offset before the deadline, in hours"""
+    return {reminder_type: offset.total_seconds() / 3600 for reminder_type, offset in reminder_offsets().items()}
+
+
+@app.post("/api/reminders/claim")
+async def claim_reminders(claim: ReminderClaim, db: Database = Depends(get_db)):
+    """Lease due reminders to one worker in a single statement.
+
+    Rows another worker is claiming right now are skipped (SKIP LOCKED), and
+    rows with a live lease are left alone; a lease that expires without an
+    ack makes the reminder claimable again.
+    """
+    if not get_setting("deadline_reminders.enabled", True):
+        return []
+    now = datetime.utcnow()
+    due = (
+        select(OrderReminder.order_id, OrderReminder.reminder_type)
+        .join(Order, Order.id == OrderReminder.order_id)
+        .where(
+            OrderReminder.sent_at.is_(None),
+            OrderReminder.fire_at.between(now - REMINDER_WINDOW, now + REMINDER_LOOKAHEAD),
+            or_(OrderReminder.claim_expires_at.is_(None), OrderReminder.claim_expires_at < now),
+            OPEN_ORDER,
+        )
+        # `due` reminders first: they are the most urgent to get out
+        .order_by(OrderReminder.reminder_type != literal_column("'due'"), OrderReminder.fire_at, OrderReminder.order_id)
+        .limit(claim.limit)
+        .with_for_update(of=OrderReminder, skip_locked=True)
+        .cte("due")
+    )
+    # Core UPDATE on the table: the ORM form drops RETURNING columns of the
+    # joined orders table
+    reminders = OrderReminder.__table__
+    stmt = (
+        update(reminders)
+        .where(
+            reminders.c.order_id == due.c.order_id,
+            reminders.c.reminder_type == due.c.reminder_type,
+            Order.id == reminders.c.order_id,
+        )
+        .values(claimed_by=claim.worker_id, claim_expires_at=now + timedelta(seconds=claim.lease_seconds))
+        .returning(
+            Order.id, Order.customer_name, Order.topic, Order.deadline_at, Order.telegram_user_id,
+            reminders.c.reminder_type, reminders.c.claim_expires_at,
+        )
+    )
+
+    def lease(session):
+        rows = session.execute(stmt).all()
+        session.commit()
+        return rows
+
+    with REMINDER_SCAN_LATENCY.labels("claim").time():
+        rows = await db.run(lease)
+    for row in rows:
+        REMINDERS_CLAIMED.labels(row.reminder_type).inc()
+    logging.info(f"claim_reminders: worker={claim.worker_id}, claimed={len(rows)}")
+    return [
+        {**reminder_payload(row), "lease_expires_at": row.claim_expires_at}
+        for row in sorted(rows, key=lambda r: (r.deadline_at, r.id))
+    ]
+
+
+@app.post("/api/reminders/ack")
+async def ack_reminders(ack: ReminderAck, db: Database = Depends(get_db)):
+    """Settle a batch of claimed reminders in one round trip.
+
+    Reminders are named by (order_id, reminder_type), since an order can
+    have several claimed at once. `sent` ones are stamped as sent, `failed`
+    ones have their lease dropped so the next claim picks them up again.
+    Reminders whose lease is no longer held by this worker are reported back
+    as `stale`.
+    """
+    release = dict(claimed_by=None, claim_expires_at=None)
+    held_by_worker = OrderReminder.claimed_by == ack.worker_id
+    reminder_key = tuple_(OrderReminder.order_id, OrderReminder.reminder_type)
+
+    def keys(reminders) -> list[tuple]:
+        return [(reminder.order_id, reminder.reminder_type) for reminder in reminders]
+
+    def settle(session):
+        acked_keys = []
+        if ack.sent:
+            acked_keys = session.execute(
+                update(OrderReminder)
+                .where(reminder_key.in_(keys(ack.sent)), held_by_worker)
+                .values(sent_at=datetime.utcnow(), **release)
+                .returning(OrderReminder.order_id, OrderReminder.reminder_type),
+                execution_options={"synchronize_session": False},
+            ).all()
+        released = []
+        if ack.failed:
+            released = session.execute(
+                update(OrderReminder)
+                .where(reminder_key.in_(keys(ack.failed)), held_by_worker)
+                .values(**release)
+                .returning(OrderReminder.order_id, OrderReminder.reminder_type),
+                execution_options={"synchronize_session": False},
+            ).all()
+        acked_ids = {order_id for order_id, _ in acked_keys}
+        for order in session.query(Order).filter(Order.id.in_(acked_ids)).all() if acked_ids else []:
+            publish_order_event(session, "reminder_sent", order)
+        session.commit()
+        return sorted(map(tuple, acked_keys)), sorted(map(tuple, released))
+
+    # no order_cache.invalidate: cached responses hold no reminder state
+    acked_keys, released = await db.run(settle)
+    settled = set(acked_keys) | set(released)
+    stale = [key for key in keys(ack.sent + ack.failed) if key not in settled]
+
+    def key_list(reminders) -> list[dict]:
+        return [{"order_id": order_id, "reminder_type": reminder_type} for order_id, reminder_type in reminders]
+
+    logging.info(f"ack_reminders: worker={ack.worker_id}, sent={len(acked_keys)}, released={len(released)}, stale={len(stale)}")
+    return {"acked": key_list(acked_keys), "released": key_list(released), "stale": key_list(stale)}
+
+@app.get("/api/orders", response_model=OrderPage)
+async def list_orders(
+    status: str | None = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    db: Database = Depends(get_read_db),
+    request: Request = None,
+    response: Response = None,
+    _etag: None = Depends(list_etag)
+):
+    """List orders by deadline, optionally filtered by status"""
+    def fetch(session):
+        query = session.query(*ORDER_COLUMNS)
+        if status:
+            query = query.filter(Order.status == status)
+        return paginate(query, Order.deadline_at, limit, cursor)
+
+    page = await cached_list(request, response, db, fetch)
     # log for debugging: how many rows the DB returned and requester address
     try:
         client_addr = request.client.host if request and request.client else 'unknown'
     except Exception:
         client_addr = 'unknown'
-    logging.info(f"list_orders: returned {len(results)} rows; remote={client_addr}")
-    return results
+    logging.info(f"list_orders: returned {page.count} rows; remote={client_addr}")
+    return page_response(page, response)
 
 
-@app.get("/api/orders/undelivered", response_model=list[OrderResponse])
-def list_undelivered_orders(db: Session = Depends(get_db), request: Request = None):
-    """List all undelivered orders with deadlines"""
-    query = db.query(Order).filter(Order.status != "delivered").order_by(Order.deadline_at)
-    results = query.all()
+@app.get("/api/orders/changes", response_model=OrderChanges)
+async def list_order_changes(
+    since: str | None = None,
+    limit: int = Query(SYNC_BATCH_SIZE, ge=1, le=SYNC_BATCH_SIZE),
+    db: Database = Depends(get_read_db),
+    response: Response = None,
+):
+    """Orders created/updated and deleted after a sync token.
+
+    Omit `since` to start from the beginning, then keep passing `next_since`
+    back; call again straight away while `has_more` is true. An unchanged
+    table costs two index probes and returns empty lists. Marks are on the
+    writing transaction's id, and a change is only returned once every
+    transaction that was running when it was written has finished (see
+    order_sync), so one committing late cannot slip in behind a mark.
+    """
+    updated_mark, deleted_mark = decode_sync_token(since) if since else (None, None)
+
+    def fetch(session):
+        changed = (
+            session.query(*ORDER_COLUMNS, Order.change_xid)
+            .filter(settled_since(Order.change_xid, Order.id, updated_mark))
+            .order_by(Order.change_xid, Order.id)
+            .limit(limit + 1)
+            .all()
+        )
+        deleted = (
+            session.query(OrderTombstone)
+            .filter(settled_since(OrderTombstone.change_xid, OrderTombstone.order_id, deleted_mark))
+            .order_by(OrderTombstone.change_xid, OrderTombstone.order_id)
+            .limit(limit + 1)
+            .all()
+        )
+        return changed, deleted
+
+    changed, deleted = await db.run(fetch)
+
+    has_more = len(changed) > limit or len(deleted) > limit
+    changed, deleted = changed[:limit], deleted[:limit]
+    if changed:
+        updated_mark = (changed[-1].change_xid, changed[-1].id)
+    if deleted:
+        deleted_mark = (deleted[-1].change_xid, deleted[-1].order_id)
+    logging.info(f"list_order_changes: changed={len(changed)}, deleted={len(deleted)}, has_more={has_more}")
+    return json_response({
+        "changed": [{column.key: getattr(row, column.key) for column in ORDER_COLUMNS} for row in changed],
+        "deleted": [t.order_id for t in deleted],
+        "next_since": encode_sync_token(updated_mark, deleted_mark),
+        "has_more": has_more,
+    }, response)
+
+
+EXPORT_COLUMNS = [
+    Order.id, Order.customer_name, Order.source_lang, Order.target_lang, Order.word_count,
+    Order.topic, Order.deadline_at, Order.status, Order.telegram_user_id, Order.created_at, Order.updated_at,
+]
+EXPORT_BATCH_SIZE = 1000
+
+def export_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+@app.get("/api/orders/export")
+async def export_orders(
+    request: Request,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    status: str | None = None,
+    customer: str | None = None,
+    deadline_from: UtcDateTime | None = None,
+    deadline_to: UtcDateTime | None = None,
+):
+    """Stream every matching order as NDJSON or CSV, ordered by id.
+
+    Rows come from a server-side cursor EXPORT_BATCH_SIZE at a time and are
+    written out as they arrive, so memory use does not grow with the export.
+    """
+    query = select(*EXPORT_COLUMNS).order_by(Order.id)
+    if status:
+        query = query.where(Order.status == status)
+    if customer:
+        query = query.where(Order.customer_name == customer)
+    if deadline_from:
+        query = query.where(Order.deadline_at >= deadline_from)
+    if deadline_to:
+        query = query.where(Order.deadline_at < deadline_to)
+    names = [column.key for column in EXPORT_COLUMNS]
+    client_addr = request.client.host if request.client else 'unknown'
+
+    async def rows_out():
+        exported = 0
+        if format == "csv":
+            yield ",".join(names) + "\r\n"
+        # its own session: the response body outlives the request's dependencies
+        async with database_session(replica=PIN_COOKIE not in request.cookies) as db:
+            async for rows in db.stream(query, EXPORT_BATCH_SIZE):
+                if format == "csv":
+                    buffer = io.StringIO()
+                    csv.writer(buffer).writerows(map(export_value, row) for row in rows)
+                    yield buffer.getvalue()
+                else:
+                    yield b"".join(orjson.dumps(row._asdict(), option=orjson.OPT_APPEND_NEWLINE) for row in rows)
+                exported += len(rows)
+        logging.info(f"export_orders: format={format}, exported={exported}, remote={client_addr}")
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        rows_out(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="orders.{format}"'},
+    )
+
+SEARCH_REGCONFIG = literal_column(f"'{SEARCH_CONFIG}'::regconfig")
+SNIPPET_OPTIONS = 'StartSel=«, StopSel=», MaxWords=20, MinWords=6, MaxFragments=2, FragmentDelimiter=" … "'
+# newest matching orders that get ranked; bounds the cost of broad queries
+SEARCH_CANDIDATES = 1000
+
+@app.get("/api/orders/search", response_model=OrderSearchPage)
+async def search_orders(
+    q: str = Query(..., min_length=1, max_length=500),
+    status: str | None = None,
+    customer: str | None = None,
+    deadline_from: UtcDateTime | None = None,
+    deadline_to: UtcDateTime | None = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    db: Database = Depends(get_read_db),
+    request: Request = None,
+    response: Response = None,
+    _etag: None = Depends(list_etag)
+):
+    """Full-text search over customer names and topics, best match first.
+
+    `q` is web-search syntax: words are stemmed and ANDed, "quoted text" is a
+    phrase, `or` and `-word` work as expected. Matches come from the GIN index
+    on orders.search_vector. Only the SEARCH_CANDIDATES newest matches (after
+    filters) are ranked, so a query matching half the table costs no more
+    than a narrow one; add words or filters to reach older orders. Pages are
+    keyset on (rank, id) within that candidate set, which the cursor pins by
+    its highest id, and snippets are only built for the rows on the page.
+    """
+    seek = ceiling = None
+    if cursor:
+        try:
+            seek_rank, seek_id, ceiling = _decode_token(cursor)
+            seek, ceiling = (float(seek_rank), int(seek_id)), int(ceiling)
+        except (ValueError, TypeError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    tsquery = func.websearch_to_tsquery(SEARCH_REGCONFIG, q)
+    candidates = select(Order.id, Order.search_vector).where(Order.search_vector.op("@@")(tsquery))
+    if status:
+        candidates = candidates.where(Order.status == status)
+    if customer:
+        candidates = candidates.where(Order.customer_name == customer)
+    if deadline_from:
+        candidates = candidates.where(Order.deadline_at >= deadline_from)
+    if deadline_to:
+        candidates = candidates.where(Order.deadline_at < deadline_to)
+    if ceiling is not None:
+        candidates = candidates.where(Order.id <= ceiling)
+    candidates = candidates.order_by(Order.id.desc()).limit(SEARCH_CANDIDATES).subquery()
+
+    # double precision so the rank in a cursor compares equal when it comes back
+    rank = cast(func.ts_rank_cd(candidates.c.search_vector, tsquery), Double)
+    hits = select(candidates.c.id, rank.label("rank"), func.max(candidates.c.id).over().label("ceiling"))
+    if seek:
+        hits = hits.where(tuple_(rank, candidates.c.id) < tuple_(*seek))
+    hits = hits.order_by(rank.desc(), candidates.c.id.desc()).limit(limit + 1).subquery()
+    snippet = func.ts_headline(SEARCH_REGCONFIG, func.coalesce(Order.topic, ""), tsquery, SNIPPET_OPTIONS)
+    page_query = (
+        select(*ORDER_COLUMNS, hits.c.rank, snippet.label("snippet"), hits.c.ceiling)
+        .join(hits, hits.c.id == Order.id)
+        .order_by(hits.c.rank.desc(), Order.id.desc())
+    )
+
+    def fetch(session):
+        rows = session.execute(page_query).all()
+        items = order_rows(rows[:limit])
+        next_cursor = None
+        if len(rows) > limit:
+            last = items[-1]
+            next_cursor = _encode_token([last["rank"], last["id"], ceiling if ceiling is not None else last["ceiling"]])
+        for item in items:
+            del item["ceiling"]
+        return {"items": items, "next_cursor": next_cursor}
+
+    page = await cached_list(request, response, db, fetch)
+    try:
+        client_addr = request.client.host if request and request.client else 'unknown'
+    except Exception:
+        client_addr = 'unknown'
+    logging.info(f"search_orders: q={q!r}, returned {page.count} rows; remote={client_addr}")
+    return page_response(page, response)
+
+@app.get("/api/orders/stream")
+async def stream_order_events(request: Request, last_event_id: str | None = None):
+    """Server-Sent Events feed of order created/updated/delivered/reminder_sent.
+
+    Each event carries the order as JSON. Browsers resume automatically via
+    the Last-Event-ID header (`?last_event_id=` works too); when the missed
+    events are no longer buffered a `resync` event tells the client to reload.
+    """
+    resume_from = request.headers.get("last-event-id") or last_event_id
+    sub, backlog, resync = event_bus.subscribe(resume_from)
+    logging.info(f"stream_order_events: subscribed, resume_from={resume_from}, backlog={len(backlog)}, resync={resync}")
+
+    async def event_stream():
+        try:
+            yield "retry: 3000\n\n"
+            if resync:
+                yield format_sse(event_bus.last_event_id(), "resync", "{}")
+            for event in backlog:
+                yield format_sse(*event)
+            while not await request.is_disconnected():
+                if sub.overflowed and sub.queue.empty():
+                    sub.overflowed = False
+                    yield format_sse(event_bus.last_event_id(), "resync", "{}")
+                try:
+                    event = await asyncio.wait_for(sub.queue.get(), timeout=HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield format_sse(*event)
+        finally:
+            event_bus.unsubscribe(sub)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/api/orders/undelivered", response_model=OrderPage)
+async def list_undelivered_orders(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    db: Database = Depends(get_read_db),
+    request: Request = None,
+    response: Response = None,
+    _etag: None = Depends(list_etag)
+):
+    """List undelivered orders, soonest deadline first"""
+    def fetch(session):
+        query = session.query(*ORDER_COLUMNS).filter(UNDELIVERED)
+        return paginate(query, Order.deadline_at, limit, cursor)
+
+    page = await cached_list(request, response, db, fetch)
     try:
         client_addr = request.client.host if request and request.client else 'unknown'
     except Exception:
         client_addr = 'unknown'
-    logging.info(f"list_undelivered_orders: returned {len(results)} rows; remote={client_addr}")
-    return results
+    logging.info(f"list_undelivered_orders: returned {page.count} rows; remote={client_addr}")
+    return page_response(page, response)
 
 
-@app.get("/api/orders/undelivered/{client_name}", response_model=list[OrderResponse])
-def list_undelivered_orders_by_client(client_name: str, db: Session = Depends(get_db), request: Request = None):
+@app.get("/api/orders/undelivered/{client_name}", response_model=OrderPage)
+async def list_undelivered_orders_by_client(
+    client_name: str,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    db: Database = Depends(get_read_db),
+    request: Request = None,
+    response: Response = None,
+    _etag: None = Depends(list_etag)
+):
     """List undelivered orders for a specific client"""
-    query = db.query(Order).filter(Order.status != "delivered", Order.customer_name == client_name).order_by(Order.deadline_at)
-    results = query.all()
+    def fetch(session):
+        query = session.query(*ORDER_COLUMNS).filter(UNDELIVERED, Order.customer_name == client_name)
+        return paginate(query, Order.deadline_at, limit, cursor)
+
+    page = await cached_list(request, response, db, fetch, client=client_name)
     try:
         client_addr = request.client.host if request and request.client else 'unknown'
     except Exception:
         client_addr = 'unknown'
-    logging.info(f"list_undelivered_orders_by_client: client={client_name}, returned {len(results)} rows; remote={client_addr}")
-    return results
+    logging.info(f"list_undelivered_orders_by_client: client={client_name}, returned {page.count} rows; remote={client_addr}")
+    return page_response(page, response)
 
 
-@app.get("/api/orders/delivered", response_model=list[OrderResponse])
-def list_delivered_orders(db: Session = Depends(get_db), request: Request = None):
-    """List all delivered orders with delivery timestamps"""
-    query = db.query(Order).filter(Order.status == "delivered").order_by(Order.updated_at.desc())
-    results = query.all()
+@app.get("/api/orders/delivered", response_model=OrderPage)
+async def list_delivered_orders(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    db: Database = Depends(get_read_db),
+    request: Request = None,
+    response: Response = None,
+    _etag: None = Depends(list_etag)
+):
+    """List delivered orders, most recently delivered first"""
+    def fetch(session):
+        query = session.query(*ORDER_COLUMNS).filter(DELIVERED)
+        return paginate(query, Order.updated_at, limit, cursor, descending=True)
+
+    page = await cached_list(request, response, db, fetch)
     try:
         client_addr = request.client.host if request and request.client else 'unknown'
     except Exception:
         client_addr = 'unknown'
-    logging.info(f"list_delivered_orders: returned {len(results)} rows; remote={client_addr}")
-    return results
+    logging.info(f"list_delivered_orders: returned {page.count} rows; remote={client_addr}")
+    return page_response(page, response)
 
 
-@app.get("/api/orders/delivered/{client_name}", response_model=list[OrderResponse])
-def list_delivered_orders_by_client(client_name: str, db: Session = Depends(get_db), request: Request = None):
+@app.get("/api/orders/delivered/{client_name}", response_model=OrderPage)
+async def list_delivered_orders_by_client(
+    client_name: str,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    db: Database = Depends(get_read_db),
+    request: Request = None,
+    response: Response = None,
+    _etag: None = Depends(list_etag)
+):
     """List delivered orders for a specific client"""
-    query = db.query(Order).filter(Order.status == "delivered", Order.customer_name == client_name).order_by(Order.updated_at.desc())
-    results = query.all()
+    def fetch(session):
+        query = session.query(*ORDER_COLUMNS).filter(DELIVERED, Order.customer_name == client_name)
+        return paginate(query, Order.updated_at, limit, cursor, descending=True)
+
+    page = await cached_list(request, response, db, fetch, client=client_name)
+    try:
+        client_addr = request.client.host if request and request.client else 'unknown'
+    except Exception:
+        client_addr = 'unknown'
+    logging.info(f"list_delivered_orders_by_client: client={client_name}, returned {page.count} rows; remote={client_addr}")
+    return page_response(page, response)
+
+
+CLIENT_SEARCH_LIMIT = 10
+# nearest names fetched from the trigram index before re-ranking
+CLIENT_CANDIDATES = 50
+# pg_trgm word_similarity cut-off for fuzzy matches; the extension default
+# (0.6) misses most single-letter typos in short names
+CLIENT_MATCH_THRESHOLD = float(os.getenv("CLIENT_MATCH_THRESHOLD", "0.3"))
+
+def like_prefix(text: str) -> str:
+    """LIKE pattern matching names that start with `text` literally"""
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+@app.get("/api/clients/search", response_model=ClientSearch)
+async def search_clients(
+    q: str = Query(..., min_length=1, max_length=255),
+    limit: int = Query(CLIENT_SEARCH_LIMIT, ge=1, le=CLIENT_CANDIDATES),
+    db: Database = Depends(get_read_db),
+    request: Request = None
+):
+    """Client names for autocomplete, typo- and case-tolerant.
+
+    The GiST trigram index hands back the CLIENT_CANDIDATES nearest names
+    (KNN on word similarity), which are then ranked: prefix matches first,
+    then by similarity, ties broken by most recent order.
+    """
+    q = q.strip()
+    term = literal(q)
+    candidates = (
+        select(OrderClient)
+        .where(term.op("<%")(OrderClient.customer_name))
+        .order_by(term.op("<<->")(OrderClient.customer_name))
+        .limit(CLIENT_CANDIDATES)
+        .subquery()
+    )
+    prefix = candidates.c.customer_name.ilike(like_prefix(q), escape="\\")
+    score = func.word_similarity(term, candidates.c.customer_name)
+
+    def fetch(session):
+        session.execute(select(func.set_config("pg_trgm.word_similarity_threshold", str(CLIENT_MATCH_THRESHOLD), True)))
+        return session.execute(
+            select(candidates.c.customer_name, candidates.c.order_count, candidates.c.last_order_at, score.label("score"))
+            .order_by(prefix.desc(), score.desc(), candidates.c.last_order_at.desc().nullslast(), candidates.c.customer_name)
+            .limit(limit)
+        ).all()
+
+    rows = await db.run(fetch) if q else []
     try:
         client_addr = request.client.host if request and request.client else 'unknown'
     except Exception:
         client_addr = 'unknown'
-    logging.info(f"list_delivered_orders_by_client: client={client_name}, returned {len(results)} rows; remote={client_addr}")
-    return results
+    logging.info(f"search_clients: q={q!r}, returned {len(rows)} rows; remote={client_addr}")
+    return ORJSONResponse({"items": order_rows(rows)})
 
 
 @app.put("/api/orders/{order_id}/deliver", response_model=OrderResponse)
-def deliver_order(order_id: int, db: Session = Depends(get_db), request: Request = None):
+async def deliver_order(order_id: int, db: Database = Depends(get_db), request: Request = None):
     """Mark an order as delivered"""
-    order = db.query(Order).filter(Order.id == order_id).first()
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
-    
-    if order.status == "delivered":
-        raise HTTPException(status_code=400, detail="Order is already delivered")
-    
-    order.status = "delivered"
-    order.updated_at = datetime.utcnow()
-    db.commit()
-    db.refresh(order)
+
+    def deliver(session):
+        order = session.query(Order).filter(Order.id == order_id).first()
+        if not order:
+            raise HTTPException(status_code=404, detail="Order not found")
+        
+        if order.status == "delivered":
+            raise HTTPException(status_code=400, detail="Order is already delivered")
+        
+        order.status = "delivered"
+        order.updated_at = datetime.utcnow()
+        sync_order_reminders(session, order)
+        session.flush()
+        session.refresh(order)
+        publish_order_event(session, "delivered", order)
+        session.commit()
+        return order
+
+    order = await db.run(deliver)
+    order_cache.invalidate([order_id], [order.customer_name])
     
     try:
         client_addr = request.client.host if request and request.client else 'unknown'
@@ -326,20 +1024,31 @@ def deliver_order(order_id: int, db: Session = Depends(get_db), request: Request
 
 
 @app.put("/api/orders/{order_id}", response_model=OrderResponse)
-def update_order(order_id: int, order_update: OrderUpdate, db: Session = Depends(get_db), request: Request = None):
+async def update_order(order_id: int, order_update: OrderUpdate, db: Database = Depends(get_db), request: Request = None):
     """Update an existing order"""
-    order = db.query(Order).filter(Order.id == order_id).first()
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
-    
     # Update only provided fields
     update_data = order_update.model_dump(exclude_unset=True)
-    for field, value in update_data.items():
-        setattr(order, field, value)
-    
-    order.updated_at = datetime.utcnow()
-    db.commit()
-    db.refresh(order)
+
+    def update(session):
+        order = session.query(Order).filter(Order.id == order_id).first()
+        if not order:
+            raise HTTPException(status_code=404, detail="Order not found")
+        
+        previous_client = order.customer_name
+        for field, value in update_data.items():
+            setattr(order, field, value)
+        
+        order.updated_at = datetime.utcnow()
+        if {"deadline_at", "status"} & update_data.keys():
+            sync_order_reminders(session, order)
+        session.flush()
+        session.refresh(order)
+        publish_order_event(session, "updated", order)
+        session.commit()
+        return order, previous_client
+
+    order, previous_client = await db.run(update)
+    order_cache.invalidate([order_id], {previous_client, order.customer_name})
     
     try:
         client_addr = request.client.host if request and request.client else 'unknown'
@@ -408,78 +1117,136 @@ def update_order(order_id: int, order_update: OrderUpdate, db: Session = Depends
 #     return debug_catchall(rest, request)
 
 @app.get("/api/orders/{order_id}", response_model=OrderResponse)
-def get_order(order_id: int, db: Session = Depends(get_db)):
-    """Get single order by ID"""
-    order = db.query(Order).filter(Order.id == order_id).first()
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
-    return order
-
-@app.put("/api/orders/{order_id}", response_model=OrderResponse)
-def update_order(order_id: int, order: OrderUpdate, db: Session = Depends(get_db)):
-    """Update existing order"""
-    db_order = db.query(Order).filter(Order.id == order_id).first()
-    if not db_order:
-        raise HTTPException(status_code=404, detail="Order not found")
-    
-    for key, value in order.model_dump(exclude_unset=True).items():
-        setattr(db_order, key, value)
-    
-    db.commit()
-    db.refresh(db_order)
-    return db_order
+async def get_order(order_id: int, db: Database = Depends(get_read_db)):
+    """Get single order by ID (served from order_cache while unchanged)"""
+    key = ("order", order_id)
+    body = order_cache.get(key)
+    if body is None:
+        epoch = order_cache.epoch
+        replayed_lsn, row = await db.run_replayed(lambda session: session.query(*ORDER_COLUMNS).filter(Order.id == order_id).first())
+        if not row:
+            raise HTTPException(status_code=404, detail="Order not found")
+        body = orjson.dumps(row._asdict())
+        order_cache.put(key, body, (order_tag(order_id),), epoch, replayed_lsn)
+    return Response(body, media_type="application/json")
 
 @app.get("/calendar/ics")
-def get_calendar_feed(
+async def get_calendar_feed(
+    request: Request,
     token: str = Query(...),
-    db: Session = Depends(get_db)
+    customer: str | None = None,
+    lang_pair: str | None = Query(None, pattern=r"^[^-]+-[^-]+$", description="source-target, e.g. en-sv"),
+    horizon_days: int | None = Query(None, ge=0, description="only deadlines up to this many days ahead"),
+    db: Database = Depends(get_read_db)
 ):
-    """Generate iCalendar feed of all deadlines"""
+    """Generate iCalendar feed of all deadlines.
+
+    Served from the incrementally maintained calendar_feed cache; clients
+    revalidating with If-None-Match / If-Modified-Since get a 304 while
+    nothing in their (optionally filtered) feed changed.
+    """
     expected_token = os.getenv("SECRET_CALENDAR_TOKEN", "change_me")
     if token != expected_token:
         raise HTTPException(status_code=403, detail="Invalid token")
-    
-    cal = Calendar()
-    cal.add('prodid', '-//TM-Order Calendar//EN')
-    cal.add('version', '2.0')
-    cal.add('x-wr-calname', 'Translation Deadlines')
-    
-    orders = db.query(Order).filter(Order.status != "delivered").all()
-    
-    for order in orders:
-        event = Event()
-        event.add('summary', f"#{order.id} {order.customer_name} {order.source_lang}→{order.target_lang}")
-        event.add('dtstart', order.deadline_at.date())
-        event.add('dtend', order.deadline_at.date())
-        event.add('description', f"Topic: {order.topic or 'N/A'}\\nWords: {order.word_count or 'N/A'}")
-        event.add('uid', f"tmorder-{order.id}@localhost")
-        cal.add_component(event)
-    
-    return Response(content=cal.to_ical(), media_type="text/calendar")
+
+    await calendar_feed.sync(db)
+    until = datetime.utcnow().date() + timedelta(days=horizon_days) if horizon_days is not None else None
+    feed = calendar_feed.render(customer=customer, lang_pair=lang_pair, until=until)
+
+    headers = {
+        "ETag": feed.etag,
+        "Last-Modified": format_datetime(feed.last_modified.replace(tzinfo=timezone.utc), usegmt=True),
+        "Cache-Control": "no-cache",
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if feed.etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+            raise HTTPException(status_code=304, headers=headers)
+    elif request.headers.get("if-modified-since"):
+        try:
+            since = parsedate_to_datetime(request.headers["if-modified-since"]).replace(tzinfo=None)
+        except (TypeError, ValueError):
+            since = None
+        if since is not None and feed.last_modified <= since:
+            raise HTTPException(status_code=304, headers=headers)
+
+    return Response(content=feed.body, media_type="text/calendar", headers=headers)
 
 @app.post("/bot/webhook")
-async def telegram_webhook(update: dict):
-    """Telegram webhook endpoint - placeholder for bot integration"""
-    # Bot service will handle actual logic
-    return {"status": "received"}
+async def telegram_webhook(request: Request, db: Database = Depends(get_db)):
+    """Queue a Telegram update for the bot workers (webhook mode, see bot_updates.py)"""
+    if not webhook_authorized(request.headers.get("x-telegram-bot-api-secret-token")):
+        raise HTTPException(status_code=403, detail="Invalid secret token")
+    try:
+        update = orjson.loads(await request.body())
+    except orjson.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Update is not valid JSON")
+    if not isinstance(update, dict) or not isinstance(update.get("update_id"), int):
+        raise HTTPException(status_code=400, detail="Update has no update_id")
+
+    stored = await db.run(enqueue_update, update)
+    if stored is None:
+        # Telegram retries a failed delivery, so nothing is lost while the bot catches up
+        logging.warning(f"telegram_webhook: queue full, refusing update {update['update_id']}")
+        raise HTTPException(status_code=503, detail="Update queue is full")
+    update_arrivals.notify()
+    return {"status": "queued" if stored else "duplicate"}
+
+@app.post("/api/bot/updates/claim")
+async def claim_bot_updates(claim: BotUpdateClaim, db: Database = Depends(get_db)):
+    """Lease queued Telegram updates to one bot worker, at most one per chat.
+
+    With wait_seconds > 0 an empty claim waits for updates to arrive (long
+    polling) and returns as soon as it has any.
+    """
+    deadline = time.monotonic() + claim.wait_seconds
+    while True:
+        rows = await db.run(claim_updates, claim.worker_id, claim.limit, claim.lease_seconds)
+        remaining = deadline - time.monotonic()
+        if rows or remaining <= 0:
+            break
+        await update_arrivals.wait(min(remaining, CLAIM_POLL_SECONDS))
+    if rows:
+        logging.info(f"claim_bot_updates: worker={claim.worker_id}, claimed={len(rows)}")
+    return [
+        {"update_id": row.update_id, "update": row.payload, "attempts": row.attempts, "lease_expires_at": row.claim_expires_at}
+        for row in rows
+    ]
+
+@app.post("/api/bot/updates/ack")
+async def ack_bot_updates(ack: BotUpdateAck, db: Database = Depends(get_db)):
+    """Delete processed updates and release failed ones for another attempt.
+
+    Ids whose lease this worker no longer holds are reported back as `stale`.
+    """
+    done, released = await db.run(settle_updates, ack.worker_id, ack.processed, ack.failed)
+    settled = set(done) | set(released)
+    stale = [update_id for update_id in ack.processed + ack.failed if update_id not in settled]
+    if stale or released:
+        logging.info(f"ack_bot_updates: worker={ack.worker_id}, processed={len(done)}, released={len(released)}, stale={len(stale)}")
+    return {"processed": done, "released": released, "stale": stale}
 
 @app.post("/api/orders/{order_id}/mark-reminder-sent")
-def mark_reminder_sent(order_id: int, reminder_type: str = "24h", db: Session = Depends(get_db)):
+async def mark_reminder_sent(order_id: int, reminder_type: str = "24h", db: Database = Depends(get_db)):
     """Mark specific reminder type as sent for an order"""
-    db_order = db.query(Order).filter(Order.id == order_id).first()
-    if not db_order:
-        raise HTTPException(status_code=404, detail="Order not found")
-    
-    if reminder_type == "24h":
-        db_order.reminder_sent_24h = True
-    elif reminder_type == "6h":
-        db_order.reminder_sent_6h = True
-    elif reminder_type == "2h":
-        db_order.reminder_sent_2h = True
-    elif reminder_type == "due":
-        db_order.reminder_sent_due = True
-    
-    db.commit()
+
+    def mark(session):
+        db_order = session.query(Order).filter(Order.id == order_id).first()
+        if not db_order:
+            raise HTTPException(status_code=404, detail="Order not found")
+        
+        session.execute(
+            update(OrderReminder)
+            .where(OrderReminder.order_id == order_id, OrderReminder.reminder_type == reminder_type)
+            .values(sent_at=datetime.utcnow(), claimed_by=None, claim_expires_at=None)
+        )
+        publish_order_event(session, "reminder_sent", db_order)
+        session.commit()
+        return db_order
+
+    # no order_cache.invalidate: cached responses hold no reminder state
+    # (it lives in order_reminders), same as in ack_reminders
+    await db.run(mark)
     return {"status": "updated"}
 
 
@@ -0,0 +1,170 @@
+"""
+Prometheus metrics served at GET /metrics
+
+  http_*         per-route latency, in-flight requests and response sizes,
+                 recorded by MetricsMiddleware around every request
+  db_pool_*      connection checkout wait and connections in use vs. capacity
+  db_statement_* per-statement counts and timings from SQLAlchemy engine
+                 events, labelled by operation and main table
+  reminder_*     reminder scans: due/claimed reminders per type and scan time
+
+Under gunicorn every worker writes its samples to PROMETHEUS_MULTIPROC_DIR
+and a scrape of any worker aggregates all of them; without that variable
+(plain uvicorn) the default in-process registry is used.
+"""
+import os
+import re
+import time
+from functools import lru_cache
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest,
+)
+from sqlalchemy import event
+from starlette.routing import Match
+
+MULTIPROC = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (100, 500, 1_000, 5_000, 10_000, 50_000, 100_000, 500_000, 1_000_000, 10_000_000)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Time to send the full response",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS,
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "Requests being handled",
+    ["method", "route"], multiprocess_mode="livesum",
+)
+RESPONSE_SIZE = Histogram(
+    "http_response_size_bytes", "Response body size",
+    ["method", "route"], buckets=SIZE_BUCKETS,
+)
+POOL_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection (includes connecting)",
+    ["database"], buckets=LATENCY_BUCKETS,
+)
+POOL_IN_USE = Gauge(
+    "db_pool_connections_in_use", "Connections checked out of the pool",
+    ["database"], multiprocess_mode="livesum",
+)
+POOL_CAPACITY = Gauge(
+    "db_pool_capacity", "pool_size + max_overflow; saturation is in_use / capacity",
+    ["database"], multiprocess_mode="livesum",
+)
+STATEMENT_LATENCY = Histogram(
+    "db_statement_duration_seconds", "Statement execution time",
+    ["database", "operation", "table"], buckets=LATENCY_BUCKETS,
+)
+STATEMENT_ERRORS = Counter(
+    "db_statement_errors_total", "Statements that raised",
+    ["database", "operation", "table"],
+)
+REMINDER_SCAN_LATENCY = Histogram(
+    "reminder_scan_duration_seconds", "Reminder scan time",
+    ["scan"], buckets=LATENCY_BUCKETS,
+)
+REMINDERS_DUE = Gauge(
+    "reminder_scan_due", "Reminders due in the latest check_reminders scan",
+    ["reminder_type"], multiprocess_mode="mostrecent",
+)
+REMINDERS_CLAIMED = Counter(
+    "reminders_claimed_total", "Reminders leased to bot workers",
+    ["reminder_type"],
+)
+
+# first table named after FROM/INTO/UPDATE/COPY, skipping subqueries
+STATEMENT_TABLE = re.compile(r'\b(?:FROM|INTO|UPDATE|COPY)\s+"?([A-Za-z_][\w.]*)', re.IGNORECASE)
+
+
+@lru_cache(maxsize=1024)
+def statement_labels(statement: str) -> tuple[str, str]:
+    """(operation, table) of a SQL statement, e.g. ("SELECT", "orders")"""
+    words = statement.split(None, 1)
+    operation = words[0].upper() if words else "-"
+    table = STATEMENT_TABLE.search(statement)
+    return operation, table.group(1) if table else "-"
+
+
+def instrument_engine(engine, database: str, capacity: int):
+    """Record statement timings and pool usage of one engine (sync or async)"""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    pool = sync_engine.pool
+    POOL_CAPACITY.labels(database).set(capacity)
+
+    # the pool has no "waiting" event: database.Database times its checkouts (POOL_WAIT)
+    in_use = POOL_IN_USE.labels(database)
+    event.listen(pool, "checkout", lambda *args: in_use.inc())
+    event.listen(pool, "checkin", lambda *args: in_use.dec())
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def start_timer(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._metrics_start = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def record_statement(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "_metrics_start", None)
+        if start is not None:
+            STATEMENT_LATENCY.labels(database, *statement_labels(statement)).observe(time.perf_counter() - start)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def record_error(exception_context):
+        statement = exception_context.statement
+        if statement:
+            STATEMENT_ERRORS.labels(database, *statement_labels(statement)).inc()
+
+
+def route_template(app, scope) -> str:
+    """The matched route's path template, so /api/orders/1 and /2 share a label"""
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "<unmatched>"
+
+
+class MetricsMiddleware:
+    """Per-route latency, in-flight and response size for every HTTP request"""
+
+    def __init__(self, app, router_app):
+        self.app = app
+        # the FastAPI app whose routes name the label; `app` may be wrapped
+        self.router_app = router_app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        method = scope["method"]
+        route = route_template(self.router_app, scope)
+        status = 500
+        size = 0
+
+        async def measuring_send(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        in_flight = REQUESTS_IN_FLIGHT.labels(method, route)
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, measuring_send)
+        finally:
+            in_flight.dec()
+            REQUEST_LATENCY.labels(method, route, str(status)).observe(time.perf_counter() - start)
+            RESPONSE_SIZE.labels(method, route).observe(size)
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """Exposition text for all workers (multiprocess) or this process"""
+    if MULTIPROC:
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,106 @@
+"""
+SQLAlchemy models
+The schema itself is owned by db/init.sql and db/migrations/.
+"""
+from datetime import datetime
+
+from sqlalchemy import BigInteger, Boolean, Column, Computed, Date, DateTime, ForeignKey, Integer, String, Text
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
+from sqlalchemy.orm import declarative_base, deferred
+
+Base = declarative_base()
+
+# Text search configuration for orders.search_vector (db/migrations/007_order_search.sql);
+# queries must be parsed with the same one so stems line up
+SEARCH_CONFIG = "english"
+
+
+class Order(Base):
+    __tablename__ = "orders"
+    id = Column(Integer, primary_key=True, index=True)
+    customer_name = Column(String(255), nullable=False)
+    source_lang = Column(String(10), nullable=False)
+    target_lang = Column(String(10), nullable=False)
+    word_count = Column(Integer)
+    topic = Column(Text)
+    deadline_at = Column(DateTime, nullable=False)
+    status = Column(String(50), default="pending")
+    telegram_user_id = Column(Integer)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # set by the stamp_orders_delivered_at trigger when status becomes 'delivered'
+    delivered_at = Column(DateTime)
+    # id of the transaction that last wrote the row, set by the stamp_orders_change_xid trigger
+    change_xid = Column(BigInteger, nullable=False, server_default="0")
+    # generated by Postgres; deferred so loading an Order never fetches it
+    search_vector = deferred(Column(TSVECTOR, Computed(
+        f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(customer_name, '')), 'A') || "
+        f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(topic, '')), 'B')",
+        persisted=True,
+    )))
+
+
+class OrderTombstone(Base):
+    """Filled by the orders AFTER DELETE trigger so sync clients see deletions"""
+    __tablename__ = "order_tombstones"
+    order_id = Column(Integer, primary_key=True)
+    deleted_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    change_xid = Column(BigInteger, nullable=False, server_default="0")
+
+
+class OrderReminder(Base):
+    """One row per (order, reminder offset); fire_at = deadline_at - offset"""
+    __tablename__ = "order_reminders"
+    order_id = Column(Integer, ForeignKey("orders.id", ondelete="CASCADE"), primary_key=True)
+    reminder_type = Column(String(10), primary_key=True)
+    fire_at = Column(DateTime, nullable=False)
+    sent_at = Column(DateTime)
+    # lease held by a bot worker between /api/reminders/claim and /ack
+    claimed_by = Column(String(64))
+    claim_expires_at = Column(DateTime)
+
+
+class OrderClient(Base):
+    """One row per distinct customer_name, kept current by triggers on orders
+    (db/migrations/006_client_search.sql); searched through a pg_trgm index"""
+    __tablename__ = "order_clients"
+    customer_name = Column(String(255), primary_key=True)
+    order_count = Column(Integer, nullable=False)
+    last_order_at = Column(DateTime)
+
+
+class OrderRollup(Base):
+    """Order count and word_count sum per day, language pair and customer, kept
+    current by triggers on orders (db/migrations/008_order_rollups.sql).
+    metric 'due' buckets open orders by deadline day, 'delivered' delivered
+    orders by delivery day."""
+    __tablename__ = "order_rollups"
+    metric = Column(String(10), primary_key=True)
+    day = Column(Date, primary_key=True)
+    source_lang = Column(String(10), primary_key=True)
+    target_lang = Column(String(10), primary_key=True)
+    customer_name = Column(String(255), primary_key=True)
+    order_count = Column(Integer, nullable=False)
+    word_count = Column(BigInteger, nullable=False)
+
+
+class BotUpdate(Base):
+    """A Telegram update received on /bot/webhook, waiting for a bot worker
+    (db/migrations/010_bot_updates.sql)"""
+    __tablename__ = "bot_updates"
+    update_id = Column(BigInteger, primary_key=True)
+    chat_id = Column(BigInteger, nullable=False)
+    payload = Column(JSONB, nullable=False)
+    received_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    # lease held by a bot worker between /api/bot/updates/claim and /ack
+    claimed_by = Column(String(64))
+    claim_expires_at = Column(DateTime)
+    attempts = Column(Integer, nullable=False, default=0)
+
+
+class BotUpdateCount(Base):
+    """The number of rows in bot_updates, kept by triggers in its single row
+    (db/migrations/012_bot_update_count.sql)"""
+    __tablename__ = "bot_update_count"
+    id = Column(Boolean, primary_key=True, default=True)
+    waiting = Column(Integer, nullable=False)
@@ -0,0 +1,257 @@
+"""
+Read-through cache for GET /api/orders/{id} and the order list endpoints
+
+Entries live for ORDER_CACHE_TTL seconds at most; past ORDER_CACHE_SIZE the
+least recently used one is evicted. Every entry carries tags naming what it
+depends on (one order, one client's lists, or all unfiltered lists), and a
+write drops exactly the entries tagged with the orders and clients it touched.
+
+Invalidations reach every API worker through Postgres: a statement-level
+trigger on orders NOTIFYs the ids and client names each write changed on the
+`order_cache` channel when it commits, whoever made the write (handlers,
+bulk imports, psql). ORDER_CACHE_BACKEND picks how a worker hears them:
+  postgres - through pg_listener (default). If its connection drops, the
+             cache is cleared until it is back.
+  local    - no listener; only this process's own writes invalidate, which
+             is enough for a single worker.
+Writing handlers also invalidate locally right after their commit, so a
+client reading its own write on the same worker never waits for the NOTIFY.
+
+Loads that raced with an invalidation are not stored: put() takes the
+`epoch` read before the load started and drops the value if any
+invalidation happened since. Loads served by a read replica also pass the
+WAL position the replica had replayed; they are dropped when that is behind
+`replica_floor`, the primary's position read after the last invalidation
+arrived, so a lagging replica cannot refill the cache with what was just
+invalidated. That read goes through the async pool in the background; until
+it returns no replica load is stored.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from sqlalchemy import text
+
+from database import REPLICA_CONFIGURED, database_session
+
+CACHE_SIZE = int(os.getenv("ORDER_CACHE_SIZE", "1000"))
+CACHE_TTL = float(os.getenv("ORDER_CACHE_TTL", "60"))
+CACHE_BACKEND = os.getenv("ORDER_CACHE_BACKEND", "postgres").lower()
+CHANNEL = "order_cache"
+
+# tag of list pages that are not filtered by client
+ALL_LISTS = ("lists",)
+# the primary's current WAL position as a byte offset
+CURRENT_LSN = text("SELECT pg_current_wal_lsn() - '0/0'")
+# replica_floor while it is being read: every replica load is behind it
+UNKNOWN_FLOOR = float("inf")
+FLOOR_RETRY_SECONDS = 1
+
+
+def order_tag(order_id: int) -> tuple:
+    return ("order", order_id)
+
+
+def client_tag(customer_name: str) -> tuple:
+    return ("client", customer_name)
+
+
+class OrderCache:
+    """TTL + LRU map with tag-based invalidation; used from the event loop only"""
+
+    def __init__(self, maxsize: int = CACHE_SIZE, ttl: float = CACHE_TTL, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._entries: OrderedDict[tuple, tuple[float, object, tuple]] = OrderedDict()
+        self._tagged: dict[tuple, set[tuple]] = {}
+        # bumped by every invalidation, see put()
+        self.epoch = 0
+        self.replica_floor = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.stale_loads = 0
+
+    def get(self, key: tuple):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] <= self.clock():
+            self._remove(key)
+            self.expirations += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: tuple, value, tags: tuple, epoch: int, replayed_lsn: int | None = None):
+        """Store a value loaded after `epoch` was read, unless it is stale by now"""
+        if self.maxsize <= 0 or epoch != self.epoch:
+            return
+        if replayed_lsn is not None and replayed_lsn < self.replica_floor:
+            self.stale_loads += 1
+            return
+        self._remove(key)
+        self._entries[key] = (self.clock() + self.ttl, value, tags)
+        for tag in tags:
+            self._tagged.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.maxsize:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def invalidate(self, order_ids=(), clients=()):
+        """Drop entries for these orders, these clients' lists and all unfiltered lists"""
+        self.epoch += 1
+        tags = [ALL_LISTS, *map(order_tag, order_ids), *map(client_tag, clients)]
+        for tag in tags:
+            for key in list(self._tagged.get(tag, ())):
+                self._remove(key)
+                self.invalidations += 1
+
+    def clear(self):
+        self.epoch += 1
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+        self._tagged.clear()
+
+    def apply(self, payload: str):
+        """Apply an invalidation NOTIFYed by the orders trigger"""
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            message = {"all": True}
+        if message.get("all"):
+            self.clear()
+        else:
+            self.invalidate(message.get("ids") or (), message.get("clients") or ())
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "stale_replica_loads": self.stale_loads,
+        }
+
+    def _remove(self, key: tuple):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tagged.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tagged[tag]
+
+
+class LocalInvalidation:
+    """Backend for a single worker: nothing to listen to"""
+
+    name = "local"
+    listening = False
+
+    def __init__(self, cache: OrderCache):
+        self.cache = cache
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+
+class PostgresInvalidation:
+    """Apply the orders trigger's notifications heard by pg_listener"""
+
+    name = "postgres"
+
+    def __init__(self, cache: OrderCache, listener, track_lsn: bool = False):
+        self.cache = cache
+        self.listener = listener
+        self.track_lsn = track_lsn
+        self._floor_stale = asyncio.Event()
+        self._floor_task: asyncio.Task | None = None
+        listener.subscribe(CHANNEL, self.on_message, on_reset=self.on_reset)
+
+    @property
+    def listening(self) -> bool:
+        return self.listener.listening
+
+    def on_message(self, payload: str):
+        self.cache.apply(payload)
+        if self.track_lsn:
+            self.raise_floor()
+
+    def on_reset(self):
+        # anything could have changed while we were not listening
+        self.cache.clear()
+        if self.track_lsn:
+            self.raise_floor()
+
+    def raise_floor(self):
+        """Refuse replica loads until the primary's position is read again"""
+        self.cache.replica_floor = UNKNOWN_FLOOR
+        self._floor_stale.set()
+
+    async def _track_floor(self):
+        # one read at a time; invalidations arriving meanwhile share the next one
+        while True:
+            await self._floor_stale.wait()
+            self._floor_stale.clear()
+            try:
+                async with database_session() as db:
+                    lsn = await db.run(lambda session: session.execute(CURRENT_LSN).scalar())
+            except Exception as exc:
+                logging.warning(f"order_cache: reading the primary's WAL position failed ({exc})")
+                self._floor_stale.set()
+                await asyncio.sleep(FLOOR_RETRY_SECONDS)
+                continue
+            # the write is committed by now, so a replica that has replayed
+            # past this position shows it; a newer invalidation needs a newer read
+            if not self._floor_stale.is_set():
+                self.cache.replica_floor = int(lsn)
+
+    async def start(self):
+        if self.track_lsn and self._floor_task is None:
+            self._floor_task = asyncio.create_task(self._track_floor())
+        await self.listener.start()
+
+    async def stop(self):
+        await self.listener.stop()
+        if self._floor_task:
+            self._floor_task.cancel()
+            try:
+                await self._floor_task
+            except asyncio.CancelledError:
+                pass
+            self._floor_task = None
+
+
+def make_backend(cache: OrderCache, name: str = CACHE_BACKEND):
+    if name == "local":
+        if REPLICA_CONFIGURED:
+            logging.warning("order_cache: the local backend cannot tell when the replica caught up with a write; use postgres")
+        return LocalInvalidation(cache)
+    if name == "postgres":
+        from pg_listener import pg_listener
+        return PostgresInvalidation(cache, pg_listener, track_lsn=REPLICA_CONFIGURED)
+    raise ValueError(f"ORDER_CACHE_BACKEND must be 'postgres' or 'local', got {name!r}")
+
+
+order_cache = OrderCache()
+cache_backend = make_backend(order_cache)
@@ -0,0 +1,236 @@
+"""
+Bulk order import for POST /api/orders/import and the import_orders.py CLI
+
+The upload is read as a stream of CSV or JSONL records and handled in
+batches of IMPORT_BATCH_SIZE: each record is validated against OrderCreate,
+the valid ones are COPY'd into a temporary staging table and merged into
+orders with one INSERT ... SELECT, and their reminder rows are generated in
+the same transaction. Every batch commits on its own, so memory use and lock
+time stay flat however large the file is.
+"""
+import codecs
+import csv
+import io
+import json
+import logging
+from datetime import datetime
+
+from pydantic import ValidationError
+from sqlalchemy import BigInteger, Column, DateTime, Integer, MetaData, String, Table, Text, func, insert, literal, select, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.util import await_only
+
+from database import ASYNC_MODE
+from models import Order, OrderReminder
+from reminders import pending_reminder_rows
+from schemas import OrderCreate
+from settings import reminder_offsets
+
+IMPORT_BATCH_SIZE = 5000
+# the report lists at most this many failing rows; error_count has the total
+MAX_REPORTED_ERRORS = 1000
+IMPORT_FORMATS = ("csv", "jsonl")
+
+# the COPY runs on the raw driver connection, so its errors arrive unwrapped
+DATABASE_ERRORS: tuple[type[Exception], ...] = (DBAPIError,)
+if ASYNC_MODE:
+    import asyncpg
+    # binary COPY encodes client-side: a value out of its column's range
+    # (word_count past INTEGER) fails before it reaches the server
+    DATABASE_ERRORS += (asyncpg.PostgresError, OverflowError)
+else:
+    import psycopg2
+    DATABASE_ERRORS += (psycopg2.Error,)
+
+FIELDS = list(OrderCreate.model_fields)
+
+staging = Table(
+    "order_import_staging",
+    MetaData(),
+    Column("row_number", Integer),
+    Column("customer_name", String(255)),
+    Column("source_lang", String(10)),
+    Column("target_lang", String(10)),
+    Column("word_count", Integer),
+    Column("topic", Text),
+    Column("deadline_at", DateTime),
+    Column("telegram_user_id", BigInteger),
+)
+STAGING_COLUMNS = [c.name for c in staging.columns]
+
+CREATE_STAGING = text("""
+    CREATE TEMP TABLE IF NOT EXISTS order_import_staging (
+        row_number INTEGER,
+        customer_name VARCHAR(255),
+        source_lang VARCHAR(10),
+        target_lang VARCHAR(10),
+        word_count INTEGER,
+        topic TEXT,
+        deadline_at TIMESTAMP,
+        telegram_user_id BIGINT
+    ) ON COMMIT DELETE ROWS
+""")
+
+
+async def iter_lines(chunks):
+    """Split a byte stream into decoded lines, keeping the line endings"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line + "\n"
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+async def iter_csv_records(chunks):
+    """Yield complete CSV records (quoted fields may span lines)"""
+    record = ""
+    async for line in iter_lines(chunks):
+        record += line
+        # an odd number of quotes means a quoted field is still open
+        if record.count('"') % 2 == 0:
+            if record.strip():
+                yield record
+            record = ""
+    if record.strip():
+        yield record
+
+
+def parse_csv_batch(records: list[str], header: list[str]) -> list[dict]:
+    rows = []
+    for values in csv.reader(records):
+        row = dict(zip(header, values))
+        # empty CSV cells are missing values, not empty strings
+        rows.append({k: v for k, v in row.items() if v != ""})
+    return rows
+
+
+def parse_jsonl_batch(records: list[str]) -> list[dict | str]:
+    rows = []
+    for record in records:
+        try:
+            rows.append(json.loads(record))
+        except ValueError as e:
+            rows.append(f"invalid JSON: {e}")
+    return rows
+
+
+def validate_batch(rows, report: dict) -> list[tuple]:
+    """OrderCreate-validate a batch; returns staging tuples for the valid rows"""
+    valid = []
+    for row_number, row in rows:
+        if isinstance(row, str):
+            record_error(report, row_number, [{"loc": [], "msg": row}])
+            continue
+        try:
+            order = OrderCreate.model_validate(row)
+        except ValidationError as e:
+            record_error(report, row_number, [{"loc": list(err["loc"]), "msg": err["msg"]} for err in e.errors()])
+            continue
+        valid.append((
+            row_number, order.customer_name, order.source_lang, order.target_lang,
+            order.word_count, order.topic, order.deadline_at, order.telegram_user_id,
+        ))
+    return valid
+
+
+def record_error(report: dict, row_number: int, errors: list[dict]):
+    report["error_count"] += 1
+    if len(report["errors"]) < MAX_REPORTED_ERRORS:
+        report["errors"].append({"row": row_number, "errors": errors})
+
+
+def copy_to_staging(session, rows: list[tuple]):
+    """COPY a batch into the staging table over the session's own connection"""
+    raw = session.connection().connection.driver_connection
+    if ASYNC_MODE:
+        # asyncpg: binary COPY; await_only runs it inside AsyncSession.run_sync
+        await_only(raw.copy_records_to_table(staging.name, records=rows, columns=STAGING_COLUMNS))
+        return
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(copy_text(value) for value in row) + "\n")
+    buffer.seek(0)
+    with raw.cursor() as cursor:
+        cursor.copy_expert(f"COPY {staging.name} ({', '.join(STAGING_COLUMNS)}) FROM STDIN", buffer)
+
+
+def copy_text(value) -> str:
+    """One field in COPY's text format (NULL is \\N, specials backslash-escaped)"""
+    if value is None:
+        return "\\N"
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def merge_batch(session, rows: list[tuple]) -> int:
+    """Stage one validated batch, then merge it into orders and create its reminder rows
+    in a single statement (the new orders never need to be looked up again)"""
+    session.execute(CREATE_STAGING)
+    copy_to_staging(session, rows)
+    now = datetime.utcnow()
+    source = select(
+        *[staging.c[name] for name in FIELDS], literal("pending"), literal(now, DateTime), literal(now, DateTime),
+    ).order_by(staging.c.row_number)
+    inserted = (
+        insert(Order)
+        .from_select(FIELDS + ["status", "created_at", "updated_at"], source)
+        .returning(Order.id, Order.deadline_at)
+        .cte("inserted")
+    )
+    reminders = (
+        insert(OrderReminder)
+        .from_select(["order_id", "reminder_type", "fire_at"], pending_reminder_rows(inserted, reminder_offsets()))
+        .cte("reminders")
+    )
+    imported = session.scalar(select(func.count()).select_from(inserted).add_cte(reminders))
+    session.commit()
+    return imported
+
+
+async def import_orders(db, chunks, fmt: str) -> dict:
+    """Import an async byte stream of CSV/JSONL orders; returns the per-row report"""
+    report = {"imported": 0, "error_count": 0, "errors": []}
+    records = iter_csv_records(chunks) if fmt == "csv" else iter_lines(chunks)
+    header = None
+    # (row number, raw record); rows are numbered from 1, a CSV header is not counted
+    batch: list[tuple[int, str]] = []
+    row_number = 0
+
+    async def flush(batch: list[tuple[int, str]]):
+        numbers, lines = zip(*batch)
+        parsed = parse_csv_batch(lines, header) if fmt == "csv" else parse_jsonl_batch(lines)
+        valid = validate_batch(zip(numbers, parsed), report)
+        if not valid:
+            return
+        try:
+            imported = await db.run(merge_batch, valid)
+        except DATABASE_ERRORS as e:
+            await db.run(lambda session: session.rollback())
+            logging.warning(f"import_orders: batch starting at row {numbers[0]} failed: {e}")
+            for row in valid:
+                record_error(report, row[0], [{"loc": [], "msg": f"database error: {e}"}])
+            return
+        report["imported"] += imported
+
+    async for record in records:
+        if fmt == "csv" and header is None:
+            header = [name.strip() for name in next(csv.reader([record]))]
+            missing = {"customer_name", "source_lang", "target_lang", "deadline_at"} - set(header)
+            if missing:
+                record_error(report, 0, [{"loc": ["header"], "msg": f"missing columns: {sorted(missing)}"}])
+                return report
+            continue
+        row_number += 1
+        if not record.strip():
+            continue
+        batch.append((row_number, record))
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            await flush(batch)
+            batch = []
+    if batch:
+        await flush(batch)
+    return report
@@ -0,0 +1,52 @@
+"""
+Commit-safe change marks over orders and order_tombstones
+
+Readers that keep a copy of the orders (sync clients, the calendar feed)
+remember how far they have read and later ask for what changed since. A mark
+on updated_at is not safe: it is the writing transaction's start time, so a
+transaction that started first and committed last lands behind a mark the
+reader already moved past, and the change is never seen.
+
+Instead, triggers stamp every written row with its transaction's id
+(change_xid, see db/migrations/011_change_xids.sql), and readers only take
+rows whose change_xid is below the xmin of their statement's snapshot. All
+transactions below xmin have finished, so such rows are visible now or never
+will be, and once a (change_xid, id) mark is past them nothing can still
+commit behind it. A change becomes readable when every transaction that was
+running as it was written has finished; a long-running transaction holds the
+marks back until it ends.
+"""
+from sqlalchemy import func, literal_column, select, tuple_
+
+from models import Order, OrderTombstone
+
+# xmin of the current statement's snapshot: every transaction below it has finished
+SETTLED_XID = literal_column("pg_snapshot_xmin(pg_current_snapshot())::text::bigint")
+
+
+def settled_since(change_xid, key, mark: tuple[int, int] | None):
+    """WHERE clause for rows past `mark` on (change_xid, key) whose writers have finished"""
+    clause = change_xid < SETTLED_XID
+    if mark:
+        clause = clause & (tuple_(change_xid, key) > tuple_(*mark))
+    return clause
+
+
+def orders_version(session) -> str:
+    """A version of orders + tombstones that changes whenever a write to them commits.
+
+    The newest change_xid alone is not enough while older writers are still
+    running: one of them committing changes the table without raising it.
+    So the transactions below it that the snapshot still sees running are
+    part of the version too.
+    """
+    newest_order, newest_delete, snapshot = session.execute(select(
+        select(func.max(Order.change_xid)).scalar_subquery(),
+        select(func.max(OrderTombstone.change_xid)).scalar_subquery(),
+        literal_column("pg_current_snapshot()::text"),
+    )).one()
+    newest = max(newest_order or 0, newest_delete or 0)
+    # xmin:xmax:xip,xip,...
+    running = snapshot.split(":")[2]
+    pending = [xid for xid in running.split(",") if xid and int(xid) < newest]
+    return f"{newest}|{','.join(pending)}"
@@ -0,0 +1,120 @@
+"""
+One Postgres LISTEN connection per API process, shared by everything that
+needs notifications from other workers: order_cache invalidations, with
+API_WORKERS > 1 the order event relay behind /api/orders/stream, and with
+TELEGRAM_WEBHOOK_SECRET set the bot update arrivals (bot_updates.py).
+
+The connection is a plain psycopg2 connection in autocommit mode watched with
+loop.add_reader, so notifications are handled on the event loop without a
+thread. If it drops, every subscriber's on_reset runs (they may have missed
+messages) and the listener reconnects. Nothing else is sent on it: writers
+NOTIFY from their own transaction, so delivery waits for the commit.
+"""
+import asyncio
+import logging
+
+from sqlalchemy.engine import make_url
+
+from database import DATABASE_URL
+
+RECONNECT_SECONDS = 5
+# NOTIFY payloads must be shorter than 8000 bytes
+MAX_PAYLOAD = 7999
+
+
+class PgListener:
+    def __init__(self, database_url: str):
+        self.dsn = make_url(database_url).set(drivername="postgresql").render_as_string(hide_password=False)
+        self.listening = False
+        self._handlers: dict[str, callable] = {}
+        self._resets: list[callable] = []
+        self._conn = None
+        self._task: asyncio.Task | None = None
+
+    def subscribe(self, channel: str, on_message, on_reset=None):
+        """Call on_message(payload) for each notification on `channel`; subscribe before start()"""
+        self._handlers[channel] = on_message
+        if on_reset is not None:
+            self._resets.append(on_reset)
+
+    async def start(self):
+        """Start listening if anything subscribed; a no-op when already started"""
+        if self._handlers and self._task is None:
+            self._task = asyncio.create_task(self._listen_forever())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _dispatch(self):
+        while self._conn.notifies:
+            note = self._conn.notifies.pop(0)
+            handler = self._handlers.get(note.channel)
+            if handler is not None:
+                try:
+                    handler(note.payload)
+                except Exception:
+                    logging.exception(f"pg_listener: handler for {note.channel} failed")
+
+    def _reset(self):
+        for on_reset in self._resets:
+            on_reset()
+
+    async def _listen_forever(self):
+        while True:
+            try:
+                await self._listen()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logging.warning(f"pg_listener: connection failed ({exc}), retrying in {RECONNECT_SECONDS}s")
+            self.listening = False
+            self._conn = None
+            self._reset()
+            await asyncio.sleep(RECONNECT_SECONDS)
+
+    async def _listen(self):
+        import psycopg2
+        from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+        loop = asyncio.get_running_loop()
+        conn = await loop.run_in_executor(
+            None, lambda: psycopg2.connect(self.dsn, keepalives=1, keepalives_idle=30, keepalives_interval=10, keepalives_count=3)
+        )
+        conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        # taken now: fileno() fails once libpq has dropped a broken connection
+        fd = conn.fileno()
+        lost = loop.create_future()
+
+        def readable():
+            try:
+                conn.poll()
+            except Exception as exc:
+                if not lost.done():
+                    lost.set_exception(exc)
+                return
+            self._dispatch()
+
+        try:
+            with conn.cursor() as cur:
+                for channel in self._handlers:
+                    cur.execute(f"LISTEN {channel}")
+            self._conn = conn
+            self.listening = True
+            # anything sent before LISTEN took effect was missed
+            self._reset()
+            loop.add_reader(fd, readable)
+            try:
+                await lost
+            finally:
+                loop.remove_reader(fd)
+        finally:
+            conn.close()
+
+
+pg_listener = PgListener(DATABASE_URL)
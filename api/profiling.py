@@ -0,0 +1,272 @@
+"""
+On-demand request profiling and slow-query plan capture, for ADMIN_TOKEN holders
+
+Request profiling: a request carrying `X-Profile: text|html|speedscope` (or
+`?profile=...`) and a matching `X-Admin-Token` header is run under a
+pyinstrument sampling profiler, and the profile replaces the response body.
+The original status is kept in X-Profiled-Status and a Server-Timing header
+reports the SQL statements the request ran and their total time, so the
+stacks can be read as SQL vs. ORM hydration vs. Pydantic vs. JSON encoding.
+pyinstrument samples the event loop thread only: with DB_MODE=sync the
+session work done in the threadpool shows up as awaiting it.
+
+Slow queries: with SLOW_QUERY_MS > 0 every statement that took at least that
+long has its plan captured in the background on a separate connection, into a
+ring of the last SLOW_QUERY_LOG_SIZE per process (GET /api/admin/slow-queries).
+Plain SELECTs are re-run under EXPLAIN (ANALYZE, BUFFERS); anything else, and
+a SELECT that locks rows, writes (SELECT INTO) or calls a function with side
+effects (pg_notify, advisory locks, nextval, ...), only gets EXPLAIN, since
+ANALYZE executes it and a rollback does not undo those. Either way the
+transaction is rolled back. A statement is explained at most once per
+EXPLAIN_COOLDOWN_SECONDS and at most MAX_PENDING_EXPLAINS run at a time.
+
+Without ADMIN_TOKEN and SLOW_QUERY_MS nothing is hooked in; with them, a
+request that does not ask for a profile costs one header scan, and a
+statement two clock reads.
+"""
+import asyncio
+import hmac
+import logging
+import os
+import re
+import time
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from urllib.parse import parse_qs
+
+from pyinstrument import Profiler
+from pyinstrument.renderers import SpeedscopeRenderer
+from sqlalchemy import event
+from starlette.concurrency import run_in_threadpool
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN") or None
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.001"))
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))
+SLOW_QUERY_LOG_SIZE = int(os.getenv("SLOW_QUERY_LOG_SIZE", "50"))
+EXPLAIN_COOLDOWN_SECONDS = 60
+MAX_PENDING_EXPLAINS = 2
+EXPLAIN_TIMEOUT_MS = 30_000
+MAX_PARAMETERS_LENGTH = 1000
+
+PROFILE_FORMATS = {
+    "text": "text/plain; charset=utf-8",
+    "html": "text/html; charset=utf-8",
+    "speedscope": "application/json",
+}
+
+# a SELECT that takes no row locks, writes nothing and calls no function with
+# side effects is safe to run a second time
+ANALYZABLE = re.compile(r"^\s*SELECT\b", re.IGNORECASE)
+LOCKING = re.compile(r"\bFOR\s+(?:NO\s+KEY\s+)?(?:UPDATE|SHARE|KEY\s+SHARE)\b", re.IGNORECASE)
+WRITING = re.compile(r"\bINTO\b", re.IGNORECASE)
+SIDE_EFFECT_FUNCTIONS = re.compile(
+    r"\b(?:pg_notify|pg_(?:try_)?advisory_\w+|nextval|setval|pg_sleep\w*|set_config|pg_cancel_backend"
+    r"|pg_terminate_backend|pg_current_xact_id|txid_current|pg_logical_emit_message|rebuild_order_rollups)\s*\(",
+    re.IGNORECASE,
+)
+
+# [statements, seconds] of the request being profiled
+request_sql: ContextVar[list | None] = ContextVar("request_sql", default=None)
+
+
+def analyzable(statement: str) -> bool:
+    """Whether running `statement` again under EXPLAIN ANALYZE has no effect beyond the rolled back transaction"""
+    return (
+        bool(ANALYZABLE.match(statement))
+        and not LOCKING.search(statement)
+        and not WRITING.search(statement)
+        and not SIDE_EFFECT_FUNCTIONS.search(statement)
+    )
+
+
+def is_admin(token: str | None) -> bool:
+    return ADMIN_TOKEN is not None and token is not None and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+
+class SlowQueryLog:
+    """Ring buffer of recent slow statements and their plans"""
+
+    def __init__(self, threshold_ms: float = SLOW_QUERY_MS, size: int = SLOW_QUERY_LOG_SIZE):
+        self.threshold = threshold_ms / 1000
+        self.entries: deque[dict] = deque(maxlen=size)
+        self.skipped = 0
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._pending: set[str] = set()
+        self._explained: dict[str, float] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold > 0
+
+    def start(self):
+        """Remember the event loop the EXPLAINs run on; call from startup"""
+        self._loop = asyncio.get_running_loop()
+
+    def observe(self, engine, database: str, statement: str, parameters, seconds: float):
+        """Called after each statement, from the loop or a threadpool thread"""
+        if seconds < self.threshold or self._loop is None:
+            return
+        now = time.monotonic()
+        if (
+            statement in self._pending
+            or len(self._pending) >= MAX_PENDING_EXPLAINS
+            or now - self._explained.get(statement, -EXPLAIN_COOLDOWN_SECONDS) < EXPLAIN_COOLDOWN_SECONDS
+        ):
+            self.skipped += 1
+            return
+        self._pending.add(statement)
+        self._explained[statement] = now
+        entry = {
+            "captured_at": datetime.now(timezone.utc).isoformat(),
+            "database": database,
+            "duration_ms": round(seconds * 1000, 2),
+            "statement": statement,
+            "parameters": repr(parameters)[:MAX_PARAMETERS_LENGTH],
+            "analyzed": analyzable(statement),
+        }
+        self._loop.call_soon_threadsafe(lambda: asyncio.ensure_future(self._explain(engine, entry, parameters)))
+
+    async def _explain(self, engine, entry: dict, parameters):
+        options = "(ANALYZE, BUFFERS) " if entry["analyzed"] else ""
+        sql = f"EXPLAIN {options}{entry['statement']}"
+        try:
+            if hasattr(engine, "sync_engine"):
+                async with engine.connect() as conn:
+                    conn = await conn.execution_options(slow_query_log=False)
+                    await conn.exec_driver_sql(f"SET LOCAL statement_timeout = {EXPLAIN_TIMEOUT_MS}")
+                    plan = (await conn.exec_driver_sql(sql, parameters)).scalars().all()
+            else:
+                def explain():
+                    with engine.connect() as conn:
+                        conn = conn.execution_options(slow_query_log=False)
+                        conn.exec_driver_sql(f"SET LOCAL statement_timeout = {EXPLAIN_TIMEOUT_MS}")
+                        return conn.exec_driver_sql(sql, parameters).scalars().all()
+                plan = await run_in_threadpool(explain)
+            entry["plan"] = "\n".join(plan)
+        except Exception as exc:
+            entry["plan"] = None
+            entry["error"] = str(exc).splitlines()[0]
+        finally:
+            self._pending.discard(entry["statement"])
+        self.entries.append(entry)
+        logging.info(f"slow query: {entry['duration_ms']}ms on {entry['database']}, plan captured")
+
+    def report(self) -> dict:
+        return {
+            "threshold_ms": self.threshold * 1000,
+            "size": self.entries.maxlen,
+            "skipped": self.skipped,
+            "entries": list(reversed(self.entries)),
+        }
+
+
+slow_queries = SlowQueryLog()
+
+
+def watch_engine(engine, database: str):
+    """Hook statement timing for profiled requests and the slow query log"""
+    if ADMIN_TOKEN is None and not slow_queries.enabled:
+        return
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def start_timer(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._profiling_start = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def record_statement(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "_profiling_start", None)
+        if start is None:
+            return
+        seconds = time.perf_counter() - start
+        stats = request_sql.get()
+        if stats is not None:
+            stats[0] += 1
+            stats[1] += seconds
+        # batches and server-side cursors cannot be replayed as one EXPLAIN
+        options = context.execution_options
+        if (
+            slow_queries.enabled and not executemany
+            and options.get("slow_query_log", True) and not options.get("stream_results")
+        ):
+            slow_queries.observe(engine, database, statement, parameters, seconds)
+
+
+def requested_format(scope) -> str | None:
+    """The profile format a request asks for, None when it does not"""
+    for name, value in scope["headers"]:
+        if name == b"x-profile":
+            return value.decode("latin-1").strip().lower() or "text"
+    if b"profile=" in scope["query_string"]:
+        values = parse_qs(scope["query_string"].decode("latin-1")).get("profile")
+        if values:
+            return values[0].lower()
+    return None
+
+
+class ProfilingMiddleware:
+    """Answer profiling requests from ADMIN_TOKEN holders with the profile"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or ADMIN_TOKEN is None:
+            return await self.app(scope, receive, send)
+        profile_format = requested_format(scope)
+        if profile_format is None:
+            return await self.app(scope, receive, send)
+
+        token = dict(scope["headers"]).get(b"x-admin-token")
+        if not is_admin(token.decode("latin-1") if token else None):
+            return await self.respond(send, 403, b'{"detail":"Invalid admin token"}', "application/json")
+        if profile_format not in PROFILE_FORMATS:
+            detail = f'{{"detail":"X-Profile must be one of {", ".join(PROFILE_FORMATS)}"}}'
+            return await self.respond(send, 400, detail.encode(), "application/json")
+
+        status = 500
+
+        async def discard_body(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+
+        stats = [0, 0.0]
+        reset = request_sql.set(stats)
+        profiler = Profiler(interval=PROFILE_INTERVAL, async_mode="enabled")
+        start = time.perf_counter()
+        profiler.start()
+        try:
+            await self.app(scope, receive, discard_body)
+        finally:
+            profiler.stop()
+            request_sql.reset(reset)
+        elapsed = time.perf_counter() - start
+
+        if profile_format == "html":
+            body = profiler.output_html()
+        elif profile_format == "speedscope":
+            body = profiler.output(SpeedscopeRenderer())
+        else:
+            body = profiler.output_text(unicode=True, color=False, show_all=False)
+        logging.info(
+            f"profiled {scope['method']} {scope['path']}: {elapsed * 1000:.1f}ms, "
+            f"{stats[0]} statements in {stats[1] * 1000:.1f}ms"
+        )
+        timing = f'total;dur={elapsed * 1000:.1f}, sql;dur={stats[1] * 1000:.1f};desc="{stats[0]} statements"'
+        await self.respond(send, 200, body.encode(), PROFILE_FORMATS[profile_format], [
+            (b"x-profiled-status", str(status).encode()),
+            (b"server-timing", timing.encode()),
+            (b"cache-control", b"no-store"),
+        ])
+
+    @staticmethod
+    async def respond(send, status: int, body: bytes, content_type: str, headers=()):
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", content_type.encode()), (b"content-length", str(len(body)).encode()), *headers],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,99 @@
+"""
+Reminder schedule maintenance for the order_reminders table
+
+Every open order has one row per configured reminder offset (see
+settings.reminder_offsets); the rows are regenerated whenever an order is
+written and reconciled for all open orders at startup.
+"""
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import Interval, Select, String, case, column, delete, func, literal_column, select, true, values
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from models import Order, OrderReminder
+from settings import reminder_offsets
+
+# Inline literals so Postgres can match the partial indexes in prepared plans
+OPEN_ORDER = Order.status.not_in([literal_column("'delivered'"), literal_column("'cancelled'")])
+
+# A reminder is due once fire_at is reached and is dropped if it could not be
+# sent within REMINDER_WINDOW of it.
+REMINDER_WINDOW = timedelta(minutes=15)
+# claims may run this far ahead of fire_at to absorb clock skew with the bot
+REMINDER_LOOKAHEAD = timedelta(minutes=1)
+CLOSED_STATUSES = ("delivered", "cancelled")
+# pg_advisory_xact_lock key serializing reconcile_reminders across API workers
+RECONCILE_LOCK = 7_301_001
+
+def reminder_upsert(rows: list[dict] | Select):
+    """INSERT order_reminders rows; an existing row whose fire_at moved is reset to unsent"""
+    if isinstance(rows, Select):
+        stmt = pg_insert(OrderReminder).from_select(["order_id", "reminder_type", "fire_at"], rows)
+    else:
+        stmt = pg_insert(OrderReminder).values(rows)
+    moved = stmt.excluded.fire_at != OrderReminder.fire_at
+    return stmt.on_conflict_do_update(
+        index_elements=[OrderReminder.order_id, OrderReminder.reminder_type],
+        set_={
+            "fire_at": stmt.excluded.fire_at,
+            "sent_at": case((moved, None), else_=OrderReminder.sent_at),
+            "claimed_by": case((moved, None), else_=OrderReminder.claimed_by),
+            "claim_expires_at": case((moved, None), else_=OrderReminder.claim_expires_at),
+        },
+        where=moved,
+    )
+
+def sync_order_reminders(session, order: Order):
+    """Regenerate one order's reminder rows after it was created or changed
+
+    Reminders already past their send window (a deadline set or moved to
+    less than an offset away) are not created, and unsent rows left over for
+    them are dropped rather than fired at their old time.
+    """
+    if order.status in CLOSED_STATUSES:
+        session.execute(delete(OrderReminder).where(OrderReminder.order_id == order.id, OrderReminder.sent_at.is_(None)))
+        return
+    too_late = datetime.utcnow() - REMINDER_WINDOW
+    rows = [
+        {"order_id": order.id, "reminder_type": reminder_type, "fire_at": order.deadline_at - offset}
+        for reminder_type, offset in reminder_offsets().items()
+        if order.deadline_at - offset > too_late
+    ]
+    if rows:
+        session.execute(reminder_upsert(rows))
+    session.execute(delete(OrderReminder).where(
+        OrderReminder.order_id == order.id,
+        OrderReminder.reminder_type.not_in([row["reminder_type"] for row in rows]),
+        OrderReminder.sent_at.is_(None),
+    ))
+
+def pending_reminder_rows(orders, offsets: dict[str, timedelta]) -> Select:
+    """(order_id, reminder_type, fire_at) for every offset of `orders` (a selectable
+    with id and deadline_at), leaving out reminders already past their send window"""
+    offset_rows = values(
+        column("reminder_type", String), column("offset", Interval), name="offsets"
+    ).data(list(offsets.items()))
+    fire_at = orders.c.deadline_at - offset_rows.c.offset
+    return (
+        select(orders.c.id, offset_rows.c.reminder_type, fire_at)
+        .select_from(orders.join(offset_rows, true()))
+        .where(fire_at > datetime.utcnow() - REMINDER_WINDOW)
+    )
+
+def reconcile_reminders(session):
+    """Bring every open order's reminder rows in line with the configured offsets.
+
+    Runs at startup so adding or removing an offset in settings.yaml takes
+    effect without a schema change. Workers starting together take turns.
+    """
+    session.execute(select(func.pg_advisory_xact_lock(RECONCILE_LOCK)))
+    offsets = reminder_offsets()
+    open_orders = select(Order.id, Order.deadline_at).where(OPEN_ORDER).subquery()
+    session.execute(reminder_upsert(pending_reminder_rows(open_orders, offsets)))
+    removed = session.execute(delete(OrderReminder).where(
+        OrderReminder.reminder_type.not_in(list(offsets)),
+        OrderReminder.sent_at.is_(None),
+    )).rowcount
+    session.commit()
+    logging.info(f"reconcile_reminders: offsets={list(offsets)}, removed {removed} pending reminders of dropped offsets")
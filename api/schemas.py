@@ -0,0 +1,136 @@
+"""
+Pydantic request/response schemas
+"""
+from datetime import date, datetime, timezone
+from typing import Annotated
+
+from pydantic import AfterValidator, BaseModel, Field
+
+
+def naive_utc(value: datetime) -> datetime:
+    """The columns are TIMESTAMP WITHOUT TIME ZONE in UTC: convert aware values, keep naive ones"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+# a datetime from a client, e.g. toISOString()'s "...Z", ready to bind
+UtcDateTime = Annotated[datetime, AfterValidator(naive_utc)]
+
+
+class OrderCreate(BaseModel):
+    customer_name: str = Field(min_length=1, max_length=255)
+    source_lang: str = Field(min_length=1, max_length=10)
+    target_lang: str = Field(min_length=1, max_length=10)
+    word_count: int | None = None
+    topic: str | None = None
+    deadline_at: UtcDateTime
+    telegram_user_id: int | None = None
+
+
+class OrderUpdate(BaseModel):
+    customer_name: str | None = None
+    source_lang: str | None = None
+    target_lang: str | None = None
+    word_count: int | None = None
+    topic: str | None = None
+    deadline_at: UtcDateTime | None = None
+    status: str | None = None
+
+
+class OrderResponse(BaseModel):
+    id: int
+    customer_name: str
+    source_lang: str
+    target_lang: str
+    word_count: int | None
+    topic: str | None
+    deadline_at: datetime
+    status: str
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class OrderPage(BaseModel):
+    items: list[OrderResponse]
+    next_cursor: str | None = None
+
+
+class OrderSearchHit(OrderResponse):
+    rank: float
+    # topic fragments with matches wrapped in «»
+    snippet: str
+
+
+class OrderSearchPage(BaseModel):
+    items: list[OrderSearchHit]
+    next_cursor: str | None = None
+
+
+class OrderChanges(BaseModel):
+    changed: list[OrderResponse]
+    deleted: list[int]
+    next_since: str
+    has_more: bool
+
+
+class ReminderClaim(BaseModel):
+    worker_id: str = Field(..., max_length=64)
+    limit: int = Field(100, ge=1, le=1000)
+    lease_seconds: int = Field(300, ge=10, le=3600)
+
+
+class ReminderKey(BaseModel):
+    """One reminder of an order; an order has one per configured reminder type"""
+    order_id: int
+    reminder_type: str = Field(..., max_length=10)
+
+
+class ReminderAck(BaseModel):
+    worker_id: str = Field(..., max_length=64)
+    sent: list[ReminderKey] = []
+    failed: list[ReminderKey] = []
+
+
+class BotUpdateClaim(BaseModel):
+    worker_id: str = Field(..., max_length=64)
+    limit: int = Field(10, ge=1, le=100)
+    lease_seconds: int = Field(60, ge=10, le=3600)
+    wait_seconds: float = Field(0, ge=0, le=50)
+
+
+class BotUpdateAck(BaseModel):
+    worker_id: str = Field(..., max_length=64)
+    processed: list[int] = []
+    failed: list[int] = []
+
+
+class ClientMatch(BaseModel):
+    customer_name: str
+    order_count: int
+    last_order_at: datetime | None
+    score: float
+
+
+class ClientSearch(BaseModel):
+    items: list[ClientMatch]
+
+
+class AnalyticsRow(BaseModel):
+    period: date
+    source_lang: str | None = None
+    target_lang: str | None = None
+    customer_name: str | None = None
+    orders: int
+    words: int
+
+
+class AnalyticsReport(BaseModel):
+    metric: str
+    period: str
+    start: date
+    end: date
+    rows: list[AnalyticsRow]
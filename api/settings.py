@@ -0,0 +1,77 @@
+"""
+Loader for config/settings.yaml
+The file is mounted into the container at SETTINGS_PATH; when it is missing
+(e.g. running main.py outside docker) the defaults below are used.
+"""
+import logging
+import os
+import re
+from datetime import timedelta
+from functools import lru_cache
+from pathlib import Path
+
+import yaml
+
+SETTINGS_PATH = os.getenv(
+    "SETTINGS_PATH",
+    str(Path(__file__).resolve().parent.parent / "config" / "settings.yaml"),
+)
+
+DEFAULTS = {
+    "deadline_reminders": {
+        "enabled": True,
+        "digest_min_reminders": 3,
+        "messages": {
+            "reminder_24h": "⏰ **24 Hours Reminder**\nOrder #{order_id} for {customer_name}\nTopic: {topic}\nDeadline: {deadline}",
+            "reminder_6h": "🚨 **6 Hours Reminder**\nOrder #{order_id} for {customer_name}\nTopic: {topic}\nDeadline: {deadline}",
+            "reminder_2h": "⚠️ **2 Hours Reminder**\nOrder #{order_id} for {customer_name}\nTopic: {topic}\nDeadline: {deadline}",
+            "reminder_due": "🚨 **DEADLINE REACHED**\nOrder #{order_id} for {customer_name}\nTopic: {topic}\nDeadline: {deadline}",
+            "reminder_default": "⏰ **{reminder_type} Reminder**\nOrder #{order_id} for {customer_name}\nTopic: {topic}\nDeadline: {deadline}",
+            "digest_header": "⏰ **{reminder_type} reminders: {count} orders**",
+            "digest_line": "• #{order_id} {customer_name}: {topic} ({deadline})",
+        },
+    },
+    "web_ui": {"items_per_page": 25},
+    "system": {"max_orders_display": 50},
+}
+
+
+@lru_cache(maxsize=1)
+def load_settings() -> dict:
+    """Read settings.yaml once per process, falling back to DEFAULTS"""
+    try:
+        with open(SETTINGS_PATH, encoding="utf-8") as fh:
+            return yaml.safe_load(fh) or {}
+    except FileNotFoundError:
+        logging.warning(f"settings: {SETTINGS_PATH} not found, using defaults")
+        return {}
+
+
+def get_setting(path: str, default=None):
+    """Look up a dotted key such as 'web_ui.items_per_page'"""
+    value = load_settings()
+    fallback = DEFAULTS
+    for key in path.split("."):
+        value = value.get(key) if isinstance(value, dict) else None
+        fallback = fallback.get(key) if isinstance(fallback, dict) else None
+    if value is None:
+        return fallback if fallback is not None else default
+    return value
+
+
+def reminder_offsets() -> dict[str, timedelta]:
+    """Reminder types and how long before the deadline each fires.
+
+    Every `reminder_<type>: <hours>` entry under deadline_reminders is an
+    offset (0 disables it); `due` at the deadline itself is always present.
+    """
+    section = load_settings().get("deadline_reminders") or {}
+    offsets = {}
+    for key, hours in section.items():
+        match = re.fullmatch(r"reminder_(\w+)", key)
+        if match and isinstance(hours, (int, float)) and not isinstance(hours, bool) and hours > 0:
+            offsets[match.group(1)] = timedelta(hours=hours)
+    if not section:
+        offsets = {"24h": timedelta(hours=24), "6h": timedelta(hours=6), "2h": timedelta(hours=2)}
+    offsets["due"] = timedelta(0)
+    return dict(sorted(offsets.items(), key=lambda item: item[1], reverse=True))
@@ -0,0 +1,200 @@
+"""
+Drive API endpoints at a fixed concurrency and report latency as JSON
+
+Each scenario runs on its own: --warmup requests first (not measured), then
+--requests more from --concurrency workers, each sending its next request as
+soon as the previous one returns. Reported per scenario: throughput
+(responses per second), p50/p95/p99/max/mean latency in milliseconds and the
+number of error responses (status >= 400) and failed requests. Request
+parameters come from a random.Random(--seed), so two runs send the same
+requests in the same order.
+
+The database should have been seeded with seed.py and --rows must match, so
+update_order and the per-client lists pick ids and clients that exist.
+
+    python benchmarks/load.py --base-url http://localhost:8000 --rows 100000 --concurrency 16 -o head.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import httpx
+
+from seed import CLIENTS, LANG_PAIRS, TELEGRAM_USERS, TOPICS, client_name
+
+
+def deadline(rng: random.Random) -> str:
+    return (datetime.utcnow() + timedelta(hours=rng.randint(1, 30 * 24))).isoformat(timespec="seconds")
+
+
+def pick_client(rng: random.Random) -> str:
+    # same skew as the seeded data
+    return client_name(int(CLIENTS * rng.random() ** 3))
+
+
+def create_order(rng, ctx):
+    source_lang, target_lang = rng.choice(LANG_PAIRS)
+    return "POST", "/api/orders", {
+        "customer_name": pick_client(rng),
+        "source_lang": source_lang,
+        "target_lang": target_lang,
+        "word_count": rng.randint(100, 20_000),
+        "topic": rng.choice(TOPICS),
+        "deadline_at": deadline(rng),
+        "telegram_user_id": 1_000_000 + rng.randrange(TELEGRAM_USERS),
+    }
+
+
+def update_order(rng, ctx):
+    return "PUT", f"/api/orders/{rng.randint(1, ctx['rows'])}", {
+        "topic": f"{rng.choice(TOPICS)} (rev {rng.randint(1, 9)})",
+        "deadline_at": deadline(rng),
+    }
+
+
+def get(path):
+    return lambda rng, ctx: ("GET", path(rng, ctx) if callable(path) else path, None)
+
+
+# run in this order: reads first, then the writes that invalidate caches
+SCENARIOS = {
+    "list_orders": get("/api/orders"),
+    "list_undelivered": get("/api/orders/undelivered"),
+    "list_undelivered_client": get(lambda rng, ctx: f"/api/orders/undelivered/{pick_client(rng)}"),
+    "list_delivered": get("/api/orders/delivered"),
+    "list_delivered_client": get(lambda rng, ctx: f"/api/orders/delivered/{pick_client(rng)}"),
+    "get_order": get(lambda rng, ctx: f"/api/orders/{rng.randint(1, ctx['rows'])}"),
+    "check_reminders": get("/api/orders/check-reminders"),
+    "calendar_feed": get(lambda rng, ctx: f"/calendar/ics?token={ctx['calendar_token']}"),
+    "update_order": update_order,
+    "create_order": create_order,
+}
+
+
+def percentile(ordered: list[float], pct: float) -> float:
+    """Nearest-rank percentile of an ascending list"""
+    if not ordered:
+        return 0.0
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def summarize(latencies: list[float], errors: int, failures: int, seconds: float) -> dict:
+    ordered = sorted(latencies)
+    ms = lambda value: round(value * 1000, 3)  # noqa: E731
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "failures": failures,
+        "seconds": round(seconds, 3),
+        "throughput_rps": round(len(latencies) / seconds, 1) if seconds else 0.0,
+        "p50_ms": ms(percentile(ordered, 50)),
+        "p95_ms": ms(percentile(ordered, 95)),
+        "p99_ms": ms(percentile(ordered, 99)),
+        "max_ms": ms(ordered[-1]) if ordered else 0.0,
+        "mean_ms": ms(sum(ordered) / len(ordered)) if ordered else 0.0,
+    }
+
+
+async def run_scenario(base_url: str, name: str, ctx: dict, concurrency: int, requests: int, warmup: int, seed: int) -> dict:
+    rng = random.Random(f"{seed}:{name}")
+    plan = [SCENARIOS[name](rng, ctx) for _ in range(warmup + requests)]
+    latencies: list[float] = []
+    errors = failures = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    # a fresh client per scenario: no cookies (e.g. the replica pin) carry over
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        async def send(method, path, body, measured: bool):
+            nonlocal errors, failures
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body)
+            except httpx.HTTPError:
+                failures += measured
+                return
+            if measured:
+                latencies.append(time.perf_counter() - start)
+                errors += response.status_code >= 400
+
+        async def worker(queue, measured: bool):
+            while queue:
+                await send(*queue.pop(), measured)
+
+        for batch, measured in ((plan[:warmup], False), (plan[warmup:], True)):
+            queue = list(reversed(batch))
+            start = time.perf_counter()
+            await asyncio.gather(*(worker(queue, measured) for _ in range(concurrency)))
+            elapsed = time.perf_counter() - start
+    return summarize(latencies, errors, failures, elapsed)
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run_suite(base_url: str, rows: int, scenarios=None, concurrency: int = 16, requests: int = 1000,
+                    warmup: int = 100, seed: int = 1, calendar_token: str = "change_me", label: str | None = None) -> dict:
+    ctx = {"rows": rows, "calendar_token": calendar_token}
+    results = {}
+    for name in scenarios or SCENARIOS:
+        results[name] = await run_scenario(base_url, name, ctx, concurrency, requests, warmup, seed)
+        print(f"{name:<24} {results[name]['throughput_rps']:>8} rps  p50 {results[name]['p50_ms']:>8} ms  "
+              f"p95 {results[name]['p95_ms']:>8} ms  p99 {results[name]['p99_ms']:>8} ms  errors {results[name]['errors']}",
+              file=sys.stderr)
+    return {
+        "meta": {
+            "label": label,
+            "revision": git_revision() if label is None else None,
+            "base_url": base_url,
+            "rows": rows,
+            "concurrency": concurrency,
+            "requests": requests,
+            "warmup": warmup,
+            "seed": seed,
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "host": platform.node(),
+            "cpus": os.cpu_count(),
+        },
+        "scenarios": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API load benchmark")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--rows", type=int, required=True, help="rows seeded with seed.py")
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS), help="repeatable; default all")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=1000, help="measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--calendar-token", default=os.getenv("SECRET_CALENDAR_TOKEN", "change_me"))
+    parser.add_argument("--label", help="name for this run in the report (default: the git revision)")
+    parser.add_argument("-o", "--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_suite(
+        args.base_url, args.rows, args.scenario, args.concurrency, args.requests, args.warmup, args.seed,
+        args.calendar_token, args.label,
+    ))
+    body = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(body + "\n")
+    else:
+        print(body)
+
+
+if __name__ == "__main__":
+    main()
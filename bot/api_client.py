@@ -0,0 +1,260 @@
+"""
+Async client for the TM-Order API, shared by every bot handler
+
+One httpx.AsyncClient per bot process keeps up to API_MAX_CONNECTIONS
+keep-alive connections to the API, so a command costs a request on a warm
+connection instead of a TCP handshake, and waiting on the API never blocks
+the event loop other chats are served from.
+
+Failed calls are retried up to API_RETRIES times with exponential backoff
+(API_BACKOFF seconds, doubled each time, with jitter) when it is safe: any
+request whose connection could not be made, and idempotent requests (GET/PUT,
+except the deliver call, which records a delivery) that timed out, waited too
+long for a pooled connection or got a 502/503/504. A 429 waits for its
+Retry-After. Everything else raises ApiError.
+
+Responses come back as the dataclasses below; datetimes are naive UTC like
+the API's.
+"""
+import asyncio
+import logging
+import os
+import random
+from dataclasses import dataclass, fields
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+API_URL = os.getenv("API_URL", "http://api:8000")
+API_TIMEOUT = float(os.getenv("API_TIMEOUT", "10"))
+API_MAX_CONNECTIONS = int(os.getenv("API_MAX_CONNECTIONS", "20"))
+API_RETRIES = int(os.getenv("API_RETRIES", "3"))
+API_BACKOFF = float(os.getenv("API_BACKOFF", "0.2"))
+MAX_RETRY_AFTER = 30.0
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE"}
+RETRY_STATUSES = {502, 503, 504}
+
+
+def parse_datetime(value: str | None) -> datetime | None:
+    if value is None:
+        return None
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+class ApiModel:
+    """from_json() for the dataclasses below: known fields only, *_at parsed"""
+
+    @classmethod
+    def from_json(cls, data: dict):
+        values = {}
+        for field in fields(cls):
+            if field.name not in data:
+                continue
+            value = data[field.name]
+            values[field.name] = parse_datetime(value) if field.name.endswith('_at') else value
+        return cls(**values)
+
+
+@dataclass(frozen=True, slots=True)
+class Order(ApiModel):
+    id: int
+    customer_name: str
+    source_lang: str
+    target_lang: str
+    deadline_at: datetime
+    status: str
+    created_at: datetime
+    updated_at: datetime
+    word_count: int | None = None
+    topic: str | None = None
+
+
+@dataclass(frozen=True, slots=True)
+class OrderSearchHit(ApiModel):
+    id: int
+    customer_name: str
+    source_lang: str
+    target_lang: str
+    deadline_at: datetime
+    status: str
+    created_at: datetime
+    updated_at: datetime
+    snippet: str
+    rank: float
+    word_count: int | None = None
+    topic: str | None = None
+
+
+@dataclass(frozen=True, slots=True)
+class ClientMatch(ApiModel):
+    customer_name: str
+    order_count: int
+    last_order_at: datetime | None
+    score: float
+
+
+@dataclass(frozen=True, slots=True)
+class Page:
+    items: list
+    next_cursor: str | None
+
+
+class ApiError(Exception):
+    """The API answered with an error status, or could not be reached"""
+
+    def __init__(self, status: int | None, detail: str):
+        super().__init__(f"HTTP {status}: {detail}" if status else detail)
+        self.status = status
+        self.detail = detail
+
+
+class ApiClient:
+    def __init__(self, base_url: str = API_URL, timeout: float = API_TIMEOUT,
+                 max_connections: int = API_MAX_CONNECTIONS, retries: int = API_RETRIES,
+                 backoff: float = API_BACKOFF, transport: httpx.AsyncBaseTransport | None = None):
+        self.retries = retries
+        self.backoff = backoff
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=httpx.Timeout(timeout),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            transport=transport,
+        )
+
+    async def close(self):
+        await self._client.aclose()
+
+    async def request(self, method: str, path: str, idempotent: bool | None = None, **kwargs) -> httpx.Response:
+        """Send with retries; raises ApiError for error statuses and unreachable APIs
+
+        `idempotent` overrides what the method implies, for calls whose
+        repetition the API would not answer the same way.
+        """
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        for attempt in range(self.retries + 1):
+            last = attempt == self.retries
+            try:
+                response = await self._client.request(method, path, **kwargs)
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                # no connection, so nothing was sent: safe to resend whatever the method
+                if last:
+                    raise ApiError(None, f"{method} {path} failed: {e!r}") from e
+            except httpx.TransportError as e:
+                if last or not idempotent:
+                    raise ApiError(None, f"{method} {path} failed: {e!r}") from e
+            else:
+                if response.status_code == 429 and not last:
+                    await asyncio.sleep(self.retry_after(response, attempt))
+                    continue
+                if response.status_code in RETRY_STATUSES and idempotent and not last:
+                    pass
+                elif response.is_error:
+                    raise ApiError(response.status_code, self.error_detail(response))
+                else:
+                    return response
+            logger.warning(f"API {method} {path}: attempt {attempt + 1} failed, retrying")
+            await asyncio.sleep(self.delay(attempt))
+        raise AssertionError("unreachable")
+
+    def delay(self, attempt: int) -> float:
+        return self.backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+
+    def retry_after(self, response: httpx.Response, attempt: int) -> float:
+        try:
+            return min(float(response.headers['retry-after']), MAX_RETRY_AFTER)
+        except (KeyError, ValueError):
+            return self.delay(attempt)
+
+    @staticmethod
+    def error_detail(response: httpx.Response) -> str:
+        try:
+            detail = response.json().get('detail')
+        except ValueError:
+            detail = None
+        return str(detail) if detail else response.text[:200]
+
+    def stream(self, method: str, path: str, **kwargs):
+        """Streaming request (no retries) on the shared pool, e.g. for SSE"""
+        return self._client.stream(method, path, **kwargs)
+
+    async def _page(self, path: str, model, params: dict) -> Page:
+        data = (await self.request("GET", path, params={k: v for k, v in params.items() if v is not None})).json()
+        return Page([model.from_json(item) for item in data['items']], data.get('next_cursor'))
+
+    # orders
+
+    async def get_order(self, order_id: int) -> Order:
+        return Order.from_json((await self.request("GET", f"/api/orders/{order_id}")).json())
+
+    async def create_order(self, order: dict) -> Order:
+        return Order.from_json((await self.request("POST", "/api/orders", json=order)).json())
+
+    async def update_order(self, order_id: int, changes: dict) -> Order:
+        return Order.from_json((await self.request("PUT", f"/api/orders/{order_id}", json=changes)).json())
+
+    async def deliver_order(self, order_id: int) -> Order:
+        # stamps delivered_at and publishes an event, and a repeat is a 400
+        # "already delivered": resending after a timeout could report a
+        # delivery that went through as failed
+        response = await self.request("PUT", f"/api/orders/{order_id}/deliver", idempotent=False)
+        return Order.from_json(response.json())
+
+    async def undelivered(self, client_name: str | None = None, cursor: str | None = None, limit: int | None = None) -> Page:
+        path = f"/api/orders/undelivered/{quote(client_name, safe='')}" if client_name else "/api/orders/undelivered"
+        return await self._page(path, Order, {'cursor': cursor, 'limit': limit})
+
+    async def delivered(self, client_name: str | None = None, cursor: str | None = None, limit: int | None = None) -> Page:
+        path = f"/api/orders/delivered/{quote(client_name, safe='')}" if client_name else "/api/orders/delivered"
+        return await self._page(path, Order, {'cursor': cursor, 'limit': limit})
+
+    async def search_orders(self, query: str, limit: int | None = None, cursor: str | None = None) -> Page:
+        return await self._page("/api/orders/search", OrderSearchHit, {'q': query, 'limit': limit, 'cursor': cursor})
+
+    async def search_clients(self, query: str, limit: int = 10, timeout: float | None = None) -> list[ClientMatch]:
+        kwargs = {'timeout': timeout} if timeout is not None else {}
+        response = await self.request("GET", "/api/clients/search", params={'q': query, 'limit': limit}, **kwargs)
+        return [ClientMatch.from_json(item) for item in response.json()['items']]
+
+    async def bot_settings(self) -> dict:
+        return (await self.request("GET", "/api/bot/settings")).json()
+
+    # webhook updates
+
+    async def claim_updates(self, worker_id: str, limit: int, lease_seconds: int, wait_seconds: float = 0) -> list[dict]:
+        response = await self.request("POST", "/api/bot/updates/claim", json={
+            "worker_id": worker_id, "limit": limit, "lease_seconds": lease_seconds, "wait_seconds": wait_seconds,
+        }, timeout=self._client.timeout.read + wait_seconds)
+        return response.json()
+
+    async def ack_updates(self, worker_id: str, processed: list[int], failed: list[int]) -> dict:
+        response = await self.request("POST", "/api/bot/updates/ack", json={
+            "worker_id": worker_id, "processed": processed, "failed": failed,
+        })
+        return response.json()
+
+    # reminders
+
+    async def reminder_offsets(self) -> dict[str, float]:
+        return (await self.request("GET", "/api/reminders/offsets")).json()
+
+    async def claim_reminders(self, worker_id: str, limit: int, lease_seconds: int) -> list[dict]:
+        response = await self.request("POST", "/api/reminders/claim", json={
+            "worker_id": worker_id, "limit": limit, "lease_seconds": lease_seconds,
+        })
+        return response.json()
+
+    async def ack_reminders(self, worker_id: str, sent: list[dict], failed: list[dict]) -> dict:
+        """`sent` and `failed` hold {order_id, reminder_type} keys"""
+        response = await self.request("POST", "/api/reminders/ack", json={"worker_id": worker_id, "sent": sent, "failed": failed})
+        return response.json()
+
+
+api = ApiClient()
@@ -5,13 +5,25 @@ Handles mini-app integration and deadline reminders
 import os
 import logging
 import asyncio
-from datetime import datetime
-from telegram import Update, WebAppInfo, KeyboardButton, ReplyKeyboardMarkup
-from telegram.ext import Application, CommandHandler, ContextTypes, ConversationHandler, MessageHandler, filters, TypeHandler
-import requests
-import schedule
-import time
-from threading import Thread
+import json
+from datetime import datetime, timedelta
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from telegram import (
+    InlineKeyboardButton, InlineKeyboardMarkup, InlineQueryResultArticle, InputTextMessageContent, KeyboardButton,
+    ReplyKeyboardMarkup, Update, WebAppInfo,
+)
+from telegram.ext import (
+    Application, CallbackQueryHandler, CommandHandler, ContextTypes, ConversationHandler, InlineQueryHandler, MessageHandler,
+    TypeHandler, filters,
+)
+import httpx
+import socket
+
+from api_client import ApiError, Order, api
+from scheduler import DeadlineScheduler
+from send_queue import send_queue
+from webhook import ALLOWED_UPDATES, BOT_MODE, TELEGRAM_API_URL, run_webhook
 
 # Configure logging
 logging.basicConfig(
@@ -22,8 +34,21 @@ logger = logging.getLogger(__name__)
 
 # Environment variables
 TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
-API_URL = os.getenv("API_URL", "http://api:8000")
-WEBHOOK_URL = os.getenv("TELEGRAM_WEBHOOK_URL", "https://localhost/bot/webhook")
+
+# Client search backs keystroke-level inline queries, so fail fast
+CLIENT_SEARCH_TIMEOUT = 2.0
+# orders shown by /search
+SEARCH_RESULTS = 10
+
+# Listings show one page per message with Prev/Next buttons. Telegram rejects
+# messages over 4096 characters; with names and topics cut to
+# LISTING_FIELD_LENGTH a line stays under 130, so LISTING_MAX_PAGE lines fit.
+LISTING_MAX_PAGE = 30
+LISTING_FIELD_LENGTH = 40
+# used while system.max_orders_display cannot be fetched
+DEFAULT_LISTING_PAGE = 10
+# listings per chat whose buttons still work; older ones expire
+LISTINGS_PER_CHAT = 20
 
 # Conversation states
 ORDER_CUSTOMER, ORDER_TOPIC, ORDER_DEADLINE, ORDER_SRC_LANG, ORDER_TGT_LANG, ORDER_WORDS = range(6)
@@ -44,6 +69,8 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "/undelivered_client <name> - List undelivered orders for specific client\n"
         "/delivered - List all delivered orders\n"
         "/delivered_client <name> - List delivered orders for specific client\n"
+        "@<bot> <name> - Search clients (inline, typo-tolerant)\n"
+        "/search <words> - Full-text search over order topics and clients\n"
         "/deliver <order_id> - Mark specific order as delivered\n"
         "/update_order <order_id> - Update order details (interactive)\n"
         "/neworder - Create a new order (interactive)\n"
@@ -58,22 +85,49 @@ async def done(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def undelivered(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """List all undelivered orders with deadlines"""
+    """List undelivered orders by deadline, one page at a time"""
+    await send_listing(update, context, 'undelivered')
+
+
+async def search_clients(query: str, limit: int = 10):
+    """Fuzzy client-name lookup via /api/clients/search"""
+    return await api.search_clients(query, limit, timeout=CLIENT_SEARCH_TIMEOUT)
+
+
+async def client_suggestions(client_name: str) -> str:
+    """'Did you mean' line for a client name that matched no orders"""
     try:
-        response = requests.get(f"{API_URL}/api/orders/undelivered")
-        response.raise_for_status()
-        orders = response.json()
-        if not orders:
-            await update.message.reply_text("📋 No undelivered orders.")
-            return
-        msg = "📋 **Undelivered Orders:**\n\n"
-        for order in orders:
-            deadline = datetime.fromisoformat(order['deadline_at'].replace('Z', '+00:00')).strftime('%Y-%m-%d %H:%M')
-            msg += f"• ID {order['id']}: {order['customer_name']} - {order['topic']} (Deadline: {deadline})\n"
-        await update.message.reply_text(msg)
+        matches = [c.customer_name for c in await search_clients(client_name, limit=3)]
+    except Exception as e:
+        logger.warning(f"Client search failed for {client_name}: {e}")
+        return ""
+    matches = [name for name in matches if name != client_name]
+    if not matches:
+        return ""
+    return "\nDid you mean: " + ", ".join(f"'{name}'" for name in matches) + "?"
+
+
+async def inline_client_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Inline mode (@bot <name>): suggest clients, picking one lists its undelivered orders"""
+    query = update.inline_query.query.strip()
+    if not query:
+        await update.inline_query.answer([], cache_time=0)
+        return
+    try:
+        clients = await search_clients(query)
     except Exception as e:
-        logger.error(f"Error fetching undelivered orders: {e}")
-        await update.message.reply_text("❌ Error fetching undelivered orders.")
+        logger.error(f"Inline client search failed for {query!r}: {e}")
+        clients = []
+    results = []
+    for i, client in enumerate(clients):
+        last_order = client.last_order_at.strftime('%Y-%m-%d') if client.last_order_at else 'n/a'
+        results.append(InlineQueryResultArticle(
+            id=str(i),
+            title=client.customer_name,
+            description=f"{client.order_count} orders, last {last_order}",
+            input_message_content=InputTextMessageContent(f"/undelivered_client {client.customer_name}"),
+        ))
+    await update.inline_query.answer(results, cache_time=10, is_personal=True)
 
 
 async def undelivered_client(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -81,42 +135,12 @@ async def undelivered_client(update: Update, context: ContextTypes.DEFAULT_TYPE)
     if not context.args:
         await update.message.reply_text("❌ Usage: /undelivered_client <client_name>")
         return
-    client_name = ' '.join(context.args)
-    try:
-        response = requests.get(f"{API_URL}/api/orders/undelivered/{client_name}")
-        response.raise_for_status()
-        orders = response.json()
-        if not orders:
-            await update.message.reply_text(f"📋 No undelivered orders for client '{client_name}'.")
-            return
-        msg = f"📋 **Undelivered Orders for {client_name}:**\n\n"
-        for order in orders:
-            deadline = datetime.fromisoformat(order['deadline_at'].replace('Z', '+00:00')).strftime('%Y-%m-%d %H:%M')
-            msg += f"• ID {order['id']}: {order['topic']} (Deadline: {deadline})\n"
-        await update.message.reply_text(msg)
-    except Exception as e:
-        logger.error(f"Error fetching undelivered orders for client {client_name}: {e}")
-        await update.message.reply_text(f"❌ Error fetching undelivered orders for client '{client_name}'.")
+    await send_listing(update, context, 'undelivered', ' '.join(context.args))
 
 
 async def delivered(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """List all delivered orders with delivery timestamps"""
-    try:
-        response = requests.get(f"{API_URL}/api/orders/delivered")
-        response.raise_for_status()
-        orders = response.json()
-        if not orders:
-            await update.message.reply_text("📋 No delivered orders.")
-            return
-        msg = "📋 **Delivered Orders:**\n\n"
-        for order in orders:
-            delivery_time = datetime.fromisoformat(order['updated_at'].replace('Z', '+00:00')).strftime('%Y-%m-%d %H:%M')
-            deadline = datetime.fromisoformat(order['deadline_at'].replace('Z', '+00:00')).strftime('%Y-%m-%d %H:%M')
-            msg += f"• ID {order['id']}: {order['customer_name']} - {order['topic']} (Delivered: {delivery_time}, Deadline: {deadline})\n"
-        await update.message.reply_text(msg)
-    except Exception as e:
-        logger.error(f"Error fetching delivered orders: {e}")
-        await update.message.reply_text("❌ Error fetching delivered orders.")
+    """List delivered orders, newest first, one page at a time"""
+    await send_listing(update, context, 'delivered')
 
 
 async def delivered_client(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -124,23 +148,147 @@ async def delivered_client(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not context.args:
         await update.message.reply_text("❌ Usage: /delivered_client <client_name>")
         return
-    client_name = ' '.join(context.args)
+    await send_listing(update, context, 'delivered', ' '.join(context.args))
+
+
+@dataclass
+class Listing:
+    """An order listing message and where its pages start"""
+    kind: str  # 'undelivered' or 'delivered'
+    client_name: str | None
+    # cursor of every page reached so far; page 0 starts without one
+    cursors: list[str | None] = field(default_factory=lambda: [None])
+    page: int = 0
+
+
+async def bot_settings() -> dict:
+    """/api/bot/settings, fetched once; empty while the API cannot be reached"""
+    global _bot_settings
+    if _bot_settings is None:
+        try:
+            _bot_settings = await api.bot_settings()
+        except Exception as e:
+            logger.warning(f"Could not fetch bot settings: {e}")
+            return {}
+    return _bot_settings
+
+_bot_settings = None
+
+async def listing_page_size() -> int:
+    """system.max_orders_display, capped so a page fits a message"""
+    settings = await bot_settings()
+    if 'max_orders_display' not in settings:
+        return DEFAULT_LISTING_PAGE
+    return max(1, min(int(settings['max_orders_display']), LISTING_MAX_PAGE))
+
+
+def shorten(value: str | None, length: int = LISTING_FIELD_LENGTH) -> str:
+    value = value or 'N/A'
+    return value if len(value) <= length else value[:length - 1] + '…'
+
+
+def render_listing(listing: Listing, page) -> tuple[str, InlineKeyboardMarkup | None]:
+    """Message text and Prev/Next buttons for one page of a listing"""
+    title = "Undelivered Orders" if listing.kind == 'undelivered' else "Delivered Orders"
+    if listing.client_name:
+        title += f" for {shorten(listing.client_name)}"
+    lines = [f"📋 **{title}** (page {listing.page + 1}):", ""]
+    for order in page.items:
+        who = "" if listing.client_name else f"{shorten(order.customer_name)} — "
+        if listing.kind == 'undelivered':
+            when = f"due {order.deadline_at:%Y-%m-%d %H:%M}"
+        else:
+            when = f"delivered {order.updated_at:%Y-%m-%d} (due {order.deadline_at:%Y-%m-%d})"
+        lines.append(f"• #{order.id} {who}{shorten(order.topic)} · {when}")
+    if not page.items:
+        lines.append("No more orders.")
+    buttons = []
+    if listing.page > 0:
+        buttons.append(InlineKeyboardButton("◀ Prev", callback_data='list:prev'))
+    if page.next_cursor:
+        buttons.append(InlineKeyboardButton("Next ▶", callback_data='list:next'))
+    return "\n".join(lines), InlineKeyboardMarkup([buttons]) if buttons else None
+
+
+async def fetch_listing_page(listing: Listing):
+    """Fetch the listing's current page and remember where the next one starts"""
+    fetch = api.undelivered if listing.kind == 'undelivered' else api.delivered
+    page = await fetch(listing.client_name, cursor=listing.cursors[listing.page], limit=await listing_page_size())
+    del listing.cursors[listing.page + 1:]
+    if page.next_cursor:
+        listing.cursors.append(page.next_cursor)
+    return page
+
+
+async def send_listing(update: Update, context: ContextTypes.DEFAULT_TYPE, kind: str, client_name: str | None = None):
+    """Reply with the first page of a listing; its buttons fetch the others"""
+    listing = Listing(kind, client_name)
+    label = f"{kind} orders" + (f" for client '{client_name}'" if client_name else "")
+    try:
+        page = await fetch_listing_page(listing)
+        if not page.items:
+            suggestions = await client_suggestions(client_name) if client_name else ""
+            await update.message.reply_text(f"📋 No {label}." + suggestions)
+            return
+        text, markup = render_listing(listing, page)
+        message = await update.message.reply_text(text, reply_markup=markup)
+    except Exception as e:
+        logger.error(f"Error fetching {label}: {e}")
+        await update.message.reply_text(f"❌ Error fetching {label}.")
+        return
+    if markup is not None:
+        listings = context.chat_data.setdefault('listings', OrderedDict())
+        listings[message.message_id] = listing
+        while len(listings) > LISTINGS_PER_CHAT:
+            listings.popitem(last=False)
+
+
+async def listing_navigation(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Prev/Next buttons under a listing: fetch that page and edit the message"""
+    query = update.callback_query
+    listing = context.chat_data.get('listings', {}).get(query.message.message_id)
+    if listing is None:
+        await query.answer("This list has expired, run the command again.")
+        return
+    if query.data == 'list:next' and listing.page + 1 < len(listing.cursors):
+        listing.page += 1
+    elif query.data == 'list:prev' and listing.page > 0:
+        listing.page -= 1
+    else:
+        await query.answer()
+        return
+    try:
+        page = await fetch_listing_page(listing)
+        text, markup = render_listing(listing, page)
+        await query.edit_message_text(text, reply_markup=markup)
+        await query.answer()
+    except Exception as e:
+        logger.error(f"Error fetching {listing.kind} orders page {listing.page + 1}: {e}")
+        await query.answer("❌ Error fetching orders.")
+
+
+async def search(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Full-text search over order topics and client names"""
+    if not context.args:
+        await update.message.reply_text(
+            "❌ Usage: /search <words>\n"
+            "Words are matched in any form (leaflet = leaflets); use \"quotes\" for a phrase and -word to exclude."
+        )
+        return
+    query = ' '.join(context.args)
     try:
-        response = requests.get(f"{API_URL}/api/orders/delivered/{client_name}")
-        response.raise_for_status()
-        orders = response.json()
+        orders = (await api.search_orders(query, limit=SEARCH_RESULTS)).items
         if not orders:
-            await update.message.reply_text(f"📋 No delivered orders for client '{client_name}'.")
+            await update.message.reply_text(f"🔍 No orders match '{query}'.")
             return
-        msg = f"📋 **Delivered Orders for {client_name}:**\n\n"
+        msg = f"🔍 Orders matching '{query}':\n\n"
         for order in orders:
-            delivery_time = datetime.fromisoformat(order['updated_at'].replace('Z', '+00:00')).strftime('%Y-%m-%d %H:%M')
-            deadline = datetime.fromisoformat(order['deadline_at'].replace('Z', '+00:00')).strftime('%Y-%m-%d %H:%M')
-            msg += f"• ID {order['id']}: {order['topic']} (Delivered: {delivery_time}, Deadline: {deadline})\n"
+            deadline = order.deadline_at.strftime('%Y-%m-%d')
+            msg += f"• ID {order.id}: {order.customer_name} - {order.snippet or 'N/A'} ({order.status}, Deadline: {deadline})\n"
         await update.message.reply_text(msg)
     except Exception as e:
-        logger.error(f"Error fetching delivered orders for client {client_name}: {e}")
-        await update.message.reply_text(f"❌ Error fetching delivered orders for client '{client_name}'.")
+        logger.error(f"Error searching orders for {query!r}: {e}")
+        await update.message.reply_text("❌ Error searching orders.")
 
 
 async def deliver(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -156,18 +304,17 @@ async def deliver(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     try:
-        response = requests.put(f"{API_URL}/api/orders/{order_id}/deliver")
-        if response.status_code == 404:
+        order = await api.deliver_order(order_id)
+        deadline = order.deadline_at.strftime('%Y-%m-%d %H:%M')
+        await update.message.reply_text(f"✅ Order {order_id} marked as delivered!\n• Client: {order.customer_name}\n• Topic: {order.topic}\n• Deadline: {deadline}")
+    except ApiError as e:
+        if e.status == 404:
             await update.message.reply_text(f"❌ Order {order_id} not found.")
-            return
-        elif response.status_code == 400:
+        elif e.status == 400:
             await update.message.reply_text(f"❌ Order {order_id} is already delivered.")
-            return
-        response.raise_for_status()
-        
-        order = response.json()
-        deadline = datetime.fromisoformat(order['deadline_at'].replace('Z', '+00:00')).strftime('%Y-%m-%d %H:%M')
-        await update.message.reply_text(f"✅ Order {order_id} marked as delivered!\n• Client: {order['customer_name']}\n• Topic: {order['topic']}\n• Deadline: {deadline}")
+        else:
+            logger.error(f"Error delivering order {order_id}: {e}")
+            await update.message.reply_text(f"❌ Error delivering order {order_id}.")
     except Exception as e:
         logger.error(f"Error delivering order {order_id}: {e}")
         await update.message.reply_text(f"❌ Error delivering order {order_id}.")
@@ -187,11 +334,9 @@ async def update_order_start(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     # Check if order exists
     try:
-        response = requests.get(f"{API_URL}/api/orders/{order_id}")
-        response.raise_for_status()
-        order = response.json()
-    except requests.exceptions.HTTPError as e:
-        if e.response.status_code == 404:
+        order = await api.get_order(order_id)
+    except ApiError as e:
+        if e.status == 404:
             await update.message.reply_text(f"❌ Order {order_id} not found.")
             return
         else:
@@ -211,9 +356,9 @@ async def update_order_start(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     await update.message.reply_text(
         f"📝 **Update Order {order_id}**\n"
-        f"• Client: {order['customer_name']}\n"
-        f"• Topic: {order['topic']}\n"
-        f"• Deadline: {datetime.fromisoformat(order['deadline_at'].replace('Z', '+00:00')).strftime('%Y-%m-%d %H:%M')}\n\n"
+        f"• Client: {order.customer_name}\n"
+        f"• Topic: {order.topic}\n"
+        f"• Deadline: {order.deadline_at.strftime('%Y-%m-%d %H:%M')}\n\n"
         f"**What would you like to update?**\n"
         f"• `customer` - Customer name\n"
         f"• `topic` - Topic/description\n"
@@ -299,27 +444,23 @@ async def handle_update_text(update: Update, context: ContextTypes.DEFAULT_TYPE)
         
         # Call API to update
         try:
-            response = requests.put(f"{API_URL}/api/orders/{order_id}", json=update_data)
-            if response.status_code == 404:
-                context.user_data.clear()
-                await update.message.reply_text(f"❌ Order {order_id} not found.")
-                return
-            response.raise_for_status()
-            
-            order = response.json()
-            deadline = datetime.fromisoformat(order['deadline_at'].replace('Z', '+00:00')).strftime('%Y-%m-%d %H:%M')
+            order = await api.update_order(order_id, update_data)
+            deadline = order.deadline_at.strftime('%Y-%m-%d %H:%M')
             
             context.user_data.clear()
             await update.message.reply_text(
                 f"✅ Order {order_id} updated successfully!\n"
-                f"• Client: {order['customer_name']}\n"
-                f"• Topic: {order['topic']}\n"
+                f"• Client: {order.customer_name}\n"
+                f"• Topic: {order.topic}\n"
                 f"• Deadline: {deadline}"
             )
             
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Error updating order {order_id}: {e}")
+        except ApiError as e:
             context.user_data.clear()
+            if e.status == 404:
+                await update.message.reply_text(f"❌ Order {order_id} not found.")
+                return
+            logger.error(f"Error updating order {order_id}: {e}")
             await update.message.reply_text(f"❌ Error updating order {order_id}.")
         except Exception as e:
             logger.error(f"Unexpected error updating order {order_id}: {e}")
@@ -347,6 +488,8 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "/undelivered_client <name> - List undelivered orders for specific client\n"
         "/delivered - List all delivered orders\n"
         "/delivered_client <name> - List delivered orders for specific client\n"
+        "@<bot> <name> - Search clients (inline, typo-tolerant)\n"
+        "/search <words> - Full-text search over order topics and clients\n"
         "/deliver <order_id> - Mark specific order as delivered\n"
         "/update_order <order_id> - Update order details (interactive)\n"
         "/neworder - Create a new order (interactive)\n\n"
@@ -432,12 +575,10 @@ async def neworder_words(update: Update, context: ContextTypes.DEFAULT_TYPE):
     }
     # Send to API
     try:
-        resp = requests.post(f"{API_URL}/api/orders", json=order)
-        if resp.status_code == 200:
-            oid = resp.json().get('id')
-            await update.message.reply_text(f"✅ Order created! ID: {oid}\nYou will get reminders before the deadline.")
-        else:
-            await update.message.reply_text(f"Error creating order: {resp.text}")
+        created = await api.create_order(order)
+        await update.message.reply_text(f"✅ Order created! ID: {created.id}\nYou will get reminders before the deadline.")
+    except ApiError as e:
+        await update.message.reply_text(f"Error creating order: {e.detail}")
     except Exception as e:
         await update.message.reply_text(f"API error: {e}")
     if 'state' in context.user_data:
@@ -499,8 +640,7 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         try:
             # Update the order via API
             update_data = {field: update.message.text}
-            response = requests.put(f"{API_URL}/api/orders/{order_id}", json=update_data)
-            response.raise_for_status()
+            await api.update_order(order_id, update_data)
             
             context.user_data.clear()
             await update.message.reply_text(f"✅ Order {order_id} updated successfully!")
@@ -508,40 +648,241 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
             logger.error(f"Error updating order: {e}")
             await update.message.reply_text("❌ Error updating order. Please try again.")
 
-def check_reminders():
-    """Background job to check for upcoming deadlines and send reminders"""
-    try:
-        response = requests.get(f"{API_URL}/api/orders/check-reminders")
-        if response.status_code == 200:
-            reminders = response.json()
-            for reminder in reminders:
-                # TODO: Send reminder message to user via Telegram
-                logger.info(f"Sending {reminder['reminder_type']} reminder for order #{reminder['id']}: {reminder['customer_name']}")
-                
-                # For now, just log the message that would be sent
-                print(f"REMINDER: {reminder['message']}")
-                
-                # Mark reminder as sent
-                requests.post(f"{API_URL}/api/orders/{reminder['id']}/mark-reminder-sent?reminder_type={reminder['reminder_type']}")
+# Identifies this bot process when leasing reminders from the API
+WORKER_ID = os.getenv("BOT_WORKER_ID", f"{socket.gethostname()}-{os.getpid()}")
+REMINDER_CLAIM_LIMIT = 100
+REMINDER_LEASE_SECONDS = 300
+# Reminders for orders without a telegram_user_id (e.g. created in the web UI) go here
+REMINDER_CHAT_ID = int(os.getenv("REMINDER_CHAT_ID") or 0) or None
+# Send queue priority per reminder type, lower first; other types come after
+REMINDER_PRIORITY = {'due': 0}
+# check_reminders runs started by the scheduler, kept referenced until done
+reminder_checks: set[asyncio.Task] = set()
+# set when a pass left reminders unsettled; sweep_reminders retries with backoff
+reminder_retry = asyncio.Event()
+REMINDER_RETRY_SECONDS = 5
+# claims this often even without timers, for leases of bot workers that died
+REMINDER_SWEEP_SECONDS = 60
+# Telegram rejects messages over 4096 UTF-16 units; longer digests are split,
+# with headroom for emoji, which count twice
+MESSAGE_LIMIT = 4000
+DEFAULT_DIGEST_HEADER = "⏰ **{reminder_type} reminders: {count} orders**"
+
+def digest_messages(header: str, reminders: list[dict]) -> list[tuple[str, list[int]]]:
+    """One digest as (text, order ids) messages, split to stay under MESSAGE_LIMIT"""
+    messages = []
+    text, ids = header, []
+    for reminder in reminders:
+        line = reminder['summary']
+        if ids and len(text) + 1 + len(line) > MESSAGE_LIMIT:
+            messages.append((text, ids))
+            text, ids = f"{header} (continued)", []
+        text += "\n" + line
+        ids.append(reminder['id'])
+    messages.append((text, ids))
+    return messages
+
+def reminder_key(order_id: int, reminder_type: str) -> dict:
+    return {'order_id': order_id, 'reminder_type': reminder_type}
+
+async def send_reminders(reminders: list[dict]) -> tuple[list[dict], list[dict]]:
+    """Queue a claimed batch for sending; returns the (sent, failed) reminder keys
+
+    A user's reminders of one type are sent as a single digest when the batch
+    has at least deadline_reminders.digest_min_reminders of them.
+    """
+    settings = await bot_settings()
+    digest_min = settings.get('reminder_digest_min', 0)
+    header = settings.get('reminder_digest_header') or DEFAULT_DIGEST_HEADER
+    failed = []
+    groups: dict[tuple[int, str], list[dict]] = {}
+    for reminder in reminders:
+        chat_id = reminder.get('telegram_user_id') or REMINDER_CHAT_ID
+        if chat_id is None:
+            logger.warning(f"No chat for the {reminder['reminder_type']} reminder of order #{reminder['id']}; set REMINDER_CHAT_ID")
+            failed.append(reminder_key(reminder['id'], reminder['reminder_type']))
+            continue
+        groups.setdefault((chat_id, reminder['reminder_type']), []).append(reminder)
+
+    sends = []
+    for (chat_id, reminder_type), group in groups.items():
+        priority = REMINDER_PRIORITY.get(reminder_type, len(REMINDER_PRIORITY))
+        if digest_min and len(group) >= digest_min and all('summary' in reminder for reminder in group):
+            logger.info(f"Sending {reminder_type} digest of {len(group)} orders to chat {chat_id}")
+            messages = digest_messages(header.format(reminder_type=reminder_type, count=len(group)), group)
         else:
-            logger.error(f"Failed to check reminders: HTTP {response.status_code}")
+            for reminder in group:
+                logger.info(f"Sending {reminder_type} reminder for order #{reminder['id']}: {reminder['customer_name']}")
+            messages = [(reminder['message'], [reminder['id']]) for reminder in group]
+        sends += [
+            (send_queue.send(chat_id, text, priority), [reminder_key(order_id, reminder_type) for order_id in ids])
+            for text, ids in messages
+        ]
+
+    results = await asyncio.gather(*(done for done, _ in sends))
+    sent = [key for (_, keys), ok in zip(sends, results) if ok for key in keys]
+    failed += [key for (_, keys), ok in zip(sends, results) if not ok for key in keys]
+    return sent, failed
+
+async def check_reminders() -> bool:
+    """Claim due reminders, send them and acknowledge each batch once Telegram confirmed it
+
+    Returns False when the pass left reminders unsettled (the claim or ack
+    failed, or reminders were released for another try), so it is retried.
+    """
+    settled = True
+    try:
+        while True:
+            try:
+                reminders = await api.claim_reminders(WORKER_ID, REMINDER_CLAIM_LIMIT, REMINDER_LEASE_SECONDS)
+            except ApiError as e:
+                logger.error(f"Failed to claim reminders: {e}")
+                return False
+            if not reminders:
+                return settled
+
+            sent, failed = await send_reminders(reminders)
+
+            # Settle the whole batch in one call; unsent reminders go back to the pool
+            ack = await api.ack_reminders(WORKER_ID, sent, failed)
+            stale = ack.get('stale')
+            if stale:
+                stale_reminders = [(key['order_id'], key['reminder_type']) for key in stale]
+                logger.warning(f"Reminder leases expired before ack for {stale_reminders}")
+            settled = settled and not failed and not stale
+
+            if len(reminders) < REMINDER_CLAIM_LIMIT:
+                return settled
     except Exception as e:
         logger.error(f"Error checking reminders: {e}")
+        return False
+
+async def run_reminder_check():
+    if not await check_reminders():
+        reminder_retry.set()
+
+async def fire_reminders(timers):
+    """Scheduler callback: a reminder offset was reached, claim and send what is due"""
+    logger.info(f"Reminder timers due: {[(order_id, reminder_type) for _, order_id, reminder_type in timers]}")
+    # in the background: a batch waiting on the send queue must not hold up the
+    # next timers, whose (possibly more urgent) reminders are claimed meanwhile
+    task = asyncio.create_task(run_reminder_check())
+    reminder_checks.add(task)
+    task.add_done_callback(reminder_checks.discard)
+
+async def sweep_reminders():
+    """Claim again outside the timers: after an unsettled pass with backoff, else every REMINDER_SWEEP_SECONDS
+
+    Timers fire once, so without this a reminder whose send failed, whose
+    claim errored or that was leased by a worker that died would wait for the
+    next restart; the API keeps it claimable for REMINDER_WINDOW.
+    """
+    backoff = REMINDER_RETRY_SECONDS
+    while True:
+        try:
+            await asyncio.wait_for(reminder_retry.wait(), REMINDER_SWEEP_SECONDS)
+            await asyncio.sleep(backoff)
+        except asyncio.TimeoutError:
+            pass
+        reminder_retry.clear()
+        if await check_reminders():
+            backoff = REMINDER_RETRY_SECONDS
+        else:
+            logger.warning(f"Reminders left unsettled, retrying in {backoff}s")
+            reminder_retry.set()
+            backoff = min(backoff * 2, REMINDER_SWEEP_SECONDS)
+
 
-def run_scheduler():
-    """Run background scheduler in separate thread"""
-    schedule.every(15).minutes.do(check_reminders)
+async def load_open_orders(scheduler: DeadlineScheduler):
+    """(Re)build the timer heap from every undelivered order"""
+    offsets = await api.reminder_offsets()
+    scheduler.offsets = {reminder_type: timedelta(hours=hours) for reminder_type, hours in offsets.items()}
+    scheduler.clear()
+    cursor = None
     while True:
-        schedule.run_pending()
-        time.sleep(60)
+        page = await api.undelivered(cursor=cursor)
+        for order in page.items:
+            scheduler.schedule_order(order)
+        cursor = page.next_cursor
+        if not cursor:
+            break
+    logger.info(f"Reminder scheduler loaded {len(scheduler)} open orders")
+
+
+async def iter_sse(lines):
+    """Yield (event_id, event_type, data) from a text/event-stream line iterator"""
+    event_id, event_type, data = None, 'message', []
+    async for line in lines:
+        if not line:
+            if data:
+                yield event_id, event_type, '\n'.join(data)
+            event_id, event_type, data = None, 'message', []
+        elif line.startswith(':'):
+            continue
+        else:
+            field, _, value = line.partition(':')
+            value = value[1:] if value.startswith(' ') else value
+            if field == 'id':
+                event_id = value
+            elif field == 'event':
+                event_type = value
+            elif field == 'data':
+                data.append(value)
+
+
+async def follow_order_stream(scheduler: DeadlineScheduler):
+    """Keep the scheduler in sync with /api/orders/stream, resuming after disconnects"""
+    last_event_id = None
+    while True:
+        try:
+            headers = {'Last-Event-ID': last_event_id} if last_event_id else {}
+            timeout = httpx.Timeout(10.0, read=None)
+            async with api.stream('GET', "/api/orders/stream", headers=headers, timeout=timeout) as response:
+                response.raise_for_status()
+                # subscribed from here on, so nothing is missed while loading
+                if last_event_id is None:
+                    await load_open_orders(scheduler)
+                async for event_id, event_type, data in iter_sse(response.aiter_lines()):
+                    last_event_id = event_id or last_event_id
+                    if event_type == 'resync':
+                        await load_open_orders(scheduler)
+                    elif event_type in ('created', 'updated', 'delivered'):
+                        scheduler.schedule_order(Order.from_json(json.loads(data)))
+        except Exception as e:
+            logger.warning(f"Order stream disconnected: {e}; reconnecting in 5s")
+            await asyncio.sleep(5)
+
+
+async def start_reminder_scheduler(application: Application):
+    """post_init hook: start the send queue, timer loop and order stream on the bot's event loop"""
+    send_queue.start(application.bot)
+    scheduler = DeadlineScheduler(fire_reminders)
+    application.bot_data['reminder_tasks'] = [
+        asyncio.create_task(scheduler.run()),
+        asyncio.create_task(follow_order_stream(scheduler)),
+        asyncio.create_task(sweep_reminders()),
+    ]
+
+async def close_api_client(application: Application):
+    """post_shutdown hook: stop sending and close the pooled API connections"""
+    await send_queue.stop()
+    await api.close()
 
 def main():
     """Start the bot"""
     if not TOKEN:
         raise ValueError("TELEGRAM_BOT_TOKEN not set")
     
-    # Create application
-    application = Application.builder().token(TOKEN).build()
+    # Create application; the reminder scheduler starts once the event loop is running
+    builder = (
+        Application.builder().token(TOKEN).concurrent_updates(True)
+        .base_url(f"{TELEGRAM_API_URL}/bot").base_file_url(f"{TELEGRAM_API_URL}/file/bot")
+        .post_init(start_reminder_scheduler).post_shutdown(close_api_client)
+    )
+    if BOT_MODE == "webhook":
+        # updates come from the API's queue instead of polling Telegram
+        builder.updater(None)
+    application = builder.build()
     
     # Add handlers
     logger.info("Registering bot command handlers...")
@@ -560,6 +901,12 @@ def main():
     logger.info("Registered /delivered command")
     application.add_handler(CommandHandler("delivered_client", delivered_client), group=1)
     logger.info("Registered /delivered_client command")
+    application.add_handler(CallbackQueryHandler(listing_navigation, pattern=r'^list:(prev|next)$'), group=1)
+    logger.info("Registered listing navigation buttons")
+    application.add_handler(InlineQueryHandler(inline_client_search), group=1)
+    logger.info("Registered inline client search")
+    application.add_handler(CommandHandler("search", search), group=1)
+    logger.info("Registered /search command")
     application.add_handler(CommandHandler("deliver", deliver), group=1)
     logger.info("Registered /deliver command")
     application.add_handler(CommandHandler("update_order", update_order_start), group=1)
@@ -579,14 +926,13 @@ def main():
         logging.info(f"Catchall text: {update.message.text}")
     application.add_handler(MessageHandler(filters.TEXT, catchall_text), group=1)
     
-    # Start scheduler in background thread
-    scheduler_thread = Thread(target=run_scheduler, daemon=True)
-    scheduler_thread.start()
-    
     logger.info("Bot started successfully with all addon commands registered")
     
     # Run bot
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if BOT_MODE == "webhook":
+        asyncio.run(run_webhook(application, WORKER_ID))
+    else:
+        application.run_polling(allowed_updates=ALLOWED_UPDATES)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,102 @@
+"""
+Deadline timer scheduler for reminder delivery
+Keeps the next fire time of every reminder for every open order in a heap
+and sleeps on the asyncio loop until the earliest one is due. Orders are
+loaded once at startup and then kept current from the API's order event
+stream, so nothing is polled while no reminder is due.
+"""
+import asyncio
+import heapq
+import logging
+from datetime import datetime, timedelta
+
+from api_client import Order
+
+logger = logging.getLogger(__name__)
+
+# Used until the configured offsets are fetched from /api/reminders/offsets
+REMINDER_OFFSETS = {
+    "24h": timedelta(hours=24),
+    "6h": timedelta(hours=6),
+    "2h": timedelta(hours=2),
+    "due": timedelta(0),
+}
+# The API still accepts a reminder this long after its exact offset
+REMINDER_GRACE = timedelta(minutes=15)
+CLOSED_STATUSES = ("delivered", "cancelled")
+
+
+class DeadlineScheduler:
+    def __init__(self, on_due, offsets: dict[str, timedelta] = REMINDER_OFFSETS):
+        """`on_due(timers)` is awaited with the (fire_at, order_id, reminder_type) list that came due"""
+        self.on_due = on_due
+        self.offsets = offsets
+        # heap entries are (fire_at, order_id, reminder_type, generation); rescheduling
+        # an order bumps its generation so its old entries are skipped when popped
+        self._heap: list[tuple[datetime, int, str, int]] = []
+        self._generation: dict[int, int] = {}
+        self._wakeup = asyncio.Event()
+
+    def __len__(self):
+        return len(self._generation)
+
+    def schedule_order(self, order: Order):
+        """Add or replace the timers for one order"""
+        order_id = order.id
+        if order.status in CLOSED_STATUSES:
+            self.remove_order(order_id)
+            return
+        generation = self._generation.get(order_id, 0) + 1
+        self._generation[order_id] = generation
+        deadline = order.deadline_at
+        cutoff = datetime.utcnow() - REMINDER_GRACE
+        for reminder_type, offset in self.offsets.items():
+            fire_at = deadline - offset
+            if fire_at > cutoff:
+                heapq.heappush(self._heap, (fire_at, order_id, reminder_type, generation))
+        self._wakeup.set()
+
+    def remove_order(self, order_id: int):
+        if self._generation.pop(order_id, None) is not None:
+            self._wakeup.set()
+
+    def clear(self):
+        self._heap.clear()
+        self._generation.clear()
+        self._wakeup.set()
+
+    def _is_current(self, entry) -> bool:
+        return self._generation.get(entry[1]) == entry[3]
+
+    def _pop_due(self, now: datetime) -> list[tuple[datetime, int, str]]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            entry = heapq.heappop(self._heap)
+            if self._is_current(entry):
+                due.append(entry[:3])
+        return due
+
+    def _seconds_until_next(self, now: datetime) -> float | None:
+        while self._heap and not self._is_current(self._heap[0]):
+            heapq.heappop(self._heap)
+        if not self._heap:
+            return None
+        return max((self._heap[0][0] - now).total_seconds(), 0)
+
+    async def run(self):
+        """Sleep until the next timer (or a schedule change), then fire what is due"""
+        while True:
+            self._wakeup.clear()
+            now = datetime.utcnow()
+            due = self._pop_due(now)
+            if due:
+                try:
+                    await self.on_due(due)
+                except Exception as e:
+                    logger.error(f"Error firing {len(due)} reminder timers: {e}")
+                continue
+            timeout = self._seconds_until_next(now)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
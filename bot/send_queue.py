@@ -0,0 +1,235 @@
+"""
+Outbound Telegram messages, sent within Telegram's flood limits
+
+Telegram answers 429 with a retry_after when a bot sends more than about 30
+messages a second overall, or more than one a second to the same chat (20 a
+minute to a group). A burst of reminders around a popular deadline would hit
+both, so reminders are not sent directly but queued here:
+
+  - a global token bucket (SEND_RATE messages/s) and one per chat
+    (CHAT_SEND_RATE/s, GROUP_SEND_RATE/s for groups) space the messages out
+    evenly; up to SEND_CONCURRENCY requests are in flight, at most one per
+    chat, so a chat's messages arrive in queue order
+  - among the messages whose chat may send now, the lowest priority number
+    goes first, then the oldest, so `due` reminders overtake `24h` ones
+  - a 429 anyway pauses the whole queue for its retry_after and requeues the
+    message; network errors are retried up to SEND_ATTEMPTS times; a chat
+    that blocked the bot or does not exist fails the message at once
+  - a timeout after the request went out is not retried: Telegram may have
+    delivered the message, and a reminder is better missed than sent twice
+
+send() returns a future that resolves to True once Telegram accepted the
+message (or may have), and False when it gave up, which the reminder job
+acks to the API.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+
+import httpx
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+
+logger = logging.getLogger(__name__)
+
+SEND_RATE = float(os.getenv("SEND_RATE", "25"))
+CHAT_SEND_RATE = float(os.getenv("CHAT_SEND_RATE", "1"))
+GROUP_SEND_RATE = 20 / 60
+SEND_CONCURRENCY = 16
+SEND_ATTEMPTS = 3
+# TimedOut causes that mean the request never reached Telegram
+NOT_SENT_TIMEOUTS = (httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class TokenBucket:
+    """`rate` tokens a second, holding at most `capacity`"""
+
+    def __init__(self, rate: float, capacity: float = 1.0, now: float | None = None):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic() if now is None else now
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until a token is available, 0 if one is"""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+@dataclass(order=True)
+class OutgoingMessage:
+    priority: int
+    seq: int
+    chat_id: int = field(compare=False)
+    text: str = field(compare=False)
+    done: asyncio.Future = field(compare=False)
+    attempts: int = field(default=0, compare=False)
+
+
+class SendQueue:
+    def __init__(self, rate: float = SEND_RATE, chat_rate: float = CHAT_SEND_RATE, clock=time.monotonic):
+        self.chat_rate = chat_rate
+        self.clock = clock
+        # no bursts: Telegram counts over short windows
+        self._global = TokenBucket(rate, now=clock())
+        self._buckets: dict[int, TokenBucket] = {}
+        # pending messages per chat, each a heap by (priority, seq)
+        self._chats: dict[int, list[OutgoingMessage]] = {}
+        # chats with a message in flight
+        self._busy: set[int] = set()
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        self._wakeup = asyncio.Event()
+        self._in_flight = asyncio.Semaphore(SEND_CONCURRENCY)
+        self._sending: set[asyncio.Task] = set()
+        self._bot = None
+        self._task: asyncio.Task | None = None
+        self.sent = self.failed = self.throttled = 0
+
+    def start(self, bot):
+        """Start sending through `bot` on the running event loop"""
+        self._bot = bot
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, *self._sending, return_exceptions=True)
+            self._task = None
+        for queue in self._chats.values():
+            for message in queue:
+                self._finish(message, False)
+        self._chats.clear()
+
+    def send(self, chat_id: int, text: str, priority: int = 0) -> asyncio.Future:
+        """Queue a message; the future resolves to whether Telegram accepted it"""
+        message = OutgoingMessage(priority, next(self._seq), chat_id, text, asyncio.get_running_loop().create_future())
+        self._push(message)
+        return message.done
+
+    def pending(self) -> int:
+        return sum(len(queue) for queue in self._chats.values())
+
+    def _push(self, message: OutgoingMessage):
+        heapq.heappush(self._chats.setdefault(message.chat_id, []), message)
+        self._wakeup.set()
+
+    def _bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            # negative ids are groups and channels
+            bucket = self._buckets[chat_id] = TokenBucket(GROUP_SEND_RATE if chat_id < 0 else self.chat_rate, now=self.clock())
+        return bucket
+
+    def _next(self, now: float) -> tuple[OutgoingMessage | None, float | None]:
+        """The most urgent message whose chat may send now, else the seconds until one may"""
+        best, wait = None, None
+        for chat_id, queue in self._chats.items():
+            if chat_id in self._busy:
+                continue
+            chat_wait = self._bucket(chat_id).wait_time(now)
+            if chat_wait == 0:
+                if best is None or queue[0] < best:
+                    best = queue[0]
+            elif wait is None or chat_wait < wait:
+                wait = chat_wait
+        return best, wait
+
+    async def _wait(self, timeout: float | None):
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _run(self):
+        while True:
+            if not self._chats:
+                # forget the chats that are back to a full bucket
+                now = self.clock()
+                self._buckets = {chat_id: bucket for chat_id, bucket in self._buckets.items() if not bucket.full(now)}
+                await self._wait(None)
+                continue
+            await self._in_flight.acquire()
+            now = self.clock()
+            delay = max(self._paused_until - now, self._global.wait_time(now))
+            message, wait = self._next(now) if delay <= 0 else (None, delay)
+            if message is None:
+                self._in_flight.release()
+                await (asyncio.sleep(delay) if delay > 0 else self._wait(wait))
+                continue
+            queue = self._chats[message.chat_id]
+            heapq.heappop(queue)
+            if not queue:
+                del self._chats[message.chat_id]
+            self._global.take(now)
+            self._bucket(message.chat_id).take(now)
+            self._busy.add(message.chat_id)
+            task = asyncio.create_task(self._deliver(message))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _deliver(self, message: OutgoingMessage):
+        try:
+            await self._bot.send_message(message.chat_id, message.text)
+        except RetryAfter as e:
+            self.throttled += 1
+            self._paused_until = max(self._paused_until, self.clock() + float(e.retry_after))
+            logger.warning(f"Telegram flood limit hit, pausing sends for {e.retry_after}s ({self.pending() + 1} queued)")
+            self._push(message)
+        except (Forbidden, BadRequest) as e:
+            # blocked by the user, chat not found, ...: resending will not help
+            logger.warning(f"Message to chat {message.chat_id} rejected: {e}")
+            self._finish(message, False)
+        except TimedOut as e:
+            if isinstance(e.__cause__, NOT_SENT_TIMEOUTS):
+                self._retry(message, e)
+            else:
+                logger.warning(f"Sending to chat {message.chat_id} timed out after the request went out, not resending")
+                self._finish(message, True)
+        except NetworkError as e:
+            self._retry(message, e)
+        except Exception:
+            logger.exception(f"Sending to chat {message.chat_id} failed")
+            self._finish(message, False)
+        else:
+            self._finish(message, True)
+        finally:
+            self._busy.discard(message.chat_id)
+            self._in_flight.release()
+            self._wakeup.set()
+
+    def _retry(self, message: OutgoingMessage, error: Exception):
+        message.attempts += 1
+        if message.attempts < SEND_ATTEMPTS:
+            logger.warning(f"Sending to chat {message.chat_id} failed ({error}), retrying")
+            self._push(message)
+        else:
+            logger.error(f"Giving up on message to chat {message.chat_id} after {message.attempts} attempts: {error}")
+            self._finish(message, False)
+
+    def _finish(self, message: OutgoingMessage, sent: bool):
+        if sent:
+            self.sent += 1
+        else:
+            self.failed += 1
+        if not message.done.done():
+            message.done.set_result(sent)
+
+
+send_queue = SendQueue()
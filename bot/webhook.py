@@ -0,0 +1,114 @@
+"""
+Webhook mode: Telegram pushes updates to the API, bot workers pull them
+
+With BOT_MODE=webhook the bot registers TELEGRAM_WEBHOOK_URL (the API's
+/bot/webhook, routed there by Caddy) and its TELEGRAM_WEBHOOK_SECRET with
+setWebhook, then takes updates from the API's queue (api/bot_updates.py)
+instead of long-polling Telegram. Every bot process runs one claim loop and
+BOT_WORKERS worker tasks:
+
+  claim loop  long-polls POST /api/bot/updates/claim for as many updates as
+              the local queue has room for; the queue holds BOT_WORKERS
+              updates, so a busy process stops claiming and leaves the rest
+              to other processes
+  workers     run each update through the handlers, then ack it, which makes
+              the chat's next update claimable
+
+The API hands out at most one update per chat at a time, so a chat's updates
+reach the handlers in order even across processes. An update whose ack never
+arrives is handed out again once its lease expires.
+"""
+import asyncio
+import logging
+import os
+import signal
+
+from telegram import Update
+from telegram.ext import Application
+
+from api_client import ApiError, api
+
+logger = logging.getLogger(__name__)
+
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "8"))
+WEBHOOK_URL = os.getenv("TELEGRAM_WEBHOOK_URL", "https://localhost/bot/webhook")
+WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET")
+# Telegram's Bot API server; point it at a fake one to test without Telegram
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+
+# The update types the handlers in bot.py act on; Telegram does not send the rest
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY, Update.INLINE_QUERY]
+
+CLAIM_WAIT_SECONDS = 25
+UPDATE_LEASE_SECONDS = 60
+# after a failed claim
+RETRY_SECONDS = 5
+
+
+async def process_updates(application: Application, queue: asyncio.Queue, worker_id: str):
+    while True:
+        claimed = await queue.get()
+        processed, failed = [claimed['update_id']], []
+        try:
+            # handler errors are caught and logged by process_update itself
+            await application.process_update(Update.de_json(claimed['update'], application.bot))
+        except Exception:
+            logger.exception(f"Update {claimed['update_id']} could not be processed")
+            processed, failed = [], processed
+        try:
+            await api.ack_updates(worker_id, processed, failed)
+        except ApiError as e:
+            logger.warning(f"Ack for update {claimed['update_id']} failed, it will be redelivered: {e}")
+        finally:
+            queue.task_done()
+
+
+async def serve_updates(application: Application, worker_id: str):
+    """Claim updates from the API and hand them to BOT_WORKERS workers, until cancelled"""
+    queue: asyncio.Queue = asyncio.Queue(maxsize=BOT_WORKERS)
+    workers = [asyncio.create_task(process_updates(application, queue, worker_id)) for _ in range(BOT_WORKERS)]
+    try:
+        while True:
+            try:
+                claimed = await api.claim_updates(
+                    worker_id, max(1, queue.maxsize - queue.qsize()), UPDATE_LEASE_SECONDS, CLAIM_WAIT_SECONDS,
+                )
+            except ApiError as e:
+                logger.warning(f"Claiming updates failed, retrying in {RETRY_SECONDS}s: {e}")
+                await asyncio.sleep(RETRY_SECONDS)
+                continue
+            for update in claimed:
+                await queue.put(update)
+    finally:
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+
+async def run_webhook(application: Application, worker_id: str):
+    """Register the webhook and serve updates until SIGINT/SIGTERM"""
+    if not WEBHOOK_SECRET:
+        raise ValueError("TELEGRAM_WEBHOOK_SECRET not set")
+    loop = asyncio.get_running_loop()
+    stopping = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+    async with application:
+        await application.bot.set_webhook(
+            WEBHOOK_URL, secret_token=WEBHOOK_SECRET, allowed_updates=ALLOWED_UPDATES,
+        )
+        logger.info(f"Webhook set to {WEBHOOK_URL}, {BOT_WORKERS} workers as {worker_id}")
+        await application.start()
+        # run_polling would call these hooks itself
+        if application.post_init:
+            await application.post_init(application)
+        serving = asyncio.create_task(serve_updates(application, worker_id))
+        await stopping.wait()
+        logger.info("Stopping webhook workers")
+        serving.cancel()
+        await asyncio.gather(serving, return_exceptions=True)
+        await application.stop()
+    if application.post_shutdown:
+        await application.post_shutdown(application)
@@ -23,13 +23,334 @@ CREATE TABLE IF NOT EXISTS orders (
     target_file_path TEXT,
     telegram_user_id BIGINT,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    -- set by the stamp_orders_delivered_at trigger (see db/migrations/008_order_rollups.sql)
+    delivered_at TIMESTAMP,
+    -- set by the stamp_orders_change_xid trigger (see db/migrations/011_change_xids.sql)
+    change_xid BIGINT NOT NULL DEFAULT 0,
+    -- full-text search (see db/migrations/007_order_search.sql)
+    search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(customer_name, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(topic, '')), 'B')
+    ) STORED
 );
 
 CREATE INDEX idx_orders_deadline ON orders(deadline_at);
 CREATE INDEX idx_orders_status ON orders(status);
 CREATE INDEX idx_orders_telegram_user ON orders(telegram_user_id);
 
+-- Keyset pagination (see db/migrations/001_keyset_pagination.sql)
+CREATE INDEX IF NOT EXISTS idx_orders_deadline_id ON orders(deadline_at, id);
+CREATE INDEX IF NOT EXISTS idx_orders_status_deadline_id ON orders(status, deadline_at, id);
+CREATE INDEX IF NOT EXISTS idx_orders_undelivered_deadline_id
+    ON orders(deadline_at, id) WHERE status <> 'delivered';
+CREATE INDEX IF NOT EXISTS idx_orders_undelivered_customer_deadline_id
+    ON orders(customer_name, deadline_at, id) WHERE status <> 'delivered';
+CREATE INDEX IF NOT EXISTS idx_orders_delivered_updated_id
+    ON orders(updated_at, id) WHERE status = 'delivered';
+CREATE INDEX IF NOT EXISTS idx_orders_delivered_customer_updated_id
+    ON orders(customer_name, updated_at, id) WHERE status = 'delivered';
+
+-- Full-text search (see db/migrations/007_order_search.sql)
+CREATE INDEX IF NOT EXISTS idx_orders_search ON orders USING gin (search_vector);
+
+-- Reminder scan (see db/migrations/003_reminder_scan.sql)
+CREATE INDEX IF NOT EXISTS idx_orders_open_deadline
+    ON orders(deadline_at) WHERE status NOT IN ('delivered', 'cancelled');
+
+-- Reminder schedule (see db/migrations/005_order_reminders.sql)
+CREATE TABLE IF NOT EXISTS order_reminders (
+    order_id INTEGER NOT NULL REFERENCES orders(id) ON DELETE CASCADE,
+    reminder_type VARCHAR(10) NOT NULL,
+    fire_at TIMESTAMP NOT NULL,
+    sent_at TIMESTAMP,
+    claimed_by VARCHAR(64),
+    claim_expires_at TIMESTAMP,
+    PRIMARY KEY (order_id, reminder_type)
+);
+CREATE INDEX IF NOT EXISTS idx_order_reminders_pending
+    ON order_reminders(fire_at) WHERE sent_at IS NULL;
+
+-- Bot webhook updates (see db/migrations/010_bot_updates.sql)
+CREATE TABLE IF NOT EXISTS bot_updates (
+    update_id BIGINT PRIMARY KEY,
+    chat_id BIGINT NOT NULL,
+    payload JSONB NOT NULL,
+    received_at TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+    claimed_by VARCHAR(64),
+    claim_expires_at TIMESTAMP,
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_bot_updates_chat ON bot_updates(chat_id, update_id);
+
+-- Waiting bot updates, for the webhook's queue bound (see db/migrations/012_bot_update_count.sql)
+CREATE TABLE IF NOT EXISTS bot_update_count (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    waiting INTEGER NOT NULL
+);
+INSERT INTO bot_update_count (waiting) VALUES (0) ON CONFLICT (id) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION count_bot_updates()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE bot_update_count SET waiting = waiting + (SELECT count(*) FROM new_updates);
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE bot_update_count SET waiting = waiting - (SELECT count(*) FROM old_updates);
+    ELSE
+        UPDATE bot_update_count SET waiting = 0;
+    END IF;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER count_bot_updates_insert AFTER INSERT ON bot_updates
+    REFERENCING NEW TABLE AS new_updates
+    FOR EACH STATEMENT EXECUTE FUNCTION count_bot_updates();
+CREATE TRIGGER count_bot_updates_delete AFTER DELETE ON bot_updates
+    REFERENCING OLD TABLE AS old_updates
+    FOR EACH STATEMENT EXECUTE FUNCTION count_bot_updates();
+CREATE TRIGGER count_bot_updates_truncate AFTER TRUNCATE ON bot_updates
+    FOR EACH STATEMENT EXECUTE FUNCTION count_bot_updates();
+
+-- Delta sync (see db/migrations/002_order_sync.sql and 011_change_xids.sql)
+CREATE INDEX IF NOT EXISTS idx_orders_change_xid_id ON orders(change_xid, id);
+
+CREATE TABLE IF NOT EXISTS order_tombstones (
+    order_id INTEGER PRIMARY KEY,
+    deleted_at TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+    change_xid BIGINT NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_order_tombstones_change_xid_id ON order_tombstones(change_xid, order_id);
+
+-- the id of the transaction that last wrote the row, for commit-safe sync marks
+CREATE OR REPLACE FUNCTION stamp_change_xid()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.change_xid = pg_current_xact_id()::text::bigint;
+    RETURN NEW;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER stamp_orders_change_xid BEFORE INSERT OR UPDATE ON orders
+    FOR EACH ROW EXECUTE FUNCTION stamp_change_xid();
+CREATE TRIGGER stamp_order_tombstones_change_xid BEFORE INSERT OR UPDATE ON order_tombstones
+    FOR EACH ROW EXECUTE FUNCTION stamp_change_xid();
+
+CREATE OR REPLACE FUNCTION record_order_tombstone()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO order_tombstones (order_id, deleted_at)
+    VALUES (OLD.id, now() AT TIME ZONE 'utc')
+    ON CONFLICT (order_id) DO UPDATE SET deleted_at = EXCLUDED.deleted_at;
+    RETURN OLD;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER record_orders_tombstone AFTER DELETE ON orders
+    FOR EACH ROW EXECUTE FUNCTION record_order_tombstone();
+
+-- Client search (see db/migrations/006_client_search.sql)
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE TABLE IF NOT EXISTS order_clients (
+    customer_name VARCHAR(255) PRIMARY KEY,
+    order_count INTEGER NOT NULL,
+    last_order_at TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_order_clients_name_trgm
+    ON order_clients USING gist (customer_name gist_trgm_ops(siglen=64));
+
+CREATE OR REPLACE FUNCTION count_order_clients()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO order_clients (customer_name, order_count, last_order_at)
+        SELECT customer_name, count(*), max(created_at) FROM new_orders GROUP BY customer_name
+        ON CONFLICT (customer_name) DO UPDATE
+            SET order_count = order_clients.order_count + EXCLUDED.order_count,
+                last_order_at = greatest(order_clients.last_order_at, EXCLUDED.last_order_at);
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE order_clients c SET order_count = c.order_count - o.n
+        FROM (SELECT customer_name, count(*) AS n FROM old_orders GROUP BY customer_name) o
+        WHERE c.customer_name = o.customer_name;
+        DELETE FROM order_clients
+        WHERE customer_name IN (SELECT customer_name FROM old_orders) AND order_count <= 0;
+    ELSE
+        -- only renamed orders move between clients
+        IF NOT EXISTS (
+            SELECT 1 FROM old_orders o JOIN new_orders n ON n.id = o.id
+            WHERE n.customer_name <> o.customer_name
+        ) THEN
+            RETURN NULL;
+        END IF;
+        UPDATE order_clients c SET order_count = c.order_count - r.n
+        FROM (
+            SELECT o.customer_name, count(*) AS n
+            FROM old_orders o JOIN new_orders n ON n.id = o.id
+            WHERE n.customer_name <> o.customer_name
+            GROUP BY o.customer_name
+        ) r
+        WHERE c.customer_name = r.customer_name;
+        DELETE FROM order_clients
+        WHERE customer_name IN (SELECT customer_name FROM old_orders) AND order_count <= 0;
+        INSERT INTO order_clients (customer_name, order_count, last_order_at)
+        SELECT n.customer_name, count(*), max(n.created_at)
+        FROM old_orders o JOIN new_orders n ON n.id = o.id
+        WHERE n.customer_name <> o.customer_name
+        GROUP BY n.customer_name
+        ON CONFLICT (customer_name) DO UPDATE
+            SET order_count = order_clients.order_count + EXCLUDED.order_count,
+                last_order_at = greatest(order_clients.last_order_at, EXCLUDED.last_order_at);
+    END IF;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER count_order_clients_insert AFTER INSERT ON orders
+    REFERENCING NEW TABLE AS new_orders
+    FOR EACH STATEMENT EXECUTE FUNCTION count_order_clients();
+CREATE TRIGGER count_order_clients_update AFTER UPDATE ON orders
+    REFERENCING OLD TABLE AS old_orders NEW TABLE AS new_orders
+    FOR EACH STATEMENT EXECUTE FUNCTION count_order_clients();
+CREATE TRIGGER count_order_clients_delete AFTER DELETE ON orders
+    REFERENCING OLD TABLE AS old_orders
+    FOR EACH STATEMENT EXECUTE FUNCTION count_order_clients();
+
+-- Analytics rollups (see db/migrations/008_order_rollups.sql)
+CREATE OR REPLACE FUNCTION stamp_order_delivered_at()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.status IS DISTINCT FROM 'delivered' THEN
+        NEW.delivered_at = NULL;
+    ELSIF TG_OP = 'INSERT' OR OLD.status IS DISTINCT FROM 'delivered' THEN
+        NEW.delivered_at = coalesce(NEW.delivered_at, now() AT TIME ZONE 'utc');
+    END IF;
+    RETURN NEW;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER stamp_orders_delivered_at BEFORE INSERT OR UPDATE ON orders
+    FOR EACH ROW EXECUTE FUNCTION stamp_order_delivered_at();
+
+CREATE TABLE IF NOT EXISTS order_rollups (
+    metric VARCHAR(10) NOT NULL,
+    day DATE NOT NULL,
+    source_lang VARCHAR(10) NOT NULL,
+    target_lang VARCHAR(10) NOT NULL,
+    customer_name VARCHAR(255) NOT NULL,
+    order_count INTEGER NOT NULL,
+    word_count BIGINT NOT NULL,
+    PRIMARY KEY (metric, day, source_lang, target_lang, customer_name)
+);
+
+-- The rollup rows an orders relation contributes to, times `sign`
+CREATE OR REPLACE FUNCTION order_rollup_rows(source TEXT, sign INTEGER)
+RETURNS TEXT AS $$
+    SELECT format($sql$
+        SELECT 'due' AS metric, deadline_at::date AS day, source_lang, target_lang, customer_name,
+               %2$s AS orders, coalesce(word_count, 0) * %2$s AS words
+        FROM %1$s WHERE status NOT IN ('delivered', 'cancelled')
+        UNION ALL
+        SELECT 'delivered', delivered_at::date, source_lang, target_lang, customer_name,
+               %2$s, coalesce(word_count, 0) * %2$s
+        FROM %1$s WHERE status = 'delivered' AND delivered_at IS NOT NULL
+    $sql$, source, sign);
+$$ language sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION roll_up_orders()
+RETURNS TRIGGER AS $$
+DECLARE
+    delta TEXT;
+    emptied DATE[];
+BEGIN
+    delta := CASE TG_OP
+        WHEN 'INSERT' THEN order_rollup_rows('new_orders', 1)
+        WHEN 'DELETE' THEN order_rollup_rows('old_orders', -1)
+        ELSE order_rollup_rows('new_orders', 1) || ' UNION ALL ' || order_rollup_rows('old_orders', -1)
+    END;
+    EXECUTE format($sql$
+        WITH upserted AS (
+            INSERT INTO order_rollups (metric, day, source_lang, target_lang, customer_name, order_count, word_count)
+            SELECT metric, day, source_lang, target_lang, customer_name, sum(orders), sum(words)
+            FROM (%s) delta
+            GROUP BY metric, day, source_lang, target_lang, customer_name
+            HAVING sum(orders) <> 0 OR sum(words) <> 0
+            ON CONFLICT (metric, day, source_lang, target_lang, customer_name) DO UPDATE
+                SET order_count = order_rollups.order_count + EXCLUDED.order_count,
+                    word_count = order_rollups.word_count + EXCLUDED.word_count
+            RETURNING day, order_count
+        )
+        SELECT array_agg(DISTINCT day) FROM upserted WHERE order_count = 0
+    $sql$, delta) INTO emptied;
+    IF emptied IS NOT NULL THEN
+        DELETE FROM order_rollups WHERE day = ANY(emptied) AND order_count = 0;
+    END IF;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER roll_up_orders_insert AFTER INSERT ON orders
+    REFERENCING NEW TABLE AS new_orders
+    FOR EACH STATEMENT EXECUTE FUNCTION roll_up_orders();
+CREATE TRIGGER roll_up_orders_update AFTER UPDATE ON orders
+    REFERENCING OLD TABLE AS old_orders NEW TABLE AS new_orders
+    FOR EACH STATEMENT EXECUTE FUNCTION roll_up_orders();
+CREATE TRIGGER roll_up_orders_delete AFTER DELETE ON orders
+    REFERENCING OLD TABLE AS old_orders
+    FOR EACH STATEMENT EXECUTE FUNCTION roll_up_orders();
+
+CREATE OR REPLACE FUNCTION rebuild_order_rollups()
+RETURNS VOID AS $$
+BEGIN
+    LOCK TABLE orders IN SHARE MODE;
+    TRUNCATE order_rollups;
+    EXECUTE format($sql$
+        INSERT INTO order_rollups (metric, day, source_lang, target_lang, customer_name, order_count, word_count)
+        SELECT metric, day, source_lang, target_lang, customer_name, sum(orders), sum(words)
+        FROM (%s) delta
+        GROUP BY metric, day, source_lang, target_lang, customer_name
+    $sql$, order_rollup_rows('orders', 1));
+END;
+$$ language 'plpgsql';
+
+-- Order cache invalidation (see db/migrations/009_order_cache_notify.sql)
+CREATE OR REPLACE FUNCTION notify_order_cache()
+RETURNS TRIGGER AS $$
+DECLARE
+    changed TEXT;
+    payload TEXT;
+BEGIN
+    changed := CASE TG_OP
+        WHEN 'INSERT' THEN 'SELECT id, customer_name FROM new_orders'
+        WHEN 'DELETE' THEN 'SELECT id, customer_name FROM old_orders'
+        ELSE 'SELECT id, customer_name FROM new_orders UNION ALL SELECT id, customer_name FROM old_orders'
+    END;
+    EXECUTE format(
+        'SELECT json_build_object(''ids'', array_agg(DISTINCT id), ''clients'', array_agg(DISTINCT customer_name))::text
+         FROM (%s) changed HAVING count(*) > 0', changed
+    ) INTO payload;
+    IF payload IS NULL THEN
+        RETURN NULL;
+    END IF;
+    IF octet_length(payload) >= 8000 THEN
+        payload := '{"all": true}';
+    END IF;
+    PERFORM pg_notify('order_cache', payload);
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER notify_order_cache_insert AFTER INSERT ON orders
+    REFERENCING NEW TABLE AS new_orders
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_order_cache();
+CREATE TRIGGER notify_order_cache_update AFTER UPDATE ON orders
+    REFERENCING OLD TABLE AS old_orders NEW TABLE AS new_orders
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_order_cache();
+CREATE TRIGGER notify_order_cache_delete AFTER DELETE ON orders
+    REFERENCING OLD TABLE AS old_orders
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_order_cache();
+
 -- Trigger to update updated_at
 CREATE OR REPLACE FUNCTION update_updated_at_column()
 RETURNS TRIGGER AS $$
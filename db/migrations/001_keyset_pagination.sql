@@ -0,0 +1,21 @@
+-- Keyset pagination indexes for the order listing endpoints.
+-- Each index matches one (filter, sort key, id) combination so that a page
+-- fetch is a single index range scan starting at the cursor.
+-- Apply to an existing database with:
+--   docker compose exec -T db psql -U tmorder -d tmorder < db/migrations/001_keyset_pagination.sql
+
+-- GET /api/orders (optionally ?status=)
+CREATE INDEX IF NOT EXISTS idx_orders_deadline_id ON orders(deadline_at, id);
+CREATE INDEX IF NOT EXISTS idx_orders_status_deadline_id ON orders(status, deadline_at, id);
+
+-- GET /api/orders/undelivered[/{client_name}]
+CREATE INDEX IF NOT EXISTS idx_orders_undelivered_deadline_id
+    ON orders(deadline_at, id) WHERE status <> 'delivered';
+CREATE INDEX IF NOT EXISTS idx_orders_undelivered_customer_deadline_id
+    ON orders(customer_name, deadline_at, id) WHERE status <> 'delivered';
+
+-- GET /api/orders/delivered[/{client_name}]
+CREATE INDEX IF NOT EXISTS idx_orders_delivered_updated_id
+    ON orders(updated_at, id) WHERE status = 'delivered';
+CREATE INDEX IF NOT EXISTS idx_orders_delivered_customer_updated_id
+    ON orders(customer_name, updated_at, id) WHERE status = 'delivered';
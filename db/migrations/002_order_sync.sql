@@ -0,0 +1,27 @@
+-- Delta sync support for GET /api/orders/changes and list ETags.
+-- Apply to an existing database with:
+--   docker compose exec -T db psql -U tmorder -d tmorder < db/migrations/002_order_sync.sql
+
+-- Sync clients page through orders by (updated_at, id); max(updated_at) feeds the ETag
+CREATE INDEX IF NOT EXISTS idx_orders_updated_id ON orders(updated_at, id);
+
+-- Deleted orders leave a tombstone so clients can drop them from their copy
+CREATE TABLE IF NOT EXISTS order_tombstones (
+    order_id INTEGER PRIMARY KEY,
+    deleted_at TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc')
+);
+CREATE INDEX IF NOT EXISTS idx_order_tombstones_deleted_id ON order_tombstones(deleted_at, order_id);
+
+CREATE OR REPLACE FUNCTION record_order_tombstone()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO order_tombstones (order_id, deleted_at)
+    VALUES (OLD.id, now() AT TIME ZONE 'utc')
+    ON CONFLICT (order_id) DO UPDATE SET deleted_at = EXCLUDED.deleted_at;
+    RETURN OLD;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS record_orders_tombstone ON orders;
+CREATE TRIGGER record_orders_tombstone AFTER DELETE ON orders
+    FOR EACH ROW EXECUTE FUNCTION record_order_tombstone();
@@ -0,0 +1,8 @@
+-- Partial index for the single-pass reminder scan in GET /api/orders/check-reminders.
+-- Only open orders are indexed, so the scan is one range over deadline_at no
+-- matter how many delivered/cancelled orders accumulate.
+-- Apply to an existing database with:
+--   docker compose exec -T db psql -U tmorder -d tmorder < db/migrations/003_reminder_scan.sql
+
+CREATE INDEX IF NOT EXISTS idx_orders_open_deadline
+    ON orders(deadline_at) WHERE status NOT IN ('delivered', 'cancelled');
@@ -0,0 +1,9 @@
+-- Lease columns for POST /api/reminders/claim and /api/reminders/ack.
+-- A bot worker owns an order's pending reminder until the lease expires or
+-- it acknowledges the batch.
+-- Apply to an existing database with:
+--   docker compose exec -T db psql -U tmorder -d tmorder < db/migrations/004_reminder_leases.sql
+
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS reminder_claimed_by VARCHAR(64);
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS reminder_claimed_type VARCHAR(10);
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS reminder_claim_expires_at TIMESTAMP;
@@ -0,0 +1,57 @@
+-- Reminder schedule table: one row per (order, reminder type) with the time it
+-- fires and when it was sent. Replaces the per-type reminder_sent_* flags and
+-- the reminder lease columns on orders, so reminder offsets can be added in
+-- config/settings.yaml without a schema change.
+-- Rows for the configured offsets are (re)generated by the API on startup and
+-- on every order write; this migration seeds the default 24h/6h/2h/due set.
+-- Apply to an existing database with:
+--   docker compose exec -T db psql -U tmorder -d tmorder < db/migrations/005_order_reminders.sql
+
+CREATE TABLE IF NOT EXISTS order_reminders (
+    order_id INTEGER NOT NULL REFERENCES orders(id) ON DELETE CASCADE,
+    reminder_type VARCHAR(10) NOT NULL,
+    fire_at TIMESTAMP NOT NULL,
+    sent_at TIMESTAMP,
+    claimed_by VARCHAR(64),
+    claim_expires_at TIMESTAMP,
+    PRIMARY KEY (order_id, reminder_type)
+);
+CREATE INDEX IF NOT EXISTS idx_order_reminders_pending
+    ON order_reminders(fire_at) WHERE sent_at IS NULL;
+
+INSERT INTO order_reminders (order_id, reminder_type, fire_at)
+SELECT o.id, r.reminder_type, o.deadline_at - r.offset_interval
+FROM orders o
+CROSS JOIN (VALUES
+    ('24h', INTERVAL '24 hours'),
+    ('6h', INTERVAL '6 hours'),
+    ('2h', INTERVAL '2 hours'),
+    ('due', INTERVAL '0')
+) AS r(reminder_type, offset_interval)
+WHERE o.status NOT IN ('delivered', 'cancelled')
+ON CONFLICT (order_id, reminder_type) DO NOTHING;
+
+-- Carry over reminders already sent under the old boolean flags
+DO $$
+DECLARE
+    t TEXT;
+BEGIN
+    FOREACH t IN ARRAY ARRAY['24h', '6h', '2h', 'due'] LOOP
+        IF EXISTS (
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name = 'orders' AND column_name = 'reminder_sent_' || t
+        ) THEN
+            EXECUTE format(
+                'UPDATE order_reminders r SET sent_at = o.updated_at
+                 FROM orders o
+                 WHERE o.id = r.order_id AND r.reminder_type = %L AND o.%I',
+                t, 'reminder_sent_' || t
+            );
+            EXECUTE format('ALTER TABLE orders DROP COLUMN %I', 'reminder_sent_' || t);
+        END IF;
+    END LOOP;
+END $$;
+
+ALTER TABLE orders DROP COLUMN IF EXISTS reminder_claimed_by;
+ALTER TABLE orders DROP COLUMN IF EXISTS reminder_claimed_type;
+ALTER TABLE orders DROP COLUMN IF EXISTS reminder_claim_expires_at;
@@ -0,0 +1,88 @@
+-- Client search for GET /api/clients/search (web UI autocomplete, bot inline
+-- queries). order_clients keeps one row per distinct customer_name with its
+-- order count and newest order. A pg_trgm GiST index answers fuzzy,
+-- case-insensitive "nearest names first" (KNN) lookups over clients instead of
+-- scanning orders; it stays fast when thousands of names share a prefix,
+-- where a GIN index has to score every candidate.
+-- The table is maintained by statement-level triggers on orders, so a bulk
+-- import updates each client once per batch rather than once per row.
+-- Apply to an existing database with:
+--   docker compose exec -T db psql -U tmorder -d tmorder < db/migrations/006_client_search.sql
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE TABLE IF NOT EXISTS order_clients (
+    customer_name VARCHAR(255) PRIMARY KEY,
+    order_count INTEGER NOT NULL,
+    last_order_at TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_order_clients_name_trgm
+    ON order_clients USING gist (customer_name gist_trgm_ops(siglen=64));
+
+CREATE OR REPLACE FUNCTION count_order_clients()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO order_clients (customer_name, order_count, last_order_at)
+        SELECT customer_name, count(*), max(created_at) FROM new_orders GROUP BY customer_name
+        ON CONFLICT (customer_name) DO UPDATE
+            SET order_count = order_clients.order_count + EXCLUDED.order_count,
+                last_order_at = greatest(order_clients.last_order_at, EXCLUDED.last_order_at);
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE order_clients c SET order_count = c.order_count - o.n
+        FROM (SELECT customer_name, count(*) AS n FROM old_orders GROUP BY customer_name) o
+        WHERE c.customer_name = o.customer_name;
+        DELETE FROM order_clients
+        WHERE customer_name IN (SELECT customer_name FROM old_orders) AND order_count <= 0;
+    ELSE
+        -- only renamed orders move between clients
+        IF NOT EXISTS (
+            SELECT 1 FROM old_orders o JOIN new_orders n ON n.id = o.id
+            WHERE n.customer_name <> o.customer_name
+        ) THEN
+            RETURN NULL;
+        END IF;
+        UPDATE order_clients c SET order_count = c.order_count - r.n
+        FROM (
+            SELECT o.customer_name, count(*) AS n
+            FROM old_orders o JOIN new_orders n ON n.id = o.id
+            WHERE n.customer_name <> o.customer_name
+            GROUP BY o.customer_name
+        ) r
+        WHERE c.customer_name = r.customer_name;
+        DELETE FROM order_clients
+        WHERE customer_name IN (SELECT customer_name FROM old_orders) AND order_count <= 0;
+        INSERT INTO order_clients (customer_name, order_count, last_order_at)
+        SELECT n.customer_name, count(*), max(n.created_at)
+        FROM old_orders o JOIN new_orders n ON n.id = o.id
+        WHERE n.customer_name <> o.customer_name
+        GROUP BY n.customer_name
+        ON CONFLICT (customer_name) DO UPDATE
+            SET order_count = order_clients.order_count + EXCLUDED.order_count,
+                last_order_at = greatest(order_clients.last_order_at, EXCLUDED.last_order_at);
+    END IF;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+-- transition tables allow one event per trigger
+DROP TRIGGER IF EXISTS count_order_clients_insert ON orders;
+CREATE TRIGGER count_order_clients_insert AFTER INSERT ON orders
+    REFERENCING NEW TABLE AS new_orders
+    FOR EACH STATEMENT EXECUTE FUNCTION count_order_clients();
+DROP TRIGGER IF EXISTS count_order_clients_update ON orders;
+CREATE TRIGGER count_order_clients_update AFTER UPDATE ON orders
+    REFERENCING OLD TABLE AS old_orders NEW TABLE AS new_orders
+    FOR EACH STATEMENT EXECUTE FUNCTION count_order_clients();
+DROP TRIGGER IF EXISTS count_order_clients_delete ON orders;
+CREATE TRIGGER count_order_clients_delete AFTER DELETE ON orders
+    REFERENCING OLD TABLE AS old_orders
+    FOR EACH STATEMENT EXECUTE FUNCTION count_order_clients();
+
+-- (re)build the table from orders; safe to run again
+BEGIN;
+LOCK TABLE orders IN SHARE MODE;
+TRUNCATE order_clients;
+INSERT INTO order_clients (customer_name, order_count, last_order_at)
+SELECT customer_name, count(*), max(created_at) FROM orders GROUP BY customer_name;
+COMMIT;
@@ -0,0 +1,17 @@
+-- Full-text search for GET /api/orders/search and the bot's /search command.
+-- search_vector is a stored generated column: customer name (weight A) and
+-- topic (weight B) parsed with the 'english' configuration, so "leaflets"
+-- finds "leaflet" and stop words are dropped. Postgres keeps it current on
+-- every insert/update; the GIN index answers @@ queries without reading the
+-- table. The configuration must match SEARCH_CONFIG in api/models.py.
+-- Adding the column rewrites orders once (ACCESS EXCLUSIVE lock while it runs).
+-- Apply to an existing database with:
+--   docker compose exec -T db psql -U tmorder -d tmorder < db/migrations/007_order_search.sql
+
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(customer_name, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(topic, '')), 'B')
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_orders_search ON orders USING gin (search_vector);
@@ -0,0 +1,124 @@
+-- Daily rollups for GET /api/analytics/*: one row per
+-- (metric, day, source_lang, target_lang, customer_name) with the number of
+-- orders and the sum of their word_count.
+--   due       - open orders (not delivered/cancelled) by deadline day
+--   delivered - delivered orders by delivery day (orders.delivered_at)
+-- Statement-level triggers on orders add each written row's new contribution
+-- and subtract its old one, so the rollups follow every insert, update and
+-- delete (a bulk import batch is one delta) and reads never touch orders.
+-- Days are UTC dates, like every timestamp in the schema.
+-- rebuild_order_rollups() recomputes the table from orders.
+-- Apply to an existing database with:
+--   docker compose exec -T db psql -U tmorder -d tmorder < db/migrations/008_order_rollups.sql
+
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS delivered_at TIMESTAMP;
+
+-- existing deliveries: the last write is the best record of when they happened
+BEGIN;
+ALTER TABLE orders DISABLE TRIGGER update_orders_updated_at;
+UPDATE orders SET delivered_at = updated_at WHERE status = 'delivered' AND delivered_at IS NULL;
+ALTER TABLE orders ENABLE TRIGGER update_orders_updated_at;
+COMMIT;
+
+CREATE OR REPLACE FUNCTION stamp_order_delivered_at()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.status IS DISTINCT FROM 'delivered' THEN
+        NEW.delivered_at = NULL;
+    ELSIF TG_OP = 'INSERT' OR OLD.status IS DISTINCT FROM 'delivered' THEN
+        NEW.delivered_at = coalesce(NEW.delivered_at, now() AT TIME ZONE 'utc');
+    END IF;
+    RETURN NEW;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS stamp_orders_delivered_at ON orders;
+CREATE TRIGGER stamp_orders_delivered_at BEFORE INSERT OR UPDATE ON orders
+    FOR EACH ROW EXECUTE FUNCTION stamp_order_delivered_at();
+
+CREATE TABLE IF NOT EXISTS order_rollups (
+    metric VARCHAR(10) NOT NULL,
+    day DATE NOT NULL,
+    source_lang VARCHAR(10) NOT NULL,
+    target_lang VARCHAR(10) NOT NULL,
+    customer_name VARCHAR(255) NOT NULL,
+    order_count INTEGER NOT NULL,
+    word_count BIGINT NOT NULL,
+    PRIMARY KEY (metric, day, source_lang, target_lang, customer_name)
+);
+
+-- The rollup rows an orders relation contributes to, times `sign`
+CREATE OR REPLACE FUNCTION order_rollup_rows(source TEXT, sign INTEGER)
+RETURNS TEXT AS $$
+    SELECT format($sql$
+        SELECT 'due' AS metric, deadline_at::date AS day, source_lang, target_lang, customer_name,
+               %2$s AS orders, coalesce(word_count, 0) * %2$s AS words
+        FROM %1$s WHERE status NOT IN ('delivered', 'cancelled')
+        UNION ALL
+        SELECT 'delivered', delivered_at::date, source_lang, target_lang, customer_name,
+               %2$s, coalesce(word_count, 0) * %2$s
+        FROM %1$s WHERE status = 'delivered' AND delivered_at IS NOT NULL
+    $sql$, source, sign);
+$$ language sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION roll_up_orders()
+RETURNS TRIGGER AS $$
+DECLARE
+    delta TEXT;
+    emptied DATE[];
+BEGIN
+    delta := CASE TG_OP
+        WHEN 'INSERT' THEN order_rollup_rows('new_orders', 1)
+        WHEN 'DELETE' THEN order_rollup_rows('old_orders', -1)
+        ELSE order_rollup_rows('new_orders', 1) || ' UNION ALL ' || order_rollup_rows('old_orders', -1)
+    END;
+    EXECUTE format($sql$
+        WITH upserted AS (
+            INSERT INTO order_rollups (metric, day, source_lang, target_lang, customer_name, order_count, word_count)
+            SELECT metric, day, source_lang, target_lang, customer_name, sum(orders), sum(words)
+            FROM (%s) delta
+            GROUP BY metric, day, source_lang, target_lang, customer_name
+            HAVING sum(orders) <> 0 OR sum(words) <> 0
+            ON CONFLICT (metric, day, source_lang, target_lang, customer_name) DO UPDATE
+                SET order_count = order_rollups.order_count + EXCLUDED.order_count,
+                    word_count = order_rollups.word_count + EXCLUDED.word_count
+            RETURNING day, order_count
+        )
+        SELECT array_agg(DISTINCT day) FROM upserted WHERE order_count = 0
+    $sql$, delta) INTO emptied;
+    IF emptied IS NOT NULL THEN
+        DELETE FROM order_rollups WHERE day = ANY(emptied) AND order_count = 0;
+    END IF;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+-- transition tables allow one event per trigger
+DROP TRIGGER IF EXISTS roll_up_orders_insert ON orders;
+CREATE TRIGGER roll_up_orders_insert AFTER INSERT ON orders
+    REFERENCING NEW TABLE AS new_orders
+    FOR EACH STATEMENT EXECUTE FUNCTION roll_up_orders();
+DROP TRIGGER IF EXISTS roll_up_orders_update ON orders;
+CREATE TRIGGER roll_up_orders_update AFTER UPDATE ON orders
+    REFERENCING OLD TABLE AS old_orders NEW TABLE AS new_orders
+    FOR EACH STATEMENT EXECUTE FUNCTION roll_up_orders();
+DROP TRIGGER IF EXISTS roll_up_orders_delete ON orders;
+CREATE TRIGGER roll_up_orders_delete AFTER DELETE ON orders
+    REFERENCING OLD TABLE AS old_orders
+    FOR EACH STATEMENT EXECUTE FUNCTION roll_up_orders();
+
+CREATE OR REPLACE FUNCTION rebuild_order_rollups()
+RETURNS VOID AS $$
+BEGIN
+    LOCK TABLE orders IN SHARE MODE;
+    TRUNCATE order_rollups;
+    EXECUTE format($sql$
+        INSERT INTO order_rollups (metric, day, source_lang, target_lang, customer_name, order_count, word_count)
+        SELECT metric, day, source_lang, target_lang, customer_name, sum(orders), sum(words)
+        FROM (%s) delta
+        GROUP BY metric, day, source_lang, target_lang, customer_name
+    $sql$, order_rollup_rows('orders', 1));
+END;
+$$ language 'plpgsql';
+
+SELECT rebuild_order_rollups();
@@ -0,0 +1,48 @@
+-- Cross-worker invalidation for the API's order cache (api/order_cache.py).
+-- After every write to orders, a statement-level trigger NOTIFYs the
+-- `order_cache` channel with the ids and client names the statement touched,
+-- e.g. {"ids": [12], "clients": ["Acme"]}. Postgres delivers it on commit
+-- only, to every API worker that LISTENs. Payloads are limited to 8000
+-- bytes, so a large batch (bulk import) sends {"all": true} instead.
+-- Apply to an existing database with:
+--   docker compose exec -T db psql -U tmorder -d tmorder < db/migrations/009_order_cache_notify.sql
+
+CREATE OR REPLACE FUNCTION notify_order_cache()
+RETURNS TRIGGER AS $$
+DECLARE
+    changed TEXT;
+    payload TEXT;
+BEGIN
+    changed := CASE TG_OP
+        WHEN 'INSERT' THEN 'SELECT id, customer_name FROM new_orders'
+        WHEN 'DELETE' THEN 'SELECT id, customer_name FROM old_orders'
+        ELSE 'SELECT id, customer_name FROM new_orders UNION ALL SELECT id, customer_name FROM old_orders'
+    END;
+    EXECUTE format(
+        'SELECT json_build_object(''ids'', array_agg(DISTINCT id), ''clients'', array_agg(DISTINCT customer_name))::text
+         FROM (%s) changed HAVING count(*) > 0', changed
+    ) INTO payload;
+    IF payload IS NULL THEN
+        RETURN NULL;
+    END IF;
+    IF octet_length(payload) >= 8000 THEN
+        payload := '{"all": true}';
+    END IF;
+    PERFORM pg_notify('order_cache', payload);
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+-- transition tables allow one event per trigger
+DROP TRIGGER IF EXISTS notify_order_cache_insert ON orders;
+CREATE TRIGGER notify_order_cache_insert AFTER INSERT ON orders
+    REFERENCING NEW TABLE AS new_orders
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_order_cache();
+DROP TRIGGER IF EXISTS notify_order_cache_update ON orders;
+CREATE TRIGGER notify_order_cache_update AFTER UPDATE ON orders
+    REFERENCING OLD TABLE AS old_orders NEW TABLE AS new_orders
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_order_cache();
+DROP TRIGGER IF EXISTS notify_order_cache_delete ON orders;
+CREATE TRIGGER notify_order_cache_delete AFTER DELETE ON orders
+    REFERENCING OLD TABLE AS old_orders
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_order_cache();
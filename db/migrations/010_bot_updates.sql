@@ -0,0 +1,19 @@
+-- Inbound Telegram updates for webhook mode (POST /bot/webhook).
+-- The webhook stores each update here and returns at once; bot workers lease
+-- them with POST /api/bot/updates/claim and delete them with /ack. update_id
+-- is Telegram's, so a redelivered update is stored once. Only the oldest
+-- update of each chat can be leased, which keeps a chat's updates in order
+-- while different chats are handled in parallel.
+-- Apply to an existing database with:
+--   docker compose exec -T db psql -U tmorder -d tmorder < db/migrations/010_bot_updates.sql
+
+CREATE TABLE IF NOT EXISTS bot_updates (
+    update_id BIGINT PRIMARY KEY,
+    chat_id BIGINT NOT NULL,
+    payload JSONB NOT NULL,
+    received_at TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+    claimed_by VARCHAR(64),
+    claim_expires_at TIMESTAMP,
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_bot_updates_chat ON bot_updates(chat_id, update_id);
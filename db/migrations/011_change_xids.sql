@@ -0,0 +1,35 @@
+-- Commit-safe change marks for GET /api/orders/changes, list ETags and the
+-- calendar feed. updated_at is the writing transaction's start time, so a
+-- transaction that started first but committed last lands behind a
+-- (updated_at, id) mark a reader already moved past, and its change is never
+-- seen. Every write to orders and order_tombstones now records the writing
+-- transaction's id in change_xid instead; readers only take rows whose
+-- change_xid is below their snapshot's xmin, i.e. written by transactions
+-- that have all finished, so nothing can still commit behind a
+-- (change_xid, id) mark. Rows written before this migration get 0.
+-- Apply to an existing database with:
+--   docker compose exec -T db psql -U tmorder -d tmorder < db/migrations/011_change_xids.sql
+
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS change_xid BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE order_tombstones ADD COLUMN IF NOT EXISTS change_xid BIGINT NOT NULL DEFAULT 0;
+
+CREATE OR REPLACE FUNCTION stamp_change_xid()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.change_xid = pg_current_xact_id()::text::bigint;
+    RETURN NEW;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS stamp_orders_change_xid ON orders;
+CREATE TRIGGER stamp_orders_change_xid BEFORE INSERT OR UPDATE ON orders
+    FOR EACH ROW EXECUTE FUNCTION stamp_change_xid();
+DROP TRIGGER IF EXISTS stamp_order_tombstones_change_xid ON order_tombstones;
+CREATE TRIGGER stamp_order_tombstones_change_xid BEFORE INSERT OR UPDATE ON order_tombstones
+    FOR EACH ROW EXECUTE FUNCTION stamp_change_xid();
+
+-- Sync clients page through (change_xid, id); max(change_xid) feeds the ETag
+CREATE INDEX IF NOT EXISTS idx_orders_change_xid_id ON orders(change_xid, id);
+CREATE INDEX IF NOT EXISTS idx_order_tombstones_change_xid_id ON order_tombstones(change_xid, order_id);
+DROP INDEX IF EXISTS idx_orders_updated_id;
+DROP INDEX IF EXISTS idx_order_tombstones_deleted_id;
@@ -0,0 +1,46 @@
+-- A counter row for the webhook's queue bound. Counting bot_updates for every
+-- incoming update scanned the table, and the count and the insert were
+-- separate statements, so concurrent deliveries could all pass the check and
+-- overshoot BOT_UPDATE_QUEUE_SIZE. Statement-level triggers now keep the
+-- number of waiting updates in bot_update_count's single row, and the webhook
+-- locks that row for its check and insert, so deliveries queue up behind each
+-- other for the few milliseconds that takes.
+-- Apply to an existing database with:
+--   docker compose exec -T db psql -U tmorder -d tmorder < db/migrations/012_bot_update_count.sql
+
+CREATE TABLE IF NOT EXISTS bot_update_count (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    waiting INTEGER NOT NULL
+);
+
+CREATE OR REPLACE FUNCTION count_bot_updates()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE bot_update_count SET waiting = waiting + (SELECT count(*) FROM new_updates);
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE bot_update_count SET waiting = waiting - (SELECT count(*) FROM old_updates);
+    ELSE
+        UPDATE bot_update_count SET waiting = 0;
+    END IF;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+BEGIN;
+LOCK TABLE bot_updates IN SHARE MODE;
+INSERT INTO bot_update_count (waiting) SELECT count(*) FROM bot_updates
+ON CONFLICT (id) DO UPDATE SET waiting = EXCLUDED.waiting;
+
+DROP TRIGGER IF EXISTS count_bot_updates_insert ON bot_updates;
+CREATE TRIGGER count_bot_updates_insert AFTER INSERT ON bot_updates
+    REFERENCING NEW TABLE AS new_updates
+    FOR EACH STATEMENT EXECUTE FUNCTION count_bot_updates();
+DROP TRIGGER IF EXISTS count_bot_updates_delete ON bot_updates;
+CREATE TRIGGER count_bot_updates_delete AFTER DELETE ON bot_updates
+    REFERENCING OLD TABLE AS old_updates
+    FOR EACH STATEMENT EXECUTE FUNCTION count_bot_updates();
+DROP TRIGGER IF EXISTS count_bot_updates_truncate ON bot_updates;
+CREATE TRIGGER count_bot_updates_truncate AFTER TRUNCATE ON bot_updates
+    FOR EACH STATEMENT EXECUTE FUNCTION count_bot_updates();
+COMMIT;
@@ -0,0 +1,67 @@
+from datetime import date
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from analytics import rollup_report
+from test_orders import new_order
+
+EVERY_DAY = (date(2000, 1, 1), date(2100, 1, 1))
+
+# what the rollups stand for, computed from orders directly
+DIRECT = {
+    "due": """
+        SELECT deadline_at::date AS period, source_lang, target_lang, customer_name,
+               count(*) AS orders, sum(coalesce(word_count, 0)) AS words
+        FROM orders WHERE status NOT IN ('delivered', 'cancelled')
+        GROUP BY 1, 2, 3, 4 ORDER BY 1, 2, 3, 4
+    """,
+    "delivered": """
+        SELECT delivered_at::date AS period, source_lang, target_lang, customer_name,
+               count(*) AS orders, sum(coalesce(word_count, 0)) AS words
+        FROM orders WHERE status = 'delivered'
+        GROUP BY 1, 2, 3, 4 ORDER BY 1, 2, 3, 4
+    """,
+}
+
+
+def assert_rollups_match_orders(engine):
+    with Session(engine) as session:
+        for metric, query in DIRECT.items():
+            direct = [row._asdict() for row in session.execute(text(query))]
+            assert rollup_report(session, metric, *EVERY_DAY, "day", ["lang_pair", "customer"]) == direct, metric
+
+
+def put(client, path: str, **body):
+    response = client.put(path, json=body or None)
+    assert response.status_code == 200, response.text
+
+
+def test_rollups_follow_every_kind_of_write(client, engine):
+    created = [
+        client.post("/api/orders", json=new_order(
+            customer_name=f"Rollup Customer {n % 3}", source_lang=("en", "de")[n % 2], word_count=100 * (n + 1),
+            deadline_at=f"2032-05-{1 + n % 4:02d}T12:00:00",
+        )).json()
+        for n in range(12)
+    ]
+    ids = [order["id"] for order in created]
+    assert_rollups_match_orders(engine)
+
+    # reassignments, moved deadlines and changed sizes
+    put(client, f"/api/orders/{ids[0]}", customer_name="Rollup Customer 9")
+    put(client, f"/api/orders/{ids[1]}", deadline_at="2032-06-15T09:00:00", word_count=4321)
+    put(client, f"/api/orders/{ids[2]}", source_lang="fr", target_lang="en", word_count=None)
+    # deliveries, a cancellation and a delivery taken back
+    for order_id in ids[3:6]:
+        put(client, f"/api/orders/{order_id}/deliver")
+    put(client, f"/api/orders/{ids[6]}", status="cancelled")
+    put(client, f"/api/orders/{ids[5]}", status="in_progress")
+    assert_rollups_match_orders(engine)
+
+    # statements touching many rows are one delta each
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE orders SET customer_name = 'Rollup Customer 8' WHERE id = ANY(:ids)"), {"ids": ids[7:10]})
+        conn.execute(text("DELETE FROM orders WHERE id = ANY(:ids)"), {"ids": [ids[3], ids[8], ids[10]]})
+        conn.execute(text("DELETE FROM orders WHERE id = :id"), {"id": ids[11]})
+    assert_rollups_match_orders(engine)
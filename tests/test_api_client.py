@@ -0,0 +1,60 @@
+import asyncio
+
+import httpx
+import pytest
+
+from api_client import ApiClient, ApiError
+
+
+def call(failure, send) -> tuple[int, bool]:
+    """(requests `send(client)` made, whether it ended in ApiError) when the first one fails with `failure`"""
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        if len(requests) == 1:
+            if isinstance(failure, int):
+                return httpx.Response(failure)
+            raise failure("simulated", request=request)
+        return httpx.Response(200, json={
+            "id": 1, "customer_name": "Acme", "source_lang": "en", "target_lang": "sv", "status": "delivered",
+            "deadline_at": "2030-01-01T12:00:00", "created_at": "2030-01-01T12:00:00", "updated_at": "2030-01-01T12:00:00",
+        })
+
+    async def run() -> bool:
+        client = ApiClient(base_url="http://api", retries=2, backoff=0, transport=httpx.MockTransport(handler))
+        try:
+            await send(client)
+            return False
+        except ApiError:
+            return True
+        finally:
+            await client.close()
+
+    failed = asyncio.run(run())
+    return len(requests), failed
+
+
+@pytest.mark.parametrize("method", ["GET", "POST"])
+@pytest.mark.parametrize("failure", [httpx.ConnectError, httpx.ConnectTimeout])
+def test_requests_that_never_connected_are_resent(failure, method):
+    assert call(failure, lambda client: client.request(method, "/api/orders")) == (2, False)
+
+
+@pytest.mark.parametrize("failure", [httpx.PoolTimeout, httpx.ReadTimeout, 503])
+def test_post_is_not_resent(failure):
+    assert call(failure, lambda client: client.request("POST", "/api/orders")) == (1, True)
+
+
+@pytest.mark.parametrize("failure", [httpx.PoolTimeout, httpx.ReadTimeout, 503])
+def test_get_is_resent(failure):
+    assert call(failure, lambda client: client.request("GET", "/api/orders")) == (2, False)
+
+
+@pytest.mark.parametrize("failure", [httpx.ReadTimeout, 503])
+def test_deliver_is_not_resent(failure):
+    assert call(failure, lambda client: client.deliver_order(1)) == (1, True)
+
+
+def test_update_is_resent():
+    assert call(httpx.ReadTimeout, lambda client: client.update_order(1, {"topic": "x"})) == (2, False)
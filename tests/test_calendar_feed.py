@@ -0,0 +1,81 @@
+import time
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from calendar_feed import CalendarFeed
+from conftest import CALENDAR_TOKEN
+from test_orders import new_order
+
+
+def calendar(client) -> str:
+    response = client.get("/calendar/ics", params={"token": CALENDAR_TOKEN})
+    assert response.status_code == 200, response.text
+    # unfold long content lines
+    return response.text.replace("\r\n ", "")
+
+
+def retopic(conn, order_id: int, topic: str):
+    conn.execute(text("UPDATE orders SET topic = :topic WHERE id = :id"), {"topic": topic, "id": order_id})
+
+
+def test_feed_picks_up_transaction_that_commits_late(client, engine):
+    first = client.post("/api/orders", json=new_order()).json()
+    second = client.post("/api/orders", json=new_order()).json()
+    calendar(client)
+
+    with engine.connect() as slow, engine.connect() as fast:
+        slow.begin()
+        retopic(slow, first["id"], "slow calendar writer")
+        with fast.begin():
+            retopic(fast, second["id"], "fast calendar writer")
+        calendar(client)
+        slow.commit()
+
+    feed = calendar(client)
+    assert "Topic: slow calendar writer" in feed
+    assert "Topic: fast calendar writer" in feed
+
+
+def test_feed_drops_deleted_orders(client, engine):
+    order = client.post("/api/orders", json=new_order(customer_name="Deleted Customer")).json()
+    assert f"#{order['id']} Deleted Customer" in calendar(client)
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM orders WHERE id = :id"), {"id": order["id"]})
+    assert f"#{order['id']} " not in calendar(client)
+
+
+def newest_write(engine) -> datetime:
+    with engine.connect() as conn:
+        return conn.scalar(text(
+            "SELECT date_trunc('second', greatest((SELECT max(updated_at) FROM orders), (SELECT max(deleted_at) FROM order_tombstones)))"
+        ))
+
+
+def refreshed(feed: CalendarFeed, engine) -> CalendarFeed:
+    with Session(engine) as session:
+        feed.refresh(session)
+    return feed
+
+
+def test_last_modified_comes_from_the_data(client, engine):
+    # two workers: one that follows the writes, one that loads afterwards
+    following = refreshed(CalendarFeed(), engine)
+    order = client.post("/api/orders", json=new_order(customer_name="Modified Customer")).json()
+    time.sleep(1)
+    late = refreshed(CalendarFeed(), engine)
+    refreshed(following, engine)
+    modified = newest_write(engine)
+    assert following.render().last_modified == late.render().last_modified == modified
+
+    # delivering takes the order out of the feed, and still counts as a change
+    time.sleep(1)
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE orders SET status = 'delivered' WHERE id = :id"), {"id": order["id"]})
+    delivered = newest_write(engine)
+    assert delivered > modified
+    assert refreshed(following, engine).render(customer="Modified Customer").last_modified == delivered
+    response = client.get("/calendar/ics", params={"token": CALENDAR_TOKEN})
+    assert parsedate_to_datetime(response.headers["Last-Modified"]).replace(tzinfo=None) == delivered
@@ -0,0 +1,50 @@
+from sqlalchemy import text
+
+from test_orders import new_order
+
+
+def search(client, q: str) -> dict[str, int]:
+    response = client.get("/api/clients/search", params={"q": q})
+    assert response.status_code == 200, response.text
+    return {match["customer_name"]: match["order_count"] for match in response.json()["items"]}
+
+
+def assert_clients_match_orders(engine):
+    with engine.connect() as conn:
+        direct = conn.execute(text("SELECT customer_name, count(*) FROM orders GROUP BY 1 ORDER BY 1")).all()
+        kept = conn.execute(text("SELECT customer_name, order_count FROM order_clients ORDER BY 1")).all()
+    assert kept == direct
+
+
+def test_renamed_client_is_found_only_by_its_new_name(client, engine):
+    first, second = (client.post("/api/orders", json=new_order(customer_name="Kowalczyk Translations")).json()
+                     for _ in range(2))
+    client.post("/api/orders", json=new_order(customer_name="Kowalczyk Legal"))
+    assert search(client, "kowalczyk") == {"Kowalczyk Translations": 2, "Kowalczyk Legal": 1}
+
+    client.put(f"/api/orders/{first['id']}", json={"customer_name": "Wisniewski Translations"})
+    assert search(client, "kowalczyk") == {"Kowalczyk Translations": 1, "Kowalczyk Legal": 1}
+    client.put(f"/api/orders/{second['id']}", json={"customer_name": "Wisniewski Translations"})
+    assert search(client, "kowalczyk") == {"Kowalczyk Legal": 1}
+    assert search(client, "wisniewski") == {"Wisniewski Translations": 2}
+    assert_clients_match_orders(engine)
+
+
+def test_bulk_reassignments_and_deletes_keep_clients_in_sync(client, engine):
+    ids = [client.post("/api/orders", json=new_order(customer_name=f"Lewandowska {suffix}")).json()["id"]
+           for suffix in ("Medical", "Medical", "Patent")]
+    with engine.begin() as conn:
+        # one statement moving orders between clients both ways
+        conn.execute(text(
+            "UPDATE orders SET customer_name = CASE customer_name WHEN 'Lewandowska Medical' THEN 'Lewandowska Patent' "
+            "ELSE 'Lewandowska Medical' END WHERE id = ANY(:ids)"
+        ), {"ids": ids})
+    assert search(client, "lewandowska") == {"Lewandowska Patent": 2, "Lewandowska Medical": 1}
+
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM orders WHERE id = ANY(:ids)"), {"ids": ids[:2]})
+    assert search(client, "lewandowska") == {"Lewandowska Medical": 1}
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM orders WHERE id = :id"), {"id": ids[2]})
+    assert search(client, "lewandowska") == {}
+    assert_clients_match_orders(engine)
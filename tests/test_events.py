@@ -0,0 +1,28 @@
+import json
+
+from test_orders import new_order
+
+
+def next_event(lines, event_type: str) -> dict:
+    """The data of the next event of this type on an SSE stream"""
+    current = None
+    for line in lines:
+        if line.startswith("event: "):
+            current = line.removeprefix("event: ")
+        elif line.startswith("data: ") and current == event_type:
+            return json.loads(line.removeprefix("data: "))
+
+
+def test_stream_carries_committed_writes(client, api_url):
+    with client.stream("GET", "/api/orders/stream") as stream:
+        lines = stream.iter_lines()
+        assert next(lines) == "retry: 3000"
+        order = client.post("/api/orders", json=new_order()).json()
+        assert next_event(lines, "created")["id"] == order["id"]
+
+        client.put(f"/api/orders/{order['id']}", json={"topic": "streamed"})
+        updated = next_event(lines, "updated")
+        assert (updated["id"], updated["topic"]) == (order["id"], "streamed")
+
+        client.put(f"/api/orders/{order['id']}/deliver")
+        assert next_event(lines, "delivered")["status"] == "delivered"
@@ -0,0 +1,16 @@
+import re
+
+from test_orders import new_order
+
+
+def sample(metrics: str, name: str) -> float:
+    match = re.search(rf"^{re.escape(name)} (\S+)$", metrics, re.MULTILINE)
+    return float(match.group(1)) if match else 0.0
+
+
+def test_pool_checkout_wait_is_recorded(client):
+    checkouts = 'db_pool_checkout_wait_seconds_count{database="primary"}'
+    before = sample(client.get("/metrics").text, checkouts)
+    client.post("/api/orders", json=new_order())
+    after = sample(client.get("/metrics").text, checkouts)
+    assert after > before
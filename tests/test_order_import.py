@@ -0,0 +1,78 @@
+import asyncio
+import csv
+
+from sqlalchemy import text
+
+from order_import import iter_csv_records
+
+
+async def byte_chunks(data: bytes, size: int):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def csv_records(data: str, chunk_size: int = 7) -> list[str]:
+    async def collect():
+        return [record async for record in iter_csv_records(byte_chunks(data.encode("utf-8-sig"), chunk_size))]
+    return asyncio.run(collect())
+
+
+def test_records_keep_quoted_newlines_together():
+    data = 'customer_name,topic\nAcme,"line one\nline two\n\nline four"\nGlobex,plain\n'
+    records = csv_records(data)
+    assert len(records) == 3
+    assert list(csv.reader(records[1:])) == [["Acme", "line one\nline two\n\nline four"], ["Globex", "plain"]]
+
+
+def test_records_with_escaped_quotes():
+    data = 'customer_name,topic\r\n"Acme ""West""","say ""hi""\r\nthen ""bye"""\r\n"""",x\r\n'
+    records = csv_records(data, chunk_size=1)
+    assert list(csv.reader(records[1:])) == [['Acme "West"', 'say "hi"\r\nthen "bye"'], ['"', "x"]]
+
+
+def test_records_without_final_newline_and_blank_lines():
+    records = csv_records('a,b\n\n1,2\n\n"3\n",4')
+    assert list(csv.reader(records)) == [["a", "b"], ["1", "2"], ["3\n", "4"]]
+
+
+def test_import_reports_bad_rows_and_keeps_good_ones(client, engine):
+    body = (
+        "customer_name,source_lang,target_lang,word_count,topic,deadline_at\n"
+        'Import Customer,en,de,1200,"notes\nover two lines",2033-01-10T10:00:00\n'
+        "Import Customer,en,de,not a number,,2033-01-11T10:00:00\n"
+        'Import Customer,de,en,,"the ""final"" one",2033-01-12T10:00:00Z\n'
+    )
+    response = client.post("/api/orders/import", params={"format": "csv"}, content=body.encode())
+    assert response.status_code == 200, response.text
+    report = response.json()
+    assert (report["imported"], report["error_count"]) == (2, 1)
+    assert report["errors"][0]["row"] == 2
+    assert report["errors"][0]["errors"][0]["loc"] == ["word_count"]
+
+    with engine.connect() as conn:
+        orders = conn.execute(text(
+            "SELECT id, topic, deadline_at FROM orders WHERE customer_name = 'Import Customer' ORDER BY deadline_at"
+        )).all()
+        assert [(order.topic, order.deadline_at.day) for order in orders] == [
+            ("notes\nover two lines", 10), ('the "final" one', 12),
+        ]
+        reminders = conn.execute(
+            text("SELECT order_id, reminder_type FROM order_reminders WHERE order_id = ANY(:ids)"),
+            {"ids": [order.id for order in orders]},
+        ).all()
+    assert sorted(reminders) == sorted((order.id, kind) for order in orders for kind in ("24h", "6h", "2h", "due"))
+
+
+def test_import_reports_every_row_of_a_failed_batch(client, engine):
+    # valid for OrderCreate, but out of range for the INTEGER column
+    body = (
+        '{"customer_name": "Import Batch", "source_lang": "en", "target_lang": "de", "deadline_at": "2033-02-01T10:00:00"}\n'
+        '{"customer_name": "Import Batch", "source_lang": "en", "target_lang": "de", "deadline_at": "2033-02-01T10:00:00", '
+        '"word_count": 10000000000}\n'
+    )
+    report = client.post("/api/orders/import", params={"format": "jsonl"}, content=body.encode()).json()
+    assert (report["imported"], report["error_count"]) == (0, 2)
+    assert [error["row"] for error in report["errors"]] == [1, 2]
+    assert all(error["errors"][0]["msg"].startswith("database error") for error in report["errors"])
+    with engine.connect() as conn:
+        assert conn.scalar(text("SELECT count(*) FROM orders WHERE customer_name = 'Import Batch'")) == 0
@@ -0,0 +1,74 @@
+import time
+
+from sqlalchemy import text
+
+from test_orders import new_order
+
+
+def sync_token(client, since=None) -> tuple[list[dict], list[int], str]:
+    """Follow /api/orders/changes from `since` until has_more is false"""
+    changed, deleted = [], []
+    while True:
+        page = client.get("/api/orders/changes", params={"since": since} if since else {}).json()
+        changed += page["changed"]
+        deleted += page["deleted"]
+        since = page["next_since"]
+        if not page["has_more"]:
+            return changed, deleted, since
+
+
+def rename(conn, order_id: int, topic: str):
+    conn.execute(text("UPDATE orders SET topic = :topic WHERE id = :id"), {"topic": topic, "id": order_id})
+
+
+def test_changes_include_transaction_that_commits_late(client, engine):
+    first = client.post("/api/orders", json=new_order()).json()
+    second = client.post("/api/orders", json=new_order()).json()
+    _, _, since = sync_token(client)
+
+    # the first writer starts (and stamps its row) before the second, but
+    # commits after the second one was already read
+    with engine.connect() as slow, engine.connect() as fast:
+        slow.begin()
+        rename(slow, first["id"], "slow writer")
+        with fast.begin():
+            rename(fast, second["id"], "fast writer")
+        changed, _, since = sync_token(client, since)
+        # held back until the slow writer finishes, rather than passed
+        assert [order["id"] for order in changed] == []
+        slow.commit()
+
+    changed, _, since = sync_token(client, since)
+    assert sorted((order["id"], order["topic"]) for order in changed) == [
+        (first["id"], "slow writer"), (second["id"], "fast writer"),
+    ]
+    assert sync_token(client, since)[:2] == ([], [])
+
+
+def test_changes_report_deleted_orders(client, engine):
+    order = client.post("/api/orders", json=new_order()).json()
+    _, _, since = sync_token(client)
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM orders WHERE id = :id"), {"id": order["id"]})
+    changed, deleted, _ = sync_token(client, since)
+    assert (changed, deleted) == ([], [order["id"]])
+
+
+def test_list_etag_changes_when_older_writer_commits_late(client, engine):
+    first = client.post("/api/orders", json=new_order()).json()
+    second = client.post("/api/orders", json=new_order()).json()
+
+    with engine.connect() as slow, engine.connect() as fast:
+        slow.begin()
+        rename(slow, first["id"], "slow etag writer")
+        with fast.begin():
+            rename(fast, second["id"], "fast etag writer")
+        etag = client.get("/api/orders").headers["ETag"]
+        slow.commit()
+
+    # the list cache is invalidated by a notification, which can take a moment
+    deadline = time.monotonic() + 5
+    while (response := client.get("/api/orders", headers={"If-None-Match": etag})).status_code == 304:
+        assert time.monotonic() < deadline, "ETag did not change after the late commit"
+        time.sleep(0.1)
+    assert response.status_code == 200
@@ -0,0 +1,58 @@
+import json
+
+from sqlalchemy import text
+
+
+def new_order(**fields) -> dict:
+    return {"customer_name": "Test Customer", "source_lang": "en", "target_lang": "sv",
+            "word_count": 1000, "deadline_at": "2030-01-01T12:00:00", **fields}
+
+
+def stored_deadline(engine, order_id: int):
+    with engine.connect() as conn:
+        return conn.scalar(text("SELECT deadline_at FROM orders WHERE id = :id"), {"id": order_id})
+
+
+def test_create_order_with_utc_deadline(client, engine):
+    # what the web UI sends: Date.toISOString()
+    response = client.post("/api/orders", json=new_order(deadline_at="2030-01-01T12:00:00.000Z"))
+    assert response.status_code == 200, response.text
+    order = response.json()
+    assert order["deadline_at"] == "2030-01-01T12:00:00"
+    assert stored_deadline(engine, order["id"]).isoformat() == "2030-01-01T12:00:00"
+
+
+def test_create_order_with_offset_deadline(client, engine):
+    response = client.post("/api/orders", json=new_order(deadline_at="2030-01-01T14:00:00+02:00"))
+    assert response.status_code == 200, response.text
+    assert stored_deadline(engine, response.json()["id"]).isoformat() == "2030-01-01T12:00:00"
+
+
+def test_update_order_with_utc_deadline(client, engine):
+    order = client.post("/api/orders", json=new_order()).json()
+    response = client.put(f"/api/orders/{order['id']}", json={"deadline_at": "2030-02-01T08:30:00.000Z"})
+    assert response.status_code == 200, response.text
+    assert stored_deadline(engine, order["id"]).isoformat() == "2030-02-01T08:30:00"
+
+
+def test_search_deadline_filter_with_utc_bounds(client):
+    order = client.post("/api/orders", json=new_order(topic="zeppelin maintenance manual",
+                                                      deadline_at="2031-03-01T12:00:00Z")).json()
+    params = {"q": "zeppelin", "deadline_from": "2031-03-01T11:00:00.000Z", "deadline_to": "2031-03-01T15:00:00+02:00"}
+    response = client.get("/api/orders/search", params=params)
+    assert response.status_code == 200, response.text
+    assert [hit["id"] for hit in response.json()["items"]] == [order["id"]]
+    # the upper bound is 13:00 UTC, exclusive
+    response = client.get("/api/orders/search", params={**params, "deadline_to": "2031-03-01T14:00:00+02:00"})
+    assert response.json()["items"] == []
+
+
+def test_export_deadline_filter_with_utc_bounds(client):
+    order = client.post("/api/orders", json=new_order(customer_name="Export Tz Customer",
+                                                      deadline_at="2031-04-01T12:00:00Z")).json()
+    response = client.get("/api/orders/export", params={
+        "customer": "Export Tz Customer", "deadline_from": "2031-04-01T12:00:00.000Z",
+        "deadline_to": "2031-04-01T12:00:01Z",
+    })
+    assert response.status_code == 200, response.text
+    assert [json.loads(line)["id"] for line in response.text.splitlines()] == [order["id"]]
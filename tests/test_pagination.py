@@ -0,0 +1,55 @@
+from sqlalchemy import text
+
+from test_orders import new_order
+
+
+def walk(client, path: str, between_pages=None) -> list[int]:
+    """Ids from following next_cursor two rows at a time; between_pages(page_number) runs after each page"""
+    ids, cursor, page_number = [], None, 0
+    while True:
+        response = client.get(path, params={"limit": 2, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200, response.text
+        page = response.json()
+        ids += [order["id"] for order in page["items"]]
+        page_number += 1
+        if between_pages:
+            between_pages(page_number)
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return ids
+
+
+def create(client, customer: str, deadline_at: str) -> int:
+    return client.post("/api/orders", json=new_order(customer_name=customer, deadline_at=deadline_at)).json()["id"]
+
+
+def test_cursor_walk_returns_rows_with_equal_deadlines_once(client):
+    customer = "Keyset Equal Deadlines"
+    deadlines = ["2034-01-01T09:00:00"] + ["2034-01-02T09:00:00"] * 5 + ["2034-01-03T09:00:00"]
+    ids = [create(client, customer, deadline) for deadline in deadlines]
+    assert walk(client, f"/api/orders/undelivered/{customer}") == ids
+
+
+def test_row_inserted_between_pages(client):
+    customer = "Keyset Concurrent Insert"
+    ids = [create(client, customer, f"2034-02-{day:02d}T09:00:00") for day in (1, 2, 2, 3, 4)]
+    inserted = {}
+
+    def insert_once(page_number: int):
+        if page_number == 1:
+            # one row sorts past the cursor, one behind it
+            inserted["ahead"] = create(client, customer, "2034-02-02T09:00:00")
+            inserted["behind"] = create(client, customer, "2034-01-31T09:00:00")
+
+    seen = walk(client, f"/api/orders/undelivered/{customer}", insert_once)
+    assert len(seen) == len(set(seen))
+    assert seen == ids[:3] + [inserted["ahead"]] + ids[3:]
+
+
+def test_descending_walk_over_equal_timestamps(client, engine):
+    customer = "Keyset Equal Updates"
+    ids = [create(client, customer, "2034-03-01T09:00:00") for _ in range(5)]
+    with engine.begin() as conn:
+        # one statement: the trigger stamps every row with the same updated_at
+        conn.execute(text("UPDATE orders SET status = 'delivered' WHERE id = ANY(:ids)"), {"ids": ids})
+    assert walk(client, f"/api/orders/delivered/{customer}") == sorted(ids, reverse=True)
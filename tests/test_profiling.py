@@ -0,0 +1,28 @@
+import pytest
+
+from profiling import analyzable
+
+
+@pytest.mark.parametrize("statement", [
+    "SELECT orders.id, orders.customer_name FROM orders WHERE orders.status != 'delivered' LIMIT $1::INTEGER",
+    "SELECT max(orders.change_xid) AS max_1, pg_current_snapshot()::text",
+    "  select count(*) from order_reminders",
+])
+def test_plain_selects_are_analyzed(statement):
+    assert analyzable(statement)
+
+
+@pytest.mark.parametrize("statement", [
+    "SELECT pg_notify($1::VARCHAR, '') AS pg_notify_1",
+    "SELECT pg_advisory_xact_lock($1::INTEGER) AS pg_advisory_xact_lock_1",
+    "SELECT pg_try_advisory_lock(7301001)",
+    "SELECT nextval('orders_id_seq')",
+    "SELECT rebuild_order_rollups()",
+    "SELECT bot_updates.update_id FROM bot_updates WHERE bot_updates.claim_expires_at < $1 FOR UPDATE SKIP LOCKED",
+    "SELECT order_reminders.order_id FROM order_reminders FOR NO KEY UPDATE OF order_reminders",
+    "SELECT * INTO orders_copy FROM orders",
+    "UPDATE orders SET status = $1 WHERE orders.id = $2",
+    "WITH due AS (SELECT 1) UPDATE order_reminders SET claimed_by = $1",
+])
+def test_statements_with_effects_are_not_analyzed(statement):
+    assert not analyzable(statement)
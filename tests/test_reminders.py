@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from test_orders import new_order
+
+
+def make_due(engine, order_id: int, reminder_types: list[str]):
+    with engine.begin() as conn:
+        conn.execute(
+            text("UPDATE order_reminders SET fire_at = :now WHERE order_id = :id AND reminder_type = ANY(:types)"),
+            {"now": datetime.utcnow(), "id": order_id, "types": reminder_types},
+        )
+
+
+def reminder_rows(engine, order_id: int) -> dict:
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text("SELECT reminder_type, sent_at, claimed_by FROM order_reminders WHERE order_id = :id"), {"id": order_id}
+        )
+        return {row.reminder_type: row for row in rows}
+
+
+def test_ack_settles_each_reminder_type_separately(client, engine):
+    order = client.post("/api/orders", json=new_order()).json()
+    make_due(engine, order["id"], ["2h", "due"])
+
+    claimed = client.post("/api/reminders/claim", json={"worker_id": "ack-test", "limit": 1000}).json()
+    assert sorted(r["reminder_type"] for r in claimed if r["id"] == order["id"]) == ["2h", "due"]
+
+    response = client.post("/api/reminders/ack", json={
+        "worker_id": "ack-test",
+        "sent": [{"order_id": order["id"], "reminder_type": "due"}],
+        "failed": [{"order_id": order["id"], "reminder_type": "2h"}],
+    })
+    assert response.status_code == 200, response.text
+    assert response.json() == {
+        "acked": [{"order_id": order["id"], "reminder_type": "due"}],
+        "released": [{"order_id": order["id"], "reminder_type": "2h"}],
+        "stale": [],
+    }
+    rows = reminder_rows(engine, order["id"])
+    assert rows["due"].sent_at is not None
+    assert rows["2h"].sent_at is None and rows["2h"].claimed_by is None
+
+
+def test_ack_reports_unheld_reminders_as_stale(client, engine):
+    order = client.post("/api/orders", json=new_order()).json()
+    make_due(engine, order["id"], ["due"])
+    client.post("/api/reminders/claim", json={"worker_id": "stale-test", "limit": 1000})
+
+    # the 6h reminder was never claimed, so this worker holds no lease on it
+    response = client.post("/api/reminders/ack", json={
+        "worker_id": "stale-test",
+        "sent": [{"order_id": order["id"], "reminder_type": "6h"}],
+    })
+    assert response.json()["stale"] == [{"order_id": order["id"], "reminder_type": "6h"}]
+    rows = reminder_rows(engine, order["id"])
+    assert rows["6h"].sent_at is None
+    assert rows["due"].sent_at is None and rows["due"].claimed_by == "stale-test"
+
+
+def test_reminders_past_their_window_are_not_scheduled(client, engine):
+    deadline = datetime.utcnow() + timedelta(hours=1)
+    order = client.post("/api/orders", json=new_order(deadline_at=deadline.isoformat())).json()
+    # 24h, 6h and 2h before the deadline are more than REMINDER_WINDOW ago
+    assert sorted(reminder_rows(engine, order["id"])) == ["due"]
+
+
+def test_moving_deadline_closer_drops_reminders_now_past(client, engine):
+    order = client.post("/api/orders", json=new_order()).json()
+    assert sorted(reminder_rows(engine, order["id"])) == ["24h", "2h", "6h", "due"]
+
+    # the 2h reminder fired 5 minutes ago: still within its window
+    deadline = datetime.utcnow() + timedelta(hours=1, minutes=55)
+    client.put(f"/api/orders/{order['id']}", json={"deadline_at": deadline.isoformat()})
+    assert sorted(reminder_rows(engine, order["id"])) == ["2h", "due"]
@@ -0,0 +1,88 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from api_client import Order
+from scheduler import REMINDER_OFFSETS, DeadlineScheduler
+
+# far enough ahead that no reminder is past its grace period
+DEADLINE = datetime.utcnow().replace(microsecond=0) + timedelta(days=3)
+
+
+def order(order_id: int, deadline_at: datetime = DEADLINE, status: str = "pending") -> Order:
+    return Order(id=order_id, customer_name="Acme", source_lang="en", target_lang="sv", deadline_at=deadline_at,
+                 status=status, created_at=DEADLINE, updated_at=DEADLINE)
+
+
+async def ignore(timers):
+    pass
+
+
+def test_reminders_fire_at_their_offsets():
+    scheduler = DeadlineScheduler(ignore)
+    scheduler.schedule_order(order(1))
+    assert scheduler._pop_due(DEADLINE - timedelta(hours=7)) == [(DEADLINE - timedelta(hours=24), 1, "24h")]
+    assert scheduler._pop_due(DEADLINE) == [
+        (DEADLINE - timedelta(hours=6), 1, "6h"), (DEADLINE - timedelta(hours=2), 1, "2h"), (DEADLINE, 1, "due"),
+    ]
+    assert scheduler._pop_due(DEADLINE + timedelta(days=1)) == []
+
+
+def test_rescheduled_order_fires_only_its_new_timers():
+    scheduler = DeadlineScheduler(ignore)
+    scheduler.schedule_order(order(1))
+    later = DEADLINE + timedelta(days=2)
+    scheduler.schedule_order(order(1, later))
+    assert len(scheduler) == 1
+    # the old deadline passes without a reminder
+    assert scheduler._pop_due(DEADLINE) == []
+    assert [timer[2] for timer in scheduler._pop_due(later)] == list(REMINDER_OFFSETS)
+
+
+def test_closed_or_removed_orders_do_not_fire():
+    scheduler = DeadlineScheduler(ignore)
+    for order_id in (1, 2, 3):
+        scheduler.schedule_order(order(order_id))
+    scheduler.schedule_order(order(1, status="delivered"))
+    scheduler.schedule_order(order(2, status="cancelled"))
+    scheduler.remove_order(3)
+    assert len(scheduler) == 0
+    assert scheduler._pop_due(DEADLINE) == []
+    assert scheduler._seconds_until_next(DEADLINE - timedelta(days=4)) is None
+
+
+def test_timers_with_the_same_time_fire_together_in_order_id_order():
+    scheduler = DeadlineScheduler(ignore, offsets={"due": timedelta(0)})
+    for order_id in (3, 1, 2):
+        scheduler.schedule_order(order(order_id))
+    scheduler.schedule_order(order(4, DEADLINE + timedelta(seconds=1)))
+    assert scheduler._seconds_until_next(DEADLINE - timedelta(seconds=10)) == 10
+    assert scheduler._pop_due(DEADLINE) == [(DEADLINE, 1, "due"), (DEADLINE, 2, "due"), (DEADLINE, 3, "due")]
+    assert scheduler._pop_due(DEADLINE + timedelta(seconds=1)) == [(DEADLINE + timedelta(seconds=1), 4, "due")]
+
+
+def test_reminders_already_past_their_grace_are_not_scheduled():
+    scheduler = DeadlineScheduler(ignore)
+    scheduler.schedule_order(order(1, datetime.utcnow() + timedelta(hours=1)))
+    assert [timer[2] for timer in scheduler._pop_due(DEADLINE)] == ["due"]
+
+
+def test_run_wakes_for_the_due_timer_but_not_a_superseded_one():
+    async def run():
+        fired = []
+
+        async def on_due(timers):
+            fired.extend(timers)
+
+        scheduler = DeadlineScheduler(on_due, offsets={"due": timedelta(0)})
+        task = asyncio.create_task(scheduler.run())
+        soon = datetime.utcnow() + timedelta(milliseconds=200)
+        scheduler.schedule_order(order(1, soon))
+        scheduler.schedule_order(order(2, soon))
+        # moved out of the way while its first timer is already in the heap
+        scheduler.schedule_order(order(2, soon + timedelta(hours=1)))
+        await asyncio.sleep(0.6)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return fired
+
+    assert [(order_id, reminder_type) for _, order_id, reminder_type in asyncio.run(run())] == [(1, "due")]
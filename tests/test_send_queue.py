@@ -0,0 +1,140 @@
+import asyncio
+
+import httpx
+from telegram.error import Forbidden, NetworkError, RetryAfter, TimedOut
+
+from send_queue import SEND_ATTEMPTS, SendQueue, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeBot:
+    """Records sends; fails the first ones with the errors it was given"""
+
+    def __init__(self, *errors: Exception):
+        self.errors = list(errors)
+        self.sent: list[tuple[int, str]] = []
+
+    async def send_message(self, chat_id: int, text: str):
+        self.sent.append((chat_id, text))
+        if self.errors:
+            raise self.errors.pop(0)
+
+
+def timed_out(cause: Exception) -> TimedOut:
+    try:
+        raise TimedOut() from cause
+    except TimedOut as e:
+        return e
+
+
+def test_token_bucket_refills_at_its_rate():
+    bucket = TokenBucket(2, now=0)
+    assert bucket.wait_time(0) == 0
+    bucket.take(0)
+    assert bucket.wait_time(0) == 0.5
+    assert bucket.wait_time(0.25) == 0.25
+    assert bucket.wait_time(0.5) == 0
+    # never more than capacity, however long it was idle
+    assert bucket.full(100) and bucket.tokens == 1
+
+
+def test_most_urgent_message_of_a_chat_that_may_send_goes_first():
+    async def run():
+        clock = FakeClock()
+        queue = SendQueue(rate=100, chat_rate=1, clock=clock)
+        queue.send(1, "24h for chat 1", priority=3)
+        queue.send(2, "6h for chat 2", priority=1)
+        queue.send(3, "due for chat 3", priority=0)
+        queue.send(3, "2h for chat 3", priority=0)
+        message, _ = queue._next(clock())
+        assert message.text == "due for chat 3"
+        # equal priority: the older one
+        queue._chats[3].pop(0)
+        assert queue._next(clock())[0].text == "2h for chat 3"
+        # chat 3 is sending and chat 2 just sent: chat 1 may go
+        queue._busy.add(3)
+        queue._bucket(2).take(clock())
+        assert queue._next(clock())[0].text == "24h for chat 1"
+        # nothing may go: the wait is until chat 2's bucket refills
+        queue._bucket(1).take(clock())
+        clock.now += 0.25
+        assert queue._next(clock()) == (None, 0.75)
+        await queue.stop()
+
+    asyncio.run(run())
+
+
+def test_chat_messages_go_out_by_priority_then_age():
+    async def run():
+        bot = FakeBot()
+        queue = SendQueue(rate=1000, chat_rate=1000)
+        done = [queue.send(7, text, priority) for text, priority in [("24h", 3), ("due a", 0), ("2h", 2), ("due b", 0)]]
+        queue.start(bot)
+        assert await asyncio.wait_for(asyncio.gather(*done), 5) == [True] * 4
+        await queue.stop()
+        return [text for _, text in bot.sent]
+
+    assert asyncio.run(run()) == ["due a", "due b", "2h", "24h"]
+
+
+def deliver(bot: FakeBot, clock: FakeClock | None = None) -> tuple[SendQueue, asyncio.Future | None]:
+    """Hand one message to _deliver; the queue and the message's future if it was settled"""
+    async def run():
+        queue = SendQueue(clock=clock or FakeClock())
+        queue._bot = bot
+        done = queue.send(5, "reminder")
+        message = queue._chats.pop(5)[0]
+        await queue._in_flight.acquire()
+        await queue._deliver(message)
+        return queue, done.result() if done.done() else None
+
+    return asyncio.run(run())
+
+
+def test_retry_after_pauses_every_send_and_requeues():
+    clock = FakeClock()
+    queue, result = deliver(FakeBot(RetryAfter(30)), clock)
+    assert result is None
+    assert queue.pending() == 1 and queue.throttled == 1
+    assert queue._paused_until == clock.now + 30
+
+
+def test_network_errors_are_retried_then_failed():
+    queue, result = deliver(FakeBot(NetworkError("reset")))
+    assert result is None and queue._chats[5][0].attempts == 1
+
+    async def run():
+        bot = FakeBot(*[NetworkError("reset")] * SEND_ATTEMPTS)
+        queue = SendQueue(rate=1000, chat_rate=1000)
+        done = queue.send(5, "reminder")
+        queue.start(bot)
+        result = await asyncio.wait_for(done, 5)
+        await queue.stop()
+        return result, len(bot.sent)
+
+    assert asyncio.run(run()) == (False, SEND_ATTEMPTS)
+
+
+def test_rejected_chat_fails_at_once():
+    queue, result = deliver(FakeBot(Forbidden("bot was blocked by the user")))
+    assert result is False and queue.pending() == 0
+
+
+def test_timeout_after_sending_counts_as_sent():
+    bot = FakeBot(timed_out(httpx.ReadTimeout("read")))
+    queue, result = deliver(bot)
+    assert result is True and queue.pending() == 0
+    assert len(bot.sent) == 1
+
+
+def test_timeout_before_sending_is_retried():
+    for cause in (httpx.ConnectTimeout("connect"), httpx.PoolTimeout("pool")):
+        queue, result = deliver(FakeBot(timed_out(cause)))
+        assert result is None and queue.pending() == 1
@@ -0,0 +1,194 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy import text
+from telegram.ext import Application, CommandHandler
+from telegram.request import BaseRequest
+
+import webhook
+from api_client import ApiClient
+from bot import help_command, start
+from conftest import WEBHOOK_SECRET
+
+
+class FakeTelegram(BaseRequest):
+    """Answers Bot API calls without Telegram and records them"""
+
+    def __init__(self):
+        self.calls: list[tuple[str, dict]] = []
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, **timeouts):
+        name = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+        self.calls.append((name, params))
+        if name == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "TM-Order", "username": "tmorder_test_bot"}
+        elif name == "sendMessage":
+            result = {"message_id": len(self.calls), "date": int(time.time()),
+                      "chat": {"id": int(params["chat_id"]), "type": "private"}, "text": params["text"]}
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+    def messages(self, chat_id: int) -> list[str]:
+        return [params["text"] for name, params in self.calls if name == "sendMessage" and int(params["chat_id"]) == chat_id]
+
+
+def command_update(update_id: int, chat_id: int, command: str) -> dict:
+    return {"update_id": update_id, "message": {
+        "message_id": update_id, "date": int(time.time()), "text": command,
+        "chat": {"id": chat_id, "type": "private"},
+        "from": {"id": chat_id, "is_bot": False, "first_name": "Test"},
+        "entities": [{"type": "bot_command", "offset": 0, "length": len(command)}],
+    }}
+
+
+def queued(engine, update_ids: list[int]) -> dict:
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text("SELECT update_id, claimed_by, attempts FROM bot_updates WHERE update_id = ANY(:ids)"), {"ids": update_ids}
+        )
+        return {row.update_id: row for row in rows}
+
+
+@pytest.fixture
+def telegram():
+    return FakeTelegram()
+
+
+@pytest.fixture
+def serve(api_url, telegram, monkeypatch):
+    """serve(done) runs webhook.serve_updates with the bot's handlers until done() or a timeout"""
+    # a short long-poll, so an expired lease is noticed quickly
+    monkeypatch.setattr(webhook, "CLAIM_WAIT_SECONDS", 1)
+
+    async def run(done, worker_id: str, timeout: float):
+        application = (
+            Application.builder().token("1:test").concurrent_updates(True)
+            .request(telegram).get_updates_request(FakeTelegram()).updater(None).build()
+        )
+        application.add_handler(CommandHandler("start", start))
+        application.add_handler(CommandHandler("help", help_command))
+        monkeypatch.setattr(webhook, "api", ApiClient(base_url=api_url, backoff=0))
+        async with application:
+            serving = asyncio.create_task(webhook.serve_updates(application, worker_id))
+            try:
+                deadline = time.monotonic() + timeout
+                while not done() and time.monotonic() < deadline:
+                    await asyncio.sleep(0.05)
+            finally:
+                serving.cancel()
+                await asyncio.gather(serving, return_exceptions=True)
+                await webhook.api.close()
+        # the API finishes a claim long-poll even after the worker hung up; let it
+        # run out so it cannot lease the next test's updates to a stopped worker
+        await asyncio.sleep(webhook.CLAIM_WAIT_SECONDS + 0.5)
+
+    return lambda done, worker_id="test-worker", timeout=15: asyncio.run(run(done, worker_id, timeout))
+
+
+def post_update(client, update: dict):
+    response = client.post("/bot/webhook", json=update, headers={"X-Telegram-Bot-Api-Secret-Token": WEBHOOK_SECRET})
+    assert response.status_code == 200, response.text
+
+
+def test_webhook_update_is_handled_and_acked(client, engine, telegram, serve):
+    chat_id = 4201
+    post_update(client, command_update(9_001, chat_id, "/start"))
+    post_update(client, command_update(9_002, chat_id, "/help"))
+    assert sorted(queued(engine, [9_001, 9_002])) == [9_001, 9_002]
+
+    serve(lambda: len(telegram.messages(chat_id)) == 2 and not queued(engine, [9_001, 9_002]))
+
+    # one chat's updates are handled in the order Telegram sent them
+    replies = telegram.messages(chat_id)
+    assert replies[0].startswith("Welcome to TM-Order")
+    assert replies[1].startswith("📋 **TM-Order Help**")
+    # acked updates leave the queue
+    assert queued(engine, [9_001, 9_002]) == {}
+
+
+def test_update_of_dead_worker_is_redelivered_after_lease_expiry(client, engine, telegram, serve):
+    chat_id = 4301
+    post_update(client, command_update(9_101, chat_id, "/start"))
+
+    claim = {"worker_id": "dead-worker", "limit": 10, "lease_seconds": 10}
+    claimed = client.post("/api/bot/updates/claim", json=claim).json()
+    assert [update["update_id"] for update in claimed] == [9_101]
+    # while the lease runs, nobody else gets the update
+    assert client.post("/api/bot/updates/claim", json={**claim, "worker_id": "other-worker"}).json() == []
+
+    # the worker dies without acking; let its lease run out
+    with engine.begin() as conn:
+        conn.execute(text(
+            "UPDATE bot_updates SET claim_expires_at = (now() AT TIME ZONE 'utc') - interval '1 second' WHERE update_id = 9101"
+        ))
+
+    serve(lambda: telegram.messages(chat_id) and not queued(engine, [9_101]), worker_id="live-worker")
+
+    assert len(telegram.messages(chat_id)) == 1
+    assert queued(engine, [9_101]) == {}
+    # a late ack from the dead worker settles nothing
+    ack = client.post("/api/bot/updates/ack", json={"worker_id": "dead-worker", "processed": [9_101]}).json()
+    assert ack == {"processed": [], "released": [], "stale": [9_101]}
+
+
+def waiting_count(engine) -> tuple[int, int]:
+    """(the counter the webhook checks, the rows actually waiting)"""
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT (SELECT waiting FROM bot_update_count), (SELECT count(*) FROM bot_updates)")).one()
+
+
+def test_webhook_answers_503_when_queue_is_full(client, engine, api_env):
+    counted, rows = waiting_count(engine)
+    assert counted == rows
+    post_update(client, command_update(9_201, 4401, "/start"))
+    # a redelivery is stored, and counted, once
+    post_update(client, command_update(9_201, 4401, "/start"))
+    assert waiting_count(engine) == (rows + 1, rows + 1)
+
+    limit = int(api_env.get("BOT_UPDATE_QUEUE_SIZE", "1000"))
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE bot_update_count SET waiting = :limit"), {"limit": limit})
+    try:
+        response = client.post("/bot/webhook", json=command_update(9_202, 4401, "/help"),
+                               headers={"X-Telegram-Bot-Api-Secret-Token": WEBHOOK_SECRET})
+        assert response.status_code == 503
+        assert not queued(engine, [9_202])
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text("UPDATE bot_update_count SET waiting = (SELECT count(*) FROM bot_updates)"))
+
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM bot_updates WHERE update_id = 9201"))
+    assert waiting_count(engine) == (rows, rows)
+
+
+def test_concurrent_deliveries_stay_within_the_bound(client, engine, api_env):
+    # fill the queue to one below its bound, then deliver many at once
+    counted, _ = waiting_count(engine)
+    limit = int(api_env.get("BOT_UPDATE_QUEUE_SIZE", "1000"))
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE bot_update_count SET waiting = waiting + :fill"), {"fill": limit - 1 - counted})
+
+    def deliver(update_id: int) -> int:
+        return client.post("/bot/webhook", json=command_update(update_id, 4500 + update_id, "/start"),
+                           headers={"X-Telegram-Bot-Api-Secret-Token": WEBHOOK_SECRET}).status_code
+
+    try:
+        with ThreadPoolExecutor(8) as pool:
+            statuses = list(pool.map(deliver, range(9_301, 9_317)))
+        assert sorted(statuses) == [200] + [503] * 15
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text("DELETE FROM bot_updates WHERE update_id BETWEEN 9301 AND 9316"))
+            conn.execute(text("UPDATE bot_update_count SET waiting = (SELECT count(*) FROM bot_updates)"))